@@ -8,9 +8,9 @@ __version__ = "0.1.0"
 
 from gymnasium.envs.registration import register
 
-from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
-
+# The entry point is a string so that importing the package does not import the gym
+# and its heavy dependencies (playwright, cv2, pytesseract)
 register(
     id="lotr2-rl/LordsOfTheRealm2-v0",
-    entry_point=LordsOfTheRealm2Gym,
+    entry_point="lotr2_rl.gyms.lotr2_gym:LordsOfTheRealm2Gym",
 )
\ No newline at end of file
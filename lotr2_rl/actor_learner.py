@@ -0,0 +1,592 @@
+"""
+Actor-learner training (IMPALA) on one host.
+
+Actor processes each run one env with a copy of the policy, synced from the learner weights
+whenever a new version is published, and stream fixed-length unrolls to a queue. The learner
+consumes batches of unrolls and corrects for the lag of the actor policies with V-trace, so
+collection (browser bound) and optimization (CPU bound) overlap instead of alternating as in PPO.
+
+Unrolls only hold the raw frames, the frame stacks are rebuilt by the learner (see stack_frames),
+and go through torch.multiprocessing queues, which move tensors through shared memory.
+
+    python -m lotr2_rl.actor_learner --config configs/lotr2.yaml --n-actors 8
+
+Checkpoints are saved every `--checkpoint-freq` steps, `--resume` continues from the latest one.
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+import torch
+import torch.multiprocessing as torch_mp
+from stable_baselines3.common.policies import ActorCriticCnnPolicy, ActorCriticPolicy
+
+from lotr2_rl.checkpoints import CheckpointManager
+from lotr2_rl.folder_web_server import FolderWebServer
+from lotr2_rl.train import DEFAULT_CONFIG, DEFAULT_ENV_ID, load_hyperparams, make_env
+
+logger = logging.getLogger(__name__)
+
+POLICIES = {"CnnPolicy": ActorCriticCnnPolicy, "MlpPolicy": ActorCriticPolicy}
+
+
+def stack_frames(frames: torch.Tensor, starts: torch.Tensor, n_stack: int) -> torch.Tensor:
+    """
+    Build the frame stacks of a sequence of frames, like VecFrameStack: the stack of a frame holds
+    it and the n_stack - 1 frames before it, oldest first, frames of a previous episode being zeroed.
+
+    Args:
+        frames: (L, H, W, C) uint8 frames
+        starts: (L,) bool, whether each frame is the first of an episode
+        n_stack: Number of frames of a stack
+
+    Returns:
+        The (L - n_stack + 1, n_stack * C, H, W) stacks of the frames n_stack - 1 to L - 1
+    """
+    length = frames.shape[0]
+    positions = torch.arange(n_stack - 1, length)
+    # Index of the first frame of the episode of each frame
+    episode_starts = torch.cummax(torch.where(starts, torch.arange(length), 0), dim=0).values[positions]
+    stacked = []
+    for k in range(n_stack - 1, -1, -1):
+        source = positions - k
+        valid = (source >= episode_starts).to(frames.dtype)
+        stacked.append(frames[source] * valid[:, None, None, None])
+    return torch.cat(stacked, dim=-1).permute(0, 3, 1, 2)
+
+
+def get_stacked_observation_space(observation_space: gym.spaces.Box, n_stack: int) -> gym.spaces.Box:
+    """ Channels first space of the stacks built by stack_frames. """
+    height, width, channels = observation_space.shape
+    return gym.spaces.Box(0, 255, shape=(n_stack * channels, height, width), dtype=np.uint8)
+
+
+def vtrace(
+    behaviour_log_probs: torch.Tensor,
+    target_log_probs: torch.Tensor,
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    bootstrap_values: torch.Tensor,
+    terminated: torch.Tensor,
+    truncated: torch.Tensor,
+    final_values: torch.Tensor,
+    gamma: float,
+    rho_bar: float = 1.0,
+    c_bar: float = 1.0,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    V-trace targets of the value function and advantages of the policy gradient (Espeholt et al., 2018).
+
+    The traces stop at the end of each episode. A terminated episode has no future value, while a
+    truncated one (time limit, browser failure) bootstraps from the value of its final observation,
+    like SB3 does with `TimeLimit.truncated`.
+
+    Args:
+        behaviour_log_probs: (T, B) log probabilities of the actions under the actor policies
+        target_log_probs: (T, B) log probabilities of the actions under the learner policy
+        rewards: (T, B) rewards
+        values: (T, B) values of the observations under the learner policy
+        bootstrap_values: (B,) values of the observations following the last step
+        terminated: (T, B) whether the episode terminated at each step
+        truncated: (T, B) whether the episode was truncated at each step
+        final_values: (T, B) values of the final observations of the truncated episodes, ignored elsewhere
+        gamma: Discount factor
+        rho_bar: Truncation of the importance weights of the targets and advantages
+        c_bar: Truncation of the importance weights of the traces
+
+    Returns:
+        The value targets and policy gradient advantages, both (T, B)
+    """
+    with torch.no_grad():
+        rhos = torch.exp(target_log_probs - behaviour_log_probs)
+        clipped_rhos = torch.clamp(rhos, max=rho_bar)
+        cs = torch.clamp(rhos, max=c_bar)
+        truncated = truncated & ~terminated
+        discounts = gamma * (1.0 - terminated.float())
+        # The observation following a truncated step is the first of the next episode
+        trace_discounts = discounts * (1.0 - truncated.float())
+
+        next_values = torch.cat([values[1:], bootstrap_values[None]], dim=0)
+        next_values = torch.where(truncated, final_values, next_values)
+        deltas = clipped_rhos * (rewards + discounts * next_values - values)
+
+        accumulator = torch.zeros_like(bootstrap_values)
+        corrections = []
+        for t in range(values.shape[0] - 1, -1, -1):
+            accumulator = deltas[t] + trace_discounts[t] * cs[t] * accumulator
+            corrections.append(accumulator)
+        targets = torch.stack(corrections[::-1]) + values
+
+        next_targets = torch.cat([targets[1:], bootstrap_values[None]], dim=0)
+        next_targets = torch.where(truncated, final_values, next_targets)
+        advantages = clipped_rhos * (rewards + discounts * next_targets - values)
+    return targets, advantages
+
+
+def _make_policy(policy: str, observation_space: gym.spaces.Box, action_space: gym.spaces.Space,
+                 learning_rate: float) -> ActorCriticPolicy:
+    return POLICIES[policy](observation_space, action_space, lambda _: learning_rate)
+
+
+def _actor_loop(
+    actor_id: int,
+    env_id: str,
+    env_kwargs: dict,
+    policy: str,
+    n_stack: int,
+    unroll_length: int,
+    shared_weights: Dict[str, torch.Tensor],
+    weights_version,
+    weights_lock,
+    unrolls: "mp.Queue",
+    stop,
+) -> None:
+    """
+    Run one env and put its unrolls on the queue until stop is set.
+    The final observation of a truncated episode is replaced by the reset, so its value, needed to
+    bootstrap the truncated step, is computed here with the actor copy of the policy.
+    """
+    # The actors share the cores with each other and the learner
+    torch.set_num_threads(1)
+    env = make_env(env_id, **env_kwargs)
+    model = _make_policy(policy, get_stacked_observation_space(env.observation_space, n_stack), env.action_space, 0.0)
+    model.set_training_mode(False)
+    version = -1
+
+    observation, _ = env.reset()
+    frame_shape = observation.shape
+    # The n_stack - 1 frames before the current one, kept between unrolls
+    history = deque([np.zeros(frame_shape, dtype=np.uint8)] * (n_stack - 1), maxlen=max(n_stack - 1, 1))
+    history_starts = deque([False] * (n_stack - 1), maxlen=max(n_stack - 1, 1))
+    start = True
+    episode_return = 0.0
+
+    try:
+        while not stop.is_set():
+            if weights_version.value != version:
+                with weights_lock:
+                    model.load_state_dict(shared_weights)
+                    version = weights_version.value
+
+            frames = list(history)[:n_stack - 1] + [observation]
+            starts = list(history_starts)[:n_stack - 1] + [start]
+            actions, rewards, log_probs = [], [], []
+            terminations, truncations, final_values = [], [], []
+            episode_returns = []
+            for _ in range(unroll_length):
+                stacked = stack_frames(torch.from_numpy(np.stack(frames[-n_stack:])),
+                                       torch.tensor(starts[-n_stack:]), n_stack)
+                with torch.no_grad():
+                    distribution = model.get_distribution(stacked)
+                    action = distribution.get_actions()
+                    log_prob = distribution.log_prob(action)
+                action = action[0].numpy()
+
+                observation, reward, terminated, truncated, _ = env.step(action)
+                done = terminated or truncated
+                final_value = 0.0
+                if truncated and not terminated:
+                    history_length = len(frames) - n_stack + 1
+                    final_stack = stack_frames(torch.from_numpy(np.stack(frames[history_length:] + [observation])),
+                                               torch.tensor(starts[history_length:] + [False]), n_stack)
+                    with torch.no_grad():
+                        final_value = model.predict_values(final_stack).item()
+                episode_return += reward
+                if done:
+                    episode_returns.append(episode_return)
+                    episode_return = 0.0
+                    observation, _ = env.reset()
+
+                frames.append(observation)
+                starts.append(done)
+                actions.append(action)
+                rewards.append(reward)
+                terminations.append(terminated)
+                truncations.append(truncated)
+                final_values.append(final_value)
+                log_probs.append(log_prob[0])
+
+            unrolls.put({
+                "actor_id": actor_id,
+                "policy_version": version,
+                "frames": torch.from_numpy(np.stack(frames)),
+                "starts": torch.tensor(starts),
+                "actions": torch.from_numpy(np.stack(actions)),
+                "rewards": torch.tensor(rewards, dtype=torch.float32),
+                "terminated": torch.tensor(terminations),
+                "truncated": torch.tensor(truncations),
+                "final_values": torch.tensor(final_values, dtype=torch.float32),
+                "behaviour_log_probs": torch.stack(log_probs),
+                "episode_returns": episode_returns,
+            })
+
+            # The last frames of this unroll are the history of the next one
+            for frame, frame_start in zip(frames[-n_stack:-1], starts[-n_stack:-1]):
+                history.append(frame)
+                history_starts.append(frame_start)
+            start = starts[-1]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+
+
+class ActorLearner:
+    """
+    IMPALA trainer: actor processes collecting unrolls with a lagging copy of the policy,
+    and a learner (this process) updating the policy from them with V-trace.
+    """
+    def __init__(
+        self,
+        n_actors: int,
+        env_id: str = DEFAULT_ENV_ID,
+        env_kwargs: Optional[dict] = None,
+        policy: str = "CnnPolicy",
+        frame_stack: int = 1,
+        unroll_length: int = 20,
+        batch_size: int = 4,
+        learning_rate=2.5e-4,
+        gamma: float = 0.99,
+        ent_coef: float = 0.01,
+        vf_coef: float = 0.5,
+        max_grad_norm: float = 40.0,
+        rho_bar: float = 1.0,
+        c_bar: float = 1.0,
+        queue_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            n_actors: Number of actor processes, each running one env
+            env_id: Id of the env
+            env_kwargs: Keyword arguments of each env
+            policy: "CnnPolicy" or "MlpPolicy"
+            frame_stack: Number of consecutive observations stacked along the channels
+            unroll_length: Number of steps of an unroll
+            batch_size: Number of unrolls of an update
+            learning_rate: Learning rate, or schedule of the remaining progress like in SB3
+            gamma: Discount factor
+            ent_coef: Weight of the entropy bonus
+            vf_coef: Weight of the value loss
+            max_grad_norm: Maximum norm of the gradients
+            rho_bar: V-trace truncation of the importance weights
+            c_bar: V-trace truncation of the traces
+            queue_size: Maximum number of unrolls waiting for the learner, 2 per actor by default
+        """
+        self.n_actors = n_actors
+        self.env_id = env_id
+        self.env_kwargs = env_kwargs or {}
+        self.policy_name = policy
+        self.frame_stack = frame_stack
+        self.unroll_length = unroll_length
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+        self.ent_coef = ent_coef
+        self.vf_coef = vf_coef
+        self.max_grad_norm = max_grad_norm
+        self.rho_bar = rho_bar
+        self.c_bar = c_bar
+        self.queue_size = queue_size or 2 * n_actors
+
+        # The spaces are read from an env built in this process, which acquires no resource before reset
+        env = make_env(env_id, **self.env_kwargs)
+        self.observation_space = get_stacked_observation_space(env.observation_space, frame_stack)
+        self.action_space = env.action_space
+        env.close()
+
+        self.policy = _make_policy(policy, self.observation_space, self.action_space, self._get_learning_rate(1.0))
+        self.num_timesteps = 0
+        self.num_updates = 0
+        self.episode_returns = deque(maxlen=100)
+
+        self._ctx = torch_mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+        self._shared_weights = None
+        self._weights_version = None
+        self._weights_lock = None
+        self._unrolls = None
+        self._stop = None
+        self._actors = []
+
+    def _get_learning_rate(self, progress_remaining: float) -> float:
+        if callable(self.learning_rate):
+            return self.learning_rate(progress_remaining)
+        return self.learning_rate
+
+    def learn(self, total_timesteps: int, log_interval_s: float = 30.0,
+              checkpoints: Optional[CheckpointManager] = None, checkpoint_freq: int = 100_000) -> "ActorLearner":
+        """
+        Train until the actors collected total_timesteps steps, counting those of a loaded checkpoint.
+
+        Args:
+            total_timesteps: Number of env steps, summed over the actors
+            log_interval_s: Seconds between two throughput logs
+            checkpoints: Where checkpoints are saved every checkpoint_freq steps and at the end, None to disable them
+            checkpoint_freq: Number of steps between two checkpoints
+
+        Returns:
+            This trainer
+        """
+        self._start_actors()
+        start_time = last_log_time = time.perf_counter()
+        last_log_timesteps = last_checkpoint_timesteps = self.num_timesteps
+        try:
+            while self.num_timesteps < total_timesteps:
+                batch = [self._get_unroll() for _ in range(self.batch_size)]
+                progress_remaining = max(0.0, 1.0 - self.num_timesteps / total_timesteps)
+                stats = self._update(batch, progress_remaining)
+                self._publish_weights()
+
+                now = time.perf_counter()
+                if now - last_log_time >= log_interval_s:
+                    steps_per_sec = (self.num_timesteps - last_log_timesteps) / (now - last_log_time)
+                    mean_return = np.mean(self.episode_returns) if self.episode_returns else float("nan")
+                    logger.info(
+                        f"{self.num_timesteps} steps, {steps_per_sec:.1f} steps/s, {self.num_updates} updates, "
+                        f"policy lag {stats['policy_lag']:.1f}, queue {self._unrolls.qsize()}/{self.queue_size}, "
+                        f"mean return {mean_return:.1f}, loss {stats['loss']:.3f}"
+                    )
+                    last_log_time, last_log_timesteps = now, self.num_timesteps
+
+                if checkpoints and self.num_timesteps - last_checkpoint_timesteps >= checkpoint_freq:
+                    checkpoints.save(self.num_timesteps, self.save_checkpoint)
+                    last_checkpoint_timesteps = self.num_timesteps
+            if checkpoints and self.num_timesteps > last_checkpoint_timesteps:
+                checkpoints.save(self.num_timesteps, self.save_checkpoint)
+            logger.info(f"Trained {self.num_timesteps} steps in {time.perf_counter() - start_time:.0f}s")
+        finally:
+            self._stop_actors()
+        return self
+
+    def save(self, path: str) -> None:
+        """ Save the policy, loadable with `ActorCriticCnnPolicy.load` (or `ActorCriticPolicy.load`). """
+        self.policy.save(path)
+
+    def save_checkpoint(self, f: BinaryIO) -> None:
+        """ Save the weights, the optimizer state and the progress of the training to an open file. """
+        torch.save({
+            "policy": self.policy.state_dict(),
+            "optimizer": self.policy.optimizer.state_dict(),
+            "num_timesteps": self.num_timesteps,
+            "num_updates": self.num_updates,
+            "episode_returns": list(self.episode_returns),
+        }, f)
+
+    def load_checkpoint(self, path: Path) -> None:
+        """ Restore a checkpoint saved by save_checkpoint, the learning rate schedule resumes from its timesteps. """
+        checkpoint = torch.load(path, map_location="cpu")
+        self.policy.load_state_dict(checkpoint["policy"])
+        self.policy.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.num_timesteps = checkpoint["num_timesteps"]
+        self.num_updates = checkpoint["num_updates"]
+        self.episode_returns.extend(checkpoint["episode_returns"])
+
+    def _start_actors(self) -> None:
+        self._shared_weights = {key: value.detach().clone().share_memory_()
+                                for key, value in self.policy.state_dict().items()}
+        self._weights_version = self._ctx.Value("i", 0)
+        self._weights_lock = self._ctx.Lock()
+        self._unrolls = self._ctx.Queue(maxsize=self.queue_size)
+        self._stop = self._ctx.Event()
+        for actor_id in range(self.n_actors):
+            actor = self._ctx.Process(
+                target=_actor_loop,
+                args=(actor_id, self.env_id, self.env_kwargs, self.policy_name, self.frame_stack, self.unroll_length,
+                      self._shared_weights, self._weights_version, self._weights_lock, self._unrolls, self._stop),
+                name=f"lotr2_actor_{actor_id}",
+                daemon=True,
+            )
+            actor.start()
+            self._actors.append(actor)
+
+    def _stop_actors(self) -> None:
+        if self._stop is None:
+            return
+        self._stop.set()
+        deadline = time.monotonic() + 30.0
+        while any(actor.is_alive() for actor in self._actors) and time.monotonic() < deadline:
+            # Actors blocked on a full queue need room to finish their unroll. The tensors of the unrolls
+            # of actors that already exited cannot be received anymore
+            try:
+                self._unrolls.get(timeout=0.1)
+            except (queue.Empty, OSError):
+                pass
+        for actor in self._actors:
+            if actor.is_alive():
+                logger.warning(f"Actor {actor.name} did not stop, terminating it")
+                actor.terminate()
+            actor.join()
+        self._actors = []
+        self._stop = None
+
+    def _get_unroll(self) -> dict:
+        while True:
+            try:
+                unroll = self._unrolls.get(timeout=10.0)
+                break
+            except queue.Empty:
+                dead = [actor.name for actor in self._actors if not actor.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Actors died: {', '.join(dead)}")
+        self.num_timesteps += self.unroll_length
+        self.episode_returns.extend(unroll["episode_returns"])
+        return unroll
+
+    def _publish_weights(self) -> None:
+        with self._weights_lock:
+            for key, value in self.policy.state_dict().items():
+                self._shared_weights[key].copy_(value)
+            self._weights_version.value += 1
+
+    def _update(self, batch: List[dict], progress_remaining: float) -> Dict[str, float]:
+        steps, n_unrolls = self.unroll_length, len(batch)
+        # (B, T + 1, C, H, W) stacks, time major after the forward pass
+        observations = torch.stack([stack_frames(unroll["frames"], unroll["starts"], self.frame_stack)
+                                    for unroll in batch])
+        actions = torch.stack([unroll["actions"] for unroll in batch]).transpose(0, 1)
+        rewards = torch.stack([unroll["rewards"] for unroll in batch]).transpose(0, 1)
+        terminated = torch.stack([unroll["terminated"] for unroll in batch]).transpose(0, 1)
+        truncated = torch.stack([unroll["truncated"] for unroll in batch]).transpose(0, 1)
+        final_values = torch.stack([unroll["final_values"] for unroll in batch]).transpose(0, 1)
+        behaviour_log_probs = torch.stack([unroll["behaviour_log_probs"] for unroll in batch]).transpose(0, 1)
+
+        self.policy.set_training_mode(True)
+        flat_observations = observations.reshape((n_unrolls * (steps + 1),) + observations.shape[2:])
+        flat_actions = actions.transpose(0, 1).reshape((n_unrolls * steps,) + actions.shape[2:])
+        # The values of all the observations, the last ones bootstrapping the returns
+        features = self.policy.extract_features(flat_observations)
+        latent_pi, latent_vf = self.policy.mlp_extractor(features)
+        all_values = self.policy.value_net(latent_vf).reshape(n_unrolls, steps + 1).transpose(0, 1)
+        latent_pi = latent_pi.reshape(n_unrolls, steps + 1, -1)[:, :steps].reshape(n_unrolls * steps, -1)
+        distribution = self.policy._get_action_dist_from_latent(latent_pi)
+        target_log_probs = distribution.log_prob(flat_actions).reshape(n_unrolls, steps).transpose(0, 1)
+        entropy = distribution.entropy().mean()
+
+        values, bootstrap_values = all_values[:steps], all_values[steps]
+        targets, advantages = vtrace(behaviour_log_probs, target_log_probs.detach(), rewards, values.detach(),
+                                     bootstrap_values.detach(), terminated, truncated, final_values, self.gamma,
+                                     self.rho_bar, self.c_bar)
+
+        policy_loss = -(advantages * target_log_probs).mean()
+        value_loss = 0.5 * ((targets - values) ** 2).mean()
+        loss = policy_loss + self.vf_coef * value_loss - self.ent_coef * entropy
+
+        for param_group in self.policy.optimizer.param_groups:
+            param_group["lr"] = self._get_learning_rate(progress_remaining)
+        self.policy.optimizer.zero_grad()
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+        self.policy.optimizer.step()
+        self.num_updates += 1
+
+        policy_lag = np.mean([self._weights_version.value - unroll["policy_version"] for unroll in batch])
+        return {"loss": loss.item(), "policy_loss": policy_loss.item(), "value_loss": value_loss.item(),
+                "entropy": entropy.item(), "policy_lag": float(policy_lag)}
+
+
+def train_actor_learner(config_path: Path = DEFAULT_CONFIG, env_id: str = DEFAULT_ENV_ID,
+                        env_kwargs: Optional[dict] = None, n_actors: Optional[int] = None,
+                        n_timesteps: Optional[int] = None, unroll_length: int = 20, batch_size: int = 4,
+                        save_path: str = "lotr2_impala_policy", checkpoint_dir: Optional[str] = "checkpoints",
+                        checkpoint_freq: int = 100_000, keep_checkpoints: int = 3,
+                        resume: bool = False) -> ActorLearner:
+    """
+    Train with the actor-learner architecture, reading the hyperparameters of the config file.
+    The number of envs of the config is the number of actors, and the PPO specific keys are ignored.
+
+    Args:
+        config_path: YAML file of hyperparameters by env id
+        env_id: Id of the env
+        env_kwargs: Keyword arguments of each env
+        n_actors: Number of actor processes, overrides the config
+        n_timesteps: Number of training steps, overrides the config
+        unroll_length: Number of steps of an unroll
+        batch_size: Number of unrolls of an update
+        save_path: File the policy is saved to
+        checkpoint_dir: Folder of the checkpoints, None to disable them
+        checkpoint_freq: Number of steps between two checkpoints
+        keep_checkpoints: Number of most recent checkpoints kept
+        resume: Whether to resume from the latest checkpoint of checkpoint_dir
+
+    Returns:
+        The trainer
+    """
+    hyperparams = load_hyperparams(config_path, env_id)
+    kwargs = {key: hyperparams[key] for key in ("learning_rate", "gamma", "ent_coef", "vf_coef")
+              if key in hyperparams}
+    ignored = set(hyperparams) - set(kwargs) - {"policy", "frame_stack", "env_kwargs", "n_envs", "n_timesteps"}
+    if ignored:
+        logger.info(f"Hyperparameters not used by the actor-learner: {', '.join(sorted(ignored))}")
+
+    trainer = ActorLearner(
+        n_actors or hyperparams.get("n_envs", 1),
+        env_id,
+        {**hyperparams.get("env_kwargs", {}), **(env_kwargs or {})},
+        policy=hyperparams.get("policy", "CnnPolicy"),
+        frame_stack=hyperparams.get("frame_stack", 1),
+        unroll_length=unroll_length,
+        batch_size=batch_size,
+        **kwargs,
+    )
+    checkpoints = CheckpointManager(checkpoint_dir, "impala", "pt", keep_checkpoints) if checkpoint_dir else None
+    checkpoint = checkpoints.latest() if checkpoints and resume else None
+    if checkpoint:
+        trainer.load_checkpoint(checkpoint)
+        logger.info(f"Resuming from {checkpoint} at {trainer.num_timesteps} steps")
+    elif resume:
+        logger.warning(f"No checkpoint to resume from in {checkpoint_dir}, starting a new training")
+    trainer.learn(n_timesteps or hyperparams["n_timesteps"], checkpoints=checkpoints, checkpoint_freq=checkpoint_freq)
+    trainer.save(save_path)
+    return trainer
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train with IMPALA actors and learner on one host")
+    parser.add_argument("--config", type=Path, default=DEFAULT_CONFIG,
+                        help="YAML file of hyperparameters by env id")
+    parser.add_argument("--env-id", type=str, default=DEFAULT_ENV_ID,
+                        help="Id of the env")
+    parser.add_argument("--n-actors", type=int, default=None,
+                        help="Number of actor processes (default: n_envs of the config)")
+    parser.add_argument("--n-timesteps", type=int, default=None,
+                        help="Number of training steps (default: from the config)")
+    parser.add_argument("--unroll-length", type=int, default=20,
+                        help="Number of steps of an unroll")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Number of unrolls of an update")
+    parser.add_argument("--backend", choices=["browser", "mock"], default="browser",
+                        help="Gym backend ('mock' replays recorded or scripted frames without browser)")
+    parser.add_argument("--save-path", type=str, default="lotr2_impala_policy",
+                        help="File the policy is saved to")
+    parser.add_argument("--checkpoint-dir", type=str, default="checkpoints",
+                        help="Folder of the periodic checkpoints")
+    parser.add_argument("--checkpoint-freq", type=int, default=100_000,
+                        help="Number of steps between two checkpoints")
+    parser.add_argument("--keep-checkpoints", type=int, default=3,
+                        help="Number of most recent checkpoints kept (0 keeps them all)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume from the latest checkpoint of --checkpoint-dir")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # The game files are not needed by the mock backend
+    folder_server = FolderWebServer("./roms", port=8080) if args.backend == "browser" else None
+    if folder_server:
+        folder_server.start()
+    try:
+        train_actor_learner(args.config, args.env_id, {"backend": args.backend}, args.n_actors, args.n_timesteps,
+                            args.unroll_length, args.batch_size, args.save_path, args.checkpoint_dir,
+                            args.checkpoint_freq, args.keep_checkpoints, args.resume)
+    finally:
+        if folder_server:
+            folder_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark of the browser layer on the synthetic canvas page, without emulator, game or network.
+
+For each combination of realtime/lite mode and input mode of BrowserController, it measures
+the actions per second, the input-to-render latency measured by the page, and the capture throughput
+of single screenshots and lite mode bursts.
+
+    python -m lotr2_rl.benchmarks.browser_throughput --output browser_bench.json
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from lotr2_rl.emulators.dos.browser_controller import BrowserController
+from lotr2_rl.emulators.dos.website_server import get_shared_server
+
+logger = logging.getLogger(__name__)
+
+INPUT_MODES = ("human", "direct")
+
+
+def _latency_stats(latencies_ms: List[float]) -> dict:
+    if not latencies_ms:
+        return {"count": 0}
+    latencies_ms = np.asarray(latencies_ms)
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max()),
+    }
+
+
+def run_case(url: str, lite: bool, input_mode: str, nb_actions: int, nb_captures: int, burst_size: int,
+             headless: bool = True) -> dict:
+    """
+    Measure one configuration of BrowserController on the synthetic page.
+
+    Args:
+        url: URL of the synthetic canvas page
+        lite: Whether to run the controller in lite mode
+        input_mode: Input mode of the controller
+        nb_actions: Number of move and click actions
+        nb_captures: Number of single screenshots
+        burst_size: Number of frames of each lite mode burst
+        headless: Whether to run the browser in headless mode
+
+    Returns:
+        The measures of the configuration
+    """
+    browser = BrowserController(
+        headless=headless,
+        lite=lite,
+        input_mode=input_mode,
+        num_screenshots_per_action=0,
+    )
+    browser.start()
+    try:
+        browser.navigate(url)
+        width, height = 640, 400
+        rng = random.Random(0)
+        browser.page.evaluate("() => window.benchTakeLatencies()")
+
+        start_time = time.perf_counter()
+        for _ in range(nb_actions):
+            browser.execute_action("move", f"{rng.uniform(0, width)},{rng.uniform(0, height)}")
+            browser.execute_action("click", "")
+        action_time_s = time.perf_counter() - start_time
+
+        # Let the last events be rendered
+        browser.wait(0.1)
+        latencies_ms = browser.page.evaluate("() => window.benchTakeLatencies()")
+
+        start_time = time.perf_counter()
+        for _ in range(nb_captures):
+            browser.get_screenshot()
+        capture_time_s = time.perf_counter() - start_time
+
+        result = {
+            "lite": lite,
+            "input_mode": input_mode,
+            "actions_per_s": nb_actions / action_time_s,
+            "input_to_render": _latency_stats(latencies_ms),
+            "captures_per_s": nb_captures / capture_time_s,
+        }
+
+        if lite:
+            start_time = time.perf_counter()
+            browser.capture_burst(burst_size, browser.screenshot_interval_frames)
+            result["burst_frames_per_s"] = burst_size / (time.perf_counter() - start_time)
+        return result
+    finally:
+        browser.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark BrowserController on a synthetic canvas page")
+    parser.add_argument("--actions", type=int, default=50,
+                        help="Number of move and click actions per configuration")
+    parser.add_argument("--captures", type=int, default=50,
+                        help="Number of single screenshots per configuration")
+    parser.add_argument("--burst-size", type=int, default=20,
+                        help="Number of frames of the lite mode burst")
+    parser.add_argument("--input-modes", nargs="+", choices=INPUT_MODES, default=list(INPUT_MODES),
+                        help="Input modes to measure")
+    parser.add_argument("--fps", type=float, default=70.0,
+                        help="Frame rate of the synthetic canvas")
+    parser.add_argument("--show", action="store_true",
+                        help="Show the browser window")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="File the JSON report is written to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = get_shared_server()
+    url = server.register_test_page(fps=args.fps)
+
+    results = []
+    for lite in (False, True):
+        for input_mode in args.input_modes:
+            logger.info(f"Measuring lite={lite} input_mode={input_mode}")
+            results.append(run_case(url, lite, input_mode, args.actions, args.captures, args.burst_size,
+                                    headless=not args.show))
+
+    report = {"fps": args.fps, "results": results, "server": server.stats.snapshot()}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
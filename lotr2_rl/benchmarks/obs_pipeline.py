@@ -0,0 +1,288 @@
+"""
+Offline benchmark of the observation pipeline of the gym, over a corpus of recorded frames.
+
+No browser or game is needed: the stages run on images recorded by the gym in `logs/lotr2/`
+(observations, end of turn frames, crown ROIs and lite mode screenshots) or any folder of images.
+Gold reads are checked against an optional `labels.json` file in the corpus folder mapping
+image paths relative to the corpus to the number of crowns, e.g. {"run_1/obs_0.png": 5043}.
+
+    python -m lotr2_rl.benchmarks.obs_pipeline logs/lotr2 --output bench.json
+    python -m lotr2_rl.benchmarks.obs_pipeline logs/lotr2 --baseline bench.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import pytesseract
+
+from lotr2_rl.emulators.mock.mock_browser_controller import OBS_X, observation_to_screenshot
+from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+from lotr2_rl.profiler import StepProfiler
+from lotr2_rl.utils import is_image_present, search_image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+STAGES = ("decode", "crown", "is_image_present", "search_image")
+
+# Region of the crowns in the observation (see _get_crown)
+CROWN_X, CROWN_WIDTH, CROWN_HEIGHT = 415, 105, 19
+
+
+class Frame:
+    """
+    A recorded frame with the inputs of each stage.
+    """
+    def __init__(self, name: str, screenshot: bytes, observation: np.ndarray, gold: Optional[int] = None):
+        """
+        Args:
+            name: Path of the image relative to the corpus
+            screenshot: JPEG bytes of the full page, as returned by the browser
+            observation: The cropped observation
+            gold: The labelled number of crowns, None if not labelled
+        """
+        self.name = name
+        self.screenshot = screenshot
+        self.observation = observation
+        self.gold = gold
+
+
+def load_corpus(corpus_dir: Path, labels_path: Optional[Path] = None, obs_shape=(400, 534, 3)) -> List[Frame]:
+    """
+    Load the recorded frames of a folder, recursively.
+    Full page screenshots are decoded like the gym does, observations are re-encoded to a full page
+    JPEG so the decode stage always runs on browser-like input, and crown ROIs are placed in an
+    otherwise black observation.
+
+    Args:
+        corpus_dir: Folder holding the images
+        labels_path: JSON file mapping image paths to their number of crowns, defaults to `labels.json` in the corpus
+        obs_shape: Shape of the gym observations
+
+    Returns:
+        The frames, sorted by name
+    """
+    labels_path = labels_path or corpus_dir / "labels.json"
+    labels: Dict[str, int] = {}
+    if labels_path.is_file():
+        with open(labels_path) as f:
+            labels = {name: int(gold) for name, gold in json.load(f).items()}
+
+    frames = []
+    for path in sorted(corpus_dir.rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        name = path.relative_to(corpus_dir).as_posix()
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if image is None:
+            logger.warning(f"Skipping unreadable image {name}")
+            continue
+
+        if image.shape == obs_shape:
+            observation = image
+            screenshot = observation_to_screenshot(observation)
+        elif image.shape[:2] == (CROWN_HEIGHT, CROWN_WIDTH):
+            observation = np.zeros(obs_shape, dtype=np.uint8)
+            observation[:CROWN_HEIGHT, CROWN_X:CROWN_X + CROWN_WIDTH] = image
+            screenshot = observation_to_screenshot(observation)
+        elif image.shape[0] > obs_shape[0] and image.shape[1] > obs_shape[1]:
+            screenshot = path.read_bytes() if path.suffix.lower() != ".png" else \
+                cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 100])[1].tobytes()
+            observation = image[:-75, OBS_X:-90]
+        else:
+            logger.warning(f"Skipping image {name} of unexpected shape {image.shape}")
+            continue
+
+        frames.append(Frame(name, screenshot, np.ascontiguousarray(observation), labels.get(name)))
+
+    return frames
+
+
+def _make_env(log_dir: Path) -> LordsOfTheRealm2Gym:
+    """ Build a gym without browser, with only what the observation pipeline uses. """
+    env = LordsOfTheRealm2Gym()
+    env.log_dir = log_dir
+    env.player_icon_img = env._load_template("player_icon_gray.png")
+    env.main_menu_img = env._load_template("main_menu_gray.png")
+    env.confirm_button_img = env._load_template("confirm_button_gray.png")
+    return env
+
+
+def run_benchmark(frames: List[Frame], repeat: int = 3, warmup: int = 1, stages=STAGES) -> dict:
+    """
+    Run each stage over all the frames.
+
+    Args:
+        frames: The corpus
+        repeat: Number of timed passes over the corpus
+        warmup: Number of untimed passes over the corpus, to fill the caches
+        stages: Names of the stages to run
+
+    Returns:
+        The report: throughput and latency per stage, and gold read accuracy
+    """
+    profiler = StepProfiler()
+    gold_reads: Dict[str, Optional[int]] = {}
+    errors: Dict[str, str] = {}
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        env = _make_env(Path(log_dir))
+
+        def run_stage(stage: str, frame: Frame):
+            if stage == "decode":
+                return env._decode_screenshot(frame.screenshot)
+            if stage == "crown":
+                # The gym rejects reads too far from the previous gold, start from the label when known
+                env.last_gold = frame.gold if frame.gold is not None else 0
+                try:
+                    return env._get_crown(frame.observation)
+                except ValueError:
+                    # Text without any digit, counted as unreadable
+                    return None
+            if stage == "is_image_present":
+                return is_image_present(frame.observation, env.main_menu_img)
+            if stage == "search_image":
+                return search_image(frame.observation, env.confirm_button_img)
+            raise ValueError(f"Unknown stage: {stage}")
+
+        wall_times_s = {}
+        for stage in stages:
+            try:
+                for _ in range(warmup):
+                    for frame in frames:
+                        run_stage(stage, frame)
+
+                start_time = time.perf_counter()
+                for _ in range(repeat):
+                    for frame in frames:
+                        with profiler.phase(stage):
+                            result = run_stage(stage, frame)
+                        if stage == "crown":
+                            gold_reads[frame.name] = result
+                wall_times_s[stage] = time.perf_counter() - start_time
+            except (pytesseract.TesseractNotFoundError, cv2.error) as e:
+                logger.error(f"Stage {stage} failed: {e}")
+                errors[stage] = str(e)
+
+    summary = profiler.summary()
+    report_stages = {}
+    for stage, wall_time_s in wall_times_s.items():
+        stats = summary.get(stage, {"count": 0})
+        report_stages[stage] = dict(stats, throughput_per_s=stats["count"] / wall_time_s if wall_time_s > 0 else 0.0)
+
+    return {
+        "nb_frames": len(frames),
+        "repeat": repeat,
+        "stages": report_stages,
+        "errors": errors,
+        "gold": _gold_accuracy(frames, gold_reads) if "crown" in wall_times_s else None,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": cv2.getNumberOfCPUs(),
+        },
+    }
+
+
+def _gold_accuracy(frames: List[Frame], gold_reads: Dict[str, Optional[int]]) -> dict:
+    labelled = [frame for frame in frames if frame.gold is not None]
+    mismatches = {
+        frame.name: {"expected": frame.gold, "read": gold_reads.get(frame.name)}
+        for frame in labelled
+        if gold_reads.get(frame.name) != frame.gold
+    }
+    return {
+        "labelled": len(labelled),
+        "correct": len(labelled) - len(mismatches),
+        "unreadable": sum(1 for mismatch in mismatches.values() if mismatch["read"] is None),
+        "accuracy": (len(labelled) - len(mismatches)) / len(labelled) if labelled else None,
+        "mismatches": mismatches,
+    }
+
+
+def compare_reports(report: dict, baseline: dict, max_regression: float = 0.2) -> List[str]:
+    """
+    Compare a report to a baseline report.
+
+    Args:
+        report: The new report
+        baseline: The reference report
+        max_regression: Allowed relative increase of the p50 latency of a stage
+
+    Returns:
+        The description of each regression, empty if there is none
+    """
+    regressions = []
+    for stage, stats in report["stages"].items():
+        baseline_stats = baseline.get("stages", {}).get(stage)
+        if not baseline_stats or not baseline_stats.get("p50_ms"):
+            continue
+        ratio = stats["p50_ms"] / baseline_stats["p50_ms"]
+        if ratio > 1 + max_regression:
+            regressions.append(f"{stage}: p50 {baseline_stats['p50_ms']:.3f}ms -> {stats['p50_ms']:.3f}ms (x{ratio:.2f})")
+
+    accuracy = (report.get("gold") or {}).get("accuracy")
+    baseline_accuracy = (baseline.get("gold") or {}).get("accuracy")
+    if accuracy is not None and baseline_accuracy is not None and accuracy < baseline_accuracy:
+        regressions.append(f"gold accuracy: {baseline_accuracy:.3f} -> {accuracy:.3f}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the observation pipeline over recorded frames")
+    parser.add_argument("corpus", type=Path, nargs="?", default=Path("logs/lotr2"),
+                        help="Folder of recorded frames")
+    parser.add_argument("--labels", type=Path, default=None,
+                        help="JSON file mapping image paths to their number of crowns (default: <corpus>/labels.json)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to run")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of timed passes over the corpus")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Number of untimed passes over the corpus")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="File the JSON report is written to (default: stdout)")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Report to compare with, exits with 1 on regression")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative increase of the p50 latency of a stage")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    frames = load_corpus(args.corpus, args.labels)
+    if not frames:
+        logger.error(f"No frames found in {args.corpus}")
+        return 2
+    logger.info(f"Loaded {len(frames)} frames from {args.corpus}")
+
+    report = run_benchmark(frames, repeat=args.repeat, warmup=args.warmup, stages=args.stages)
+    report["corpus"] = str(args.corpus)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            logger.error(f"Regression {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
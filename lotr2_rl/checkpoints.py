@@ -0,0 +1,99 @@
+"""
+Periodic training checkpoints, so a crashed or preempted run loses at most one checkpoint interval.
+
+A checkpoint is one file per save, `<prefix>_<num_timesteps>_steps.<extension>`, written through a
+temporary file and renamed, so a crash during a save never leaves a partial checkpoint behind. Only
+the `keep` most recent checkpoints are kept.
+"""
+import logging
+import os
+import re
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def save_atomic(path: Path, write: Callable[[BinaryIO], None]) -> None:
+    """
+    Write a file through a temporary file, so readers never see a partial file.
+
+    Args:
+        path: The file
+        write: Function writing the content to an open binary file
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class CheckpointManager:
+    """
+    Checkpoints of one training in a folder, named after their number of timesteps.
+    """
+    def __init__(self, directory: str, prefix: str, extension: str = "zip", keep: int = 3):
+        """
+        Args:
+            directory: Folder of the checkpoints, created if needed
+            prefix: Name of the training, e.g. "ppo"
+            extension: Extension of the checkpoint files
+            keep: Number of most recent checkpoints kept, 0 to keep them all
+        """
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.extension = extension
+        self.keep = keep
+        self._pattern = re.compile(rf"^{re.escape(prefix)}_(\d+)_steps\.{re.escape(extension)}$")
+
+    def get_path(self, num_timesteps: int, extension: Optional[str] = None) -> Path:
+        """ Path of the checkpoint of a number of timesteps, or of a file saved along with it. """
+        return self.directory / f"{self.prefix}_{num_timesteps}_steps.{extension or self.extension}"
+
+    def list(self) -> List[Path]:
+        """ Checkpoints of the folder, oldest first. """
+        if not self.directory.is_dir():
+            return []
+        checkpoints = []
+        for path in self.directory.iterdir():
+            match = self._pattern.match(path.name)
+            if match:
+                checkpoints.append((int(match.group(1)), path))
+        return [path for _, path in sorted(checkpoints)]
+
+    def latest(self) -> Optional[Path]:
+        """ Most recent checkpoint, None when there is none. """
+        checkpoints = self.list()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, num_timesteps: int, write: Callable[[BinaryIO], None]) -> Path:
+        """
+        Save a checkpoint atomically and delete the oldest ones beyond `keep`.
+
+        Args:
+            num_timesteps: Number of timesteps of the training so far
+            write: Function writing the checkpoint to an open binary file
+
+        Returns:
+            The path of the checkpoint
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.get_path(num_timesteps)
+        save_atomic(path, write)
+        logger.info(f"Saved checkpoint {path}")
+        self._prune()
+        return path
+
+    def _prune(self) -> None:
+        if self.keep <= 0:
+            return
+        for path in self.list()[:-self.keep]:
+            # Files saved along with the checkpoint share its name, with another extension
+            for related_path in self.directory.glob(f"{path.stem}.*"):
+                related_path.unlink(missing_ok=True)
@@ -2,6 +2,23 @@
 
 # Hold constants for game-playing agent
 
+### js-dos runtime, served locally by DOSGameServer once downloaded
+JS_DOS_VERSION = "8.3.14"
+JS_DOS_CDN_URL = f"https://v8.js-dos.com/8.xx/{JS_DOS_VERSION}"
+JS_DOS_LOCAL_PATH = f"/js-dos/{JS_DOS_VERSION}"
+
+# Runtime files relative to the version folder, and whether each one is required to boot
+JS_DOS_RUNTIME_FILES = {
+    "js-dos.js": True,
+    "js-dos.css": True,
+    "emulators/wdosbox.js": True,
+    "emulators/wdosbox.wasm": True,
+    "emulators/wdosbox-x.js": False,
+    "emulators/wdosbox-x.wasm": False,
+    "emulators/wlibzip.js": False,
+    "emulators/wlibzip.wasm": False,
+}
+
 DOS_GAME_LITE_HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -11,17 +28,69 @@ DOS_GAME_LITE_HTML_TEMPLATE = """<!DOCTYPE html>
     <title>JS-DOS Game Player</title>
     
     <!-- js-dos style sheet -->
-    <link rel="stylesheet" href="https://v8.js-dos.com/8.xx/8.3.14/js-dos.css">
+    <link rel="stylesheet" href="{js_dos_url}/js-dos.css">
     
     <!-- js-dos -->
-    <script src="https://v8.js-dos.com/8.xx/8.3.14/js-dos.js"></script>
+    <script src="{js_dos_url}/js-dos.js"></script>
 </head>
 <body>
     <div id="dos" style="width: 640px; height: 400px;"></div>
     <script>
+        // Frame-stepping state: the emulator stays paused and is only advanced
+        // by an explicit number of frames through window.dosStep().
+        let ci = null;
+        let frameCount = 0;
+        let stepRequest = null;
+
+        function onFrame() {{
+            frameCount += 1;
+            if (stepRequest !== null && frameCount >= stepRequest.target) {{
+                ci.pause();
+                const request = stepRequest;
+                stepRequest = null;
+                request.resolve(frameCount);
+            }}
+        }}
+
         const props = Dos(document.getElementById("dos"), {{
             url: "{game_url}",
+            pathPrefix: "{js_dos_url}/emulators/",
             autoStart: true,
+            onEvent: (event, arg) => {{
+                if (event === "ci-ready") {{
+                    ci = arg;
+                    ci.events().onFrame(onFrame);
+                }}
+            }},
+        }});
+
+        window.dosIsReady = () => ci !== null;
+        window.dosFrameCount = () => frameCount;
+        window.dosPause = () => {{ if (ci !== null) ci.pause(); }};
+        window.dosResume = () => {{ if (ci !== null) ci.resume(); }};
+
+        // Resume the emulator for `frames` frames, then pause it again.
+        // Resolves with the frame counter, or -1 if the emulator is not ready.
+        window.dosStep = (frames, timeoutMs) => new Promise((resolve) => {{
+            if (ci === null) {{
+                resolve(-1);
+                return;
+            }}
+            const timer = setTimeout(() => {{
+                if (stepRequest !== null) {{
+                    ci.pause();
+                    stepRequest = null;
+                    resolve(frameCount);
+                }}
+            }}, timeoutMs);
+            stepRequest = {{
+                target: frameCount + frames,
+                resolve: (count) => {{
+                    clearTimeout(timer);
+                    resolve(count);
+                }},
+            }};
+            ci.resume();
         }});
         
         let isDown = false;
@@ -63,18 +132,124 @@ DOS_GAME_HTML_TEMPLATE = """<!DOCTYPE html>
     <title>JS-DOS Game Player</title>
     
     <!-- js-dos style sheet -->
-    <link rel="stylesheet" href="https://v8.js-dos.com/8.xx/8.3.14/js-dos.css">
+    <link rel="stylesheet" href="{js_dos_url}/js-dos.css">
     
     <!-- js-dos -->
-    <script src="https://v8.js-dos.com/8.xx/8.3.14/js-dos.js"></script>
+    <script src="{js_dos_url}/js-dos.js"></script>
 </head>
 <body>
     <div id="dos" style="width: 640px; height: 400px;"></div>
     <script>
+        // Frame counter, used by the controller watchdog to detect a frozen emulator
+        let ci = null;
+        let frameCount = 0;
+
         const props = Dos(document.getElementById("dos"), {{
             url: "{game_url}",
+            pathPrefix: "{js_dos_url}/emulators/",
             autoStart: true,
+            onEvent: (event, arg) => {{
+                if (event === "ci-ready") {{
+                    ci = arg;
+                    ci.events().onFrame(() => {{ frameCount += 1; }});
+                }}
+            }},
+        }});
+
+        window.dosIsReady = () => ci !== null;
+        window.dosFrameCount = () => frameCount;
+    </script>
+</body>
+</html>"""
+
+# Synthetic page mimicking the js-dos canvas and its frame-stepping helpers, without emulator or game.
+# Each frame draws the frame counter and the last input events, and records the input-to-render
+# latency of the events it shows. Used to benchmark the browser layer on its own.
+SYNTHETIC_CANVAS_HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Synthetic canvas</title>
+    <style>body {{ margin: 0; background: #000; }}</style>
+</head>
+<body>
+    <div id="dos" style="width: 640px; height: 400px;">
+        <canvas id="canvas" width="640" height="400"></canvas>
+    </div>
+    <script>
+        const canvas = document.getElementById("canvas");
+        const context = canvas.getContext("2d");
+        let frameCount = 0;
+        let paused = false;
+        let stepRequest = null;
+        let mouse = {{ x: 0, y: 0, down: false }};
+        let lastKey = "";
+        let pendingEvents = [];
+        let latencies = [];
+
+        function recordEvent(event) {{
+            pendingEvents.push(event.timeStamp);
+        }}
+        canvas.addEventListener("mousemove", (event) => {{ mouse.x = event.offsetX; mouse.y = event.offsetY; recordEvent(event); }});
+        canvas.addEventListener("mousedown", (event) => {{ mouse.down = true; recordEvent(event); }});
+        canvas.addEventListener("mouseup", (event) => {{ mouse.down = false; recordEvent(event); }});
+        document.addEventListener("keydown", (event) => {{ lastKey = event.key; recordEvent(event); }});
+
+        function onFrame() {{
+            frameCount += 1;
+            context.fillStyle = `hsl(${{frameCount % 360}}, 40%, 25%)`;
+            context.fillRect(0, 0, canvas.width, canvas.height);
+            context.fillStyle = "#fff";
+            context.font = "16px monospace";
+            context.fillText(`frame ${{frameCount}}  key ${{lastKey}}`, 10, 20);
+            context.fillStyle = mouse.down ? "#f00" : "#ff0";
+            context.fillRect(mouse.x - 5, mouse.y - 5, 10, 10);
+
+            // The events received since the previous frame are now on screen
+            const now = performance.now();
+            for (const eventTime of pendingEvents) {{
+                latencies.push(now - eventTime);
+            }}
+            pendingEvents = [];
+
+            if (stepRequest !== null && frameCount >= stepRequest.target) {{
+                paused = true;
+                const request = stepRequest;
+                stepRequest = null;
+                request.resolve(frameCount);
+            }}
+        }}
+        setInterval(() => {{ if (!paused) onFrame(); }}, 1000 / {fps});
+
+        // Same helpers as the lite js-dos template
+        window.dosIsReady = () => true;
+        window.dosFrameCount = () => frameCount;
+        window.dosPause = () => {{ paused = true; }};
+        window.dosResume = () => {{ paused = false; }};
+        window.dosStep = (frames, timeoutMs) => new Promise((resolve) => {{
+            const timer = setTimeout(() => {{
+                if (stepRequest !== null) {{
+                    paused = true;
+                    stepRequest = null;
+                    resolve(frameCount);
+                }}
+            }}, timeoutMs);
+            stepRequest = {{
+                target: frameCount + frames,
+                resolve: (count) => {{
+                    clearTimeout(timer);
+                    resolve(count);
+                }},
+            }};
+            paused = false;
         }});
+
+        // Input-to-render latencies in milliseconds since the last call
+        window.benchTakeLatencies = () => {{
+            const taken = latencies;
+            latencies = [];
+            return taken;
+        }};
     </script>
 </body>
 </html>"""
@@ -0,0 +1,348 @@
+"""
+Offline dataset over trajectories recorded by TrajectoryRecorder, for behaviour cloning and offline RL.
+
+Observations stay on disk: raw chunks are memory-mapped and only the sampled frames are read,
+delta compressed chunks are decoded from their closest keyframe. The small per-row arrays
+(actions, rewards, flags, info fields) are loaded in memory.
+"""
+import json
+import logging
+import queue
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import gymnasium as gym
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _DeltaObservations:
+    """
+    Random access to the observations of a delta compressed chunk, with a small cache of decoded frames.
+    """
+    def __init__(self, chunk_dir: Path, meta: dict, cache_size: int = 256):
+        self.offsets = np.load(chunk_dir / "observation_offsets.npy")
+        self.obs_shape = tuple(meta["obs_shape"])
+        self.keyframe_interval = meta["keyframe_interval"]
+        with open(chunk_dir / "observations.bin", "rb") as f:
+            self.compressed = f.read()
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _decode(self, i: int) -> np.ndarray:
+        data = zlib.decompress(self.compressed[self.offsets[i]:self.offsets[i + 1]])
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.obs_shape)
+
+    def get(self, i: int) -> np.ndarray:
+        with self._lock:
+            frame = self._cache.get(i)
+            if frame is not None:
+                self._cache.move_to_end(i)
+                return frame
+
+            # Decode from the keyframe, or from the closest cached frame after it
+            start = i - i % self.keyframe_interval
+            frame = None
+            for j in range(i - 1, start - 1, -1):
+                if j in self._cache:
+                    frame, start = self._cache[j], j + 1
+                    break
+            if frame is None:
+                frame, start = self._decode(start), start + 1
+            for j in range(start, i + 1):
+                frame = frame + self._decode(j)
+
+            self._cache[i] = frame
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return frame
+
+    def __getitem__(self, indices: np.ndarray) -> np.ndarray:
+        # Sorted decoding so consecutive frames reuse each other
+        output = np.empty((len(indices),) + self.obs_shape, dtype=np.uint8)
+        for position in np.argsort(indices, kind="stable"):
+            output[position] = self.get(int(indices[position]))
+        return output
+
+
+class OfflineDataset:
+    """
+    Recorded trajectories as one table of rows, sampled as batches of transitions.
+    Row k holds an observation and the action, reward and flags of the step that led to it,
+    the transition (s, a, r, s') of row k being (obs[k-1], action[k], reward[k], obs[k]).
+    """
+    def __init__(
+        self,
+        root_dir: str,
+        frame_stack: int = 1,
+        observation_space: Optional[gym.spaces.Box] = None,
+        action_space: Optional[gym.spaces.Space] = None,
+    ):
+        """
+        Load the complete chunks of a recording.
+
+        Args:
+            root_dir: Folder of the recording, searched recursively so the recordings of several envs are merged
+            frame_stack: Number of stacked frames per observation, concatenated on the channel axis like VecFrameStack
+            observation_space: Observation space of the env, used to check the recorded frames
+            action_space: Action space of the env
+        """
+        self.root_dir = Path(root_dir)
+        self.frame_stack = frame_stack
+        self.action_space = action_space
+
+        chunk_dirs = sorted(meta_path.parent for meta_path in self.root_dir.rglob("chunk_*/meta.json"))
+        if not chunk_dirs:
+            raise FileNotFoundError(f"No complete chunk found in {self.root_dir}")
+
+        self._observations = []
+        columns: Dict[str, List[np.ndarray]] = {}
+        source_ids, chunk_lengths = [], []
+        sources: Dict[Path, int] = {}
+        for chunk_dir in chunk_dirs:
+            with open(chunk_dir / "meta.json") as f:
+                meta = json.load(f)
+            length = meta["length"]
+            if length == 0:
+                continue
+
+            if meta["compression"] == "none":
+                self._observations.append(np.load(chunk_dir / "observations.npy", mmap_mode="r"))
+            else:
+                self._observations.append(_DeltaObservations(chunk_dir, meta))
+            self.obs_shape = tuple(meta["obs_shape"])
+
+            names = ["actions", "rewards", "terminated", "truncated", "episode_ids", "steps"]
+            names += [f"info_{key}" for key in meta["info_keys"]]
+            for name in names:
+                columns.setdefault(name, []).append(np.load(chunk_dir / f"{name}.npy")[:length])
+            source_ids.append(np.full(length, sources.setdefault(chunk_dir.parent, len(sources)), dtype=np.int64))
+            chunk_lengths.append(length)
+
+        if observation_space is not None and observation_space.shape != self.obs_shape:
+            raise ValueError(f"Recorded observations {self.obs_shape} do not match the space {observation_space.shape}")
+        single_space = observation_space or gym.spaces.Box(0, 255, shape=self.obs_shape, dtype=np.uint8)
+        self.observation_space = gym.spaces.Box(
+            np.concatenate([single_space.low] * frame_stack, axis=-1),
+            np.concatenate([single_space.high] * frame_stack, axis=-1),
+            dtype=single_space.dtype,
+        )
+
+        self.actions = np.concatenate(columns.pop("actions"))
+        self.rewards = np.concatenate(columns.pop("rewards"))
+        self.terminated = np.concatenate(columns.pop("terminated"))
+        self.truncated = np.concatenate(columns.pop("truncated"))
+        self.episode_ids = np.concatenate(columns.pop("episode_ids"))
+        self.steps = np.concatenate(columns.pop("steps"))
+        self.infos = {name[len("info_"):]: np.concatenate(values) for name, values in columns.items()}
+        self.source_ids = np.concatenate(source_ids)
+        self.chunk_starts = np.concatenate([[0], np.cumsum(chunk_lengths)])
+
+        # A row continues the previous one when they are consecutive steps of the same episode
+        continues = np.zeros(len(self), dtype=bool)
+        continues[1:] = (
+            (self.source_ids[1:] == self.source_ids[:-1])
+            & (self.episode_ids[1:] == self.episode_ids[:-1])
+            & (self.steps[1:] == self.steps[:-1] + 1)
+        )
+        self.transition_indices = np.flatnonzero(continues)
+
+        # First row of the episode of each row, to clamp the frame stacks
+        episode_starts = np.where(continues, 0, np.arange(len(self)))
+        self.episode_starts = np.maximum.accumulate(episode_starts)
+
+        logger.info(f"Loaded {len(self)} rows and {len(self.transition_indices)} transitions from {len(chunk_lengths)} chunks")
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def get_observations(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Gather the observations of rows, with their stacked previous frames.
+
+        Args:
+            indices: Row indices
+
+        Returns:
+            The observations, of shape (N, H, W, C * frame_stack)
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.frame_stack > 1:
+            # Frames before the start of the episode are replaced by its first frame
+            offsets = np.arange(1 - self.frame_stack, 1)
+            frame_indices = np.maximum(indices[:, None] + offsets, self.episode_starts[indices][:, None]).ravel()
+        else:
+            frame_indices = indices
+
+        frames = np.empty((len(frame_indices),) + self.obs_shape, dtype=np.uint8)
+        chunks = np.searchsorted(self.chunk_starts, frame_indices, side="right") - 1
+        for chunk in np.unique(chunks):
+            positions = np.flatnonzero(chunks == chunk)
+            frames[positions] = self._observations[chunk][frame_indices[positions] - self.chunk_starts[chunk]]
+
+        if self.frame_stack == 1:
+            return frames
+        # (N, stack, H, W, C) -> (N, H, W, stack * C), oldest frame first like VecFrameStack
+        frames = frames.reshape((len(indices), self.frame_stack) + self.obs_shape)
+        return np.moveaxis(frames, 1, -2).reshape(len(indices), *self.obs_shape[:-1], -1)
+
+    def get_transitions(self, indices: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Gather transitions.
+
+        Args:
+            indices: Row indices of the transitions, from `transition_indices`
+
+        Returns:
+            observations, actions, rewards, next_observations, terminated, truncated and info fields
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        batch = {
+            "observations": self.get_observations(indices - 1),
+            "actions": self.actions[indices],
+            "rewards": self.rewards[indices],
+            "next_observations": self.get_observations(indices),
+            "terminated": self.terminated[indices],
+            "truncated": self.truncated[indices],
+        }
+        for key, values in self.infos.items():
+            batch[f"info_{key}"] = values[indices]
+        return batch
+
+    def sample(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """
+        Sample a batch of transitions uniformly.
+
+        Args:
+            batch_size: Number of transitions
+            rng: Random generator
+
+        Returns:
+            The batch, see get_transitions
+        """
+        rng = rng or np.random.default_rng()
+        return self.get_transitions(rng.choice(self.transition_indices, size=batch_size))
+
+    def iterate(self, batch_size: int, seed: Optional[int] = None, prefetch: int = 2) -> "BatchPrefetcher":
+        """
+        Get an endless iterator of random batches, prepared on a worker thread.
+
+        Args:
+            batch_size: Number of transitions of a batch
+            seed: Seed of the sampling
+            prefetch: Number of batches prepared in advance
+
+        Returns:
+            The iterator, to close when done
+        """
+        return BatchPrefetcher(self, batch_size, seed, prefetch)
+
+    def fill_replay_buffer(self, replay_buffer, max_transitions: Optional[int] = None, batch_size: int = 256) -> int:
+        """
+        Copy transitions into a stable-baselines3 ReplayBuffer of a single env, with vectorized writes.
+
+        Args:
+            replay_buffer: The buffer, created with this dataset observation and action spaces
+            max_transitions: Maximum number of transitions to copy, all of them by default
+            batch_size: Number of transitions copied at once
+
+        Returns:
+            The number of copied transitions
+        """
+        if replay_buffer.n_envs != 1 or replay_buffer.optimize_memory_usage:
+            raise ValueError("Only single env replay buffers without optimize_memory_usage can be filled")
+
+        indices = self.transition_indices[:max_transitions]
+        for start in range(0, len(indices), batch_size):
+            batch = self.get_transitions(indices[start:start + batch_size])
+            n = len(batch["rewards"])
+            positions = (replay_buffer.pos + np.arange(n)) % replay_buffer.buffer_size
+
+            replay_buffer.observations[positions, 0] = batch["observations"]
+            replay_buffer.next_observations[positions, 0] = batch["next_observations"]
+            replay_buffer.actions[positions, 0] = batch["actions"].reshape(n, replay_buffer.action_dim)
+            replay_buffer.rewards[positions, 0] = batch["rewards"]
+            replay_buffer.dones[positions, 0] = batch["terminated"] | batch["truncated"]
+            if replay_buffer.handle_timeout_termination:
+                replay_buffer.timeouts[positions, 0] = batch["truncated"] & ~batch["terminated"]
+
+            replay_buffer.full = replay_buffer.full or replay_buffer.pos + n >= replay_buffer.buffer_size
+            replay_buffer.pos = int((replay_buffer.pos + n) % replay_buffer.buffer_size)
+        return len(indices)
+
+
+def to_torch(batch: Dict[str, np.ndarray], device="cpu", pin_memory: bool = False) -> dict:
+    """
+    Convert a batch to PyTorch tensors, sharing the memory of the arrays on CPU.
+
+    Args:
+        batch: A batch of the dataset
+        device: Device of the tensors
+        pin_memory: Whether to pin the tensors before the transfer to a GPU
+
+    Returns:
+        The batch of tensors
+    """
+    import torch
+
+    tensors = {}
+    for key, value in batch.items():
+        tensor = torch.from_numpy(value)
+        if pin_memory:
+            tensor = tensor.pin_memory()
+        tensors[key] = tensor.to(device, non_blocking=pin_memory)
+    return tensors
+
+
+class BatchPrefetcher:
+    """
+    Iterator of random batches of a dataset, sampled on a worker thread while the previous batch is used.
+    Reading the frames from disk mostly releases the GIL, so it overlaps with the training step.
+    """
+    def __init__(self, dataset: OfflineDataset, batch_size: int, seed: Optional[int] = None, prefetch: int = 2):
+        """
+        Args:
+            dataset: The dataset to sample
+            batch_size: Number of transitions of a batch
+            seed: Seed of the sampling
+            prefetch: Number of batches prepared in advance
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self._rng = np.random.default_rng(seed)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, name="batch_prefetcher", daemon=True)
+        self._thread.start()
+
+    def _fill(self) -> None:
+        try:
+            while not self._stop.is_set():
+                batch = self.dataset.sample(self.batch_size, self._rng)
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except BaseException as e:
+            logger.error(f"Batch prefetching failed: {e}")
+            self._queue.put(e)
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        return self
+
+    def __next__(self) -> Dict[str, np.ndarray]:
+        batch = self._queue.get()
+        if isinstance(batch, BaseException):
+            raise RuntimeError("Batch prefetching failed") from batch
+        return batch
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,248 @@
+"""
+Recording of env trajectories to disk, for offline RL and benchmarks.
+
+A recording is a folder of chunks, `chunk_<index>/`, each holding up to `chunk_size` rows:
+    observations.npy        (N, H, W, 3) uint8 memmap, or observations.bin + observation_offsets.npy
+                            with the "delta" compression
+    actions.npy             (N, *action_shape) int64, -1 on reset rows
+    rewards.npy             (N,) float32
+    terminated.npy          (N,) bool
+    truncated.npy           (N,) bool
+    episode_ids.npy         (N,) int64
+    steps.npy               (N,) int64, 0 on reset rows
+    info_<key>.npy          (N,) float64, NaN when the key is missing
+    meta.json               number of valid rows and format, written when the chunk is complete
+
+Each row is an observation with the action, reward and flags of the step that led to it, reset rows
+having no action. The transition (s, a, r, s') of row k is (obs[k-1], action[k], reward[k], obs[k]),
+for k > 0 in the same episode, so terminal observations are kept without storing frames twice.
+"""
+import json
+import logging
+import queue
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional, Sequence
+
+import gymnasium as gym
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHUNK_DIR_FORMAT = "chunk_{:05d}"
+COMPRESSIONS = ("none", "delta")
+
+
+def write_json_atomic(path: Path, data: dict) -> None:
+    """ Write a JSON file through a temporary file, so readers never see a partial file. """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    tmp_path.replace(path)
+
+
+class _ChunkWriter:
+    """
+    Preallocated arrays of one chunk, written by the recorder thread.
+    """
+    def __init__(self, chunk_dir: Path, chunk_size: int, obs_shape, action_shape, info_keys: Sequence[str],
+                 compression: str, keyframe_interval: int):
+        self.chunk_dir = chunk_dir
+        self.chunk_size = chunk_size
+        self.obs_shape = tuple(obs_shape)
+        self.info_keys = list(info_keys)
+        self.compression = compression
+        self.keyframe_interval = keyframe_interval
+        self.length = 0
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+
+        def allocate(name, shape, dtype, fill=0):
+            array = np.lib.format.open_memmap(chunk_dir / f"{name}.npy", mode="w+", dtype=dtype, shape=shape)
+            array[:] = fill
+            return array
+
+        if compression == "none":
+            self.observations = np.lib.format.open_memmap(
+                chunk_dir / "observations.npy", mode="w+", dtype=np.uint8, shape=(chunk_size,) + self.obs_shape
+            )
+        else:
+            self._obs_file = open(chunk_dir / "observations.bin", "wb")
+            self._obs_offsets = [0]
+            self._previous_obs = None
+        self.actions = allocate("actions", (chunk_size,) + tuple(action_shape), np.int64, -1)
+        self.rewards = allocate("rewards", (chunk_size,), np.float32)
+        self.terminated = allocate("terminated", (chunk_size,), bool)
+        self.truncated = allocate("truncated", (chunk_size,), bool)
+        self.episode_ids = allocate("episode_ids", (chunk_size,), np.int64, -1)
+        self.steps = allocate("steps", (chunk_size,), np.int64)
+        self.infos = {key: allocate(f"info_{key}", (chunk_size,), np.float64, np.nan) for key in self.info_keys}
+
+    @property
+    def is_full(self) -> bool:
+        return self.length >= self.chunk_size
+
+    def write(self, row: dict) -> None:
+        i = self.length
+        if self.compression == "none":
+            self.observations[i] = row["observation"]
+        else:
+            self._write_delta(i, row["observation"])
+        if row["action"] is not None:
+            self.actions[i] = row["action"]
+        self.rewards[i] = row["reward"]
+        self.terminated[i] = row["terminated"]
+        self.truncated[i] = row["truncated"]
+        self.episode_ids[i] = row["episode_id"]
+        self.steps[i] = row["step"]
+        for key, value in row["info"].items():
+            self.infos[key][i] = value
+        self.length += 1
+
+    def _write_delta(self, i: int, observation: np.ndarray) -> None:
+        # Frames are stored as the difference with the previous frame, modulo 256, except keyframes
+        # so that any frame can be decoded from the closest keyframe before it
+        if i % self.keyframe_interval == 0:
+            delta = observation
+        else:
+            delta = observation - self._previous_obs
+        data = zlib.compress(np.ascontiguousarray(delta).tobytes(), 1)
+        self._obs_file.write(data)
+        self._obs_offsets.append(self._obs_offsets[-1] + len(data))
+        self._previous_obs = observation
+
+    def close(self) -> None:
+        arrays = [self.actions, self.rewards, self.terminated, self.truncated, self.episode_ids, self.steps]
+        arrays += list(self.infos.values())
+        if self.compression == "none":
+            arrays.append(self.observations)
+        else:
+            self._obs_file.close()
+            np.save(self.chunk_dir / "observation_offsets.npy", np.asarray(self._obs_offsets, dtype=np.int64))
+        for array in arrays:
+            array.flush()
+
+        write_json_atomic(self.chunk_dir / "meta.json", {
+            "length": self.length,
+            "chunk_size": self.chunk_size,
+            "obs_shape": list(self.obs_shape),
+            "info_keys": self.info_keys,
+            "compression": self.compression,
+            "keyframe_interval": self.keyframe_interval,
+        })
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """
+    Wrapper streaming the observations, actions, rewards and info fields of an env to chunked
+    on-disk arrays (see the module docstring for the format).
+    Rows are copied and queued, and written by a background thread. The queue is bounded so the
+    memory stays bounded: when the disk cannot keep up, the env waits for the writer.
+    """
+    def __init__(
+        self,
+        env: gym.Env,
+        root_dir: str,
+        chunk_size: int = 1000,
+        info_keys: Sequence[str] = ("gold",),
+        compression: str = "none",
+        keyframe_interval: int = 32,
+        max_pending: int = 64,
+    ):
+        """
+        Args:
+            env: The env to record
+            root_dir: Folder of the recording, created if needed. Each env records in a `<env_id>` subfolder
+                when the env has an `env_id`, so vector envs can share a root folder
+            chunk_size: Number of rows of a chunk
+            info_keys: Numeric info fields to record
+            compression: "none" for raw memory-mappable observations, "delta" for zlib compressed
+                differences between consecutive frames
+            keyframe_interval: With the delta compression, number of frames between two frames stored whole
+            max_pending: Maximum number of rows waiting to be written
+        """
+        super().__init__(env)
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+
+        env_id = getattr(env.unwrapped, "env_id", None)
+        self.record_dir = Path(root_dir) / env_id if env_id else Path(root_dir)
+        self.record_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.info_keys = list(info_keys)
+        self.compression = compression
+        self.keyframe_interval = keyframe_interval
+
+        self.episode_id = -1
+        self.step_id = 0
+        self._chunk_index = len(list(self.record_dir.glob("chunk_*")))  # Appends to an existing recording
+        self._chunk: Optional[_ChunkWriter] = None
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._write_loop, name=f"trajectory_recorder_{env_id}", daemon=True)
+        self._thread.start()
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        self.episode_id += 1
+        self.step_id = 0
+        self._record(observation, None, 0.0, False, False, info)
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self.step_id += 1
+        self._record(observation, action, reward, terminated, truncated, info)
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        super().close()
+
+    def _record(self, observation, action, reward, terminated, truncated, info) -> None:
+        if self._error is not None:
+            raise RuntimeError("Trajectory recorder failed") from self._error
+
+        row = {
+            "observation": np.array(observation, dtype=np.uint8, copy=True),
+            "action": None if action is None else np.asarray(action, dtype=np.int64),
+            "reward": reward,
+            "terminated": terminated,
+            "truncated": truncated,
+            "episode_id": self.episode_id,
+            "step": self.step_id,
+            "info": {key: float(info[key]) for key in self.info_keys if info.get(key) is not None},
+        }
+        self._queue.put(row)
+
+    def _write_loop(self) -> None:
+        try:
+            while True:
+                row = self._queue.get()
+                if row is None:
+                    break
+                if self._chunk is None:
+                    self._chunk = self._new_chunk(row)
+                self._chunk.write(row)
+                if self._chunk.is_full:
+                    self._chunk.close()
+                    self._chunk = None
+        except BaseException as e:
+            logger.error(f"Trajectory recorder failed: {e}")
+            self._error = e
+            # Keep draining so the env never blocks on a dead writer
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if self._chunk is not None:
+                self._chunk.close()
+                self._chunk = None
+
+    def _new_chunk(self, row: dict) -> _ChunkWriter:
+        chunk_dir = self.record_dir / CHUNK_DIR_FORMAT.format(self._chunk_index)
+        self._chunk_index += 1
+        action_shape = self.action_space.shape or ()
+        return _ChunkWriter(chunk_dir, self.chunk_size, row["observation"].shape, action_shape, self.info_keys,
+                            self.compression, self.keyframe_interval)
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import platform
+import time
+
+from playwright.async_api import Browser, Error as PlaywrightError
+
+from lotr2_rl.emulators.dos.browser_controller import BrowserController, BrowserFailureError
+from lotr2_rl.resources import resource_closed, resource_opened
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBrowserController(BrowserController):
+    """
+    Asyncio variant of BrowserController driving one page of a shared browser.
+    Used by the vector env to step many emulator pages concurrently from one process.
+    Configuration and mouse path generation are inherited, page interactions are coroutines.
+    There is no watchdog thread: the vector env bounds each step with asyncio.wait_for and calls
+    `recover` on failures, which only replaces the page, the shared browser being left to its owner.
+    """
+
+    async def start(self, browser: Browser) -> None:
+        """
+        Open a new context and page in an already launched browser.
+
+        Args:
+            browser: The shared Playwright browser
+        """
+        self.browser = browser
+        self.viewport_dimensions = {"width": 640, "height": 400} if platform.system() == "Darwin" else {"width": 700, "height": 475}
+        self.context = await browser.new_context(
+            viewport=self.viewport_dimensions,
+            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+        )
+        self.page = await self.context.new_page()
+        resource_opened("page")
+        self.page.on("crash", self._on_crash)
+        self._crashed = False
+        self._last_frame_count = None
+        self.current_mouse_position = (0, 0)
+        logger.info("Page started successfully")
+
+    async def close(self) -> None:
+        """
+        Close the page context, the shared browser is left to its owner.
+        """
+        if self.context:
+            try:
+                await self.context.close()
+            except PlaywrightError as e:
+                logger.warning(f"Context not closed cleanly: {e}")
+            resource_closed("page")
+        self.context = None
+        self.page = None
+        logger.info("Page closed successfully")
+
+    async def navigate(self, url: str) -> None:
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        await self.page.goto(url)
+        logger.info(f"Navigated to {url}")
+        self._last_frame_count = None
+
+        if self.lite:
+            await self.page.wait_for_function("() => window.dosIsReady && window.dosIsReady()", timeout=30000)
+            await self.pause_emulation()
+
+    async def check_health(self) -> None:
+        """
+        Check that the emulator still produces frames, see BrowserController.check_health.
+
+        Raises:
+            BrowserFailureError: If no frame was emulated for `frozen_timeout_s`
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        frame_count = await self.page.evaluate("() => window.dosFrameCount ? window.dosFrameCount() : -1")
+        now = time.monotonic()
+        if frame_count < 0 or frame_count != self._last_frame_count or self.lite:
+            self._last_frame_count = frame_count
+            self._last_frame_time = now
+        elif now - self._last_frame_time > self.frozen_timeout_s:
+            raise BrowserFailureError(f"Emulator frozen at frame {frame_count} for {now - self._last_frame_time:.1f}s")
+
+    async def recover(self, url: str, timeout_s: float) -> str:
+        """
+        Bring the page back to a usable state after a failure, trying in turn to reload the page,
+        then to open a new context in the shared browser. The game restarts from the given page.
+
+        Args:
+            url: URL of the emulator page
+            timeout_s: Maximum duration of each attempt
+
+        Returns:
+            The recovery that worked: "reload" or "new_context"
+
+        Raises:
+            BrowserFailureError: If the shared browser itself is unusable
+        """
+        if not self._crashed:
+            try:
+                await asyncio.wait_for(self._reload(), timeout_s)
+                return self._recovered("reload")
+            except (asyncio.TimeoutError, PlaywrightError, ValueError) as e:
+                logger.warning(f"Page reload failed: {e}")
+
+        try:
+            await asyncio.wait_for(self.close(), timeout_s)
+        except asyncio.TimeoutError:
+            logger.warning("Context close timed out")
+            if self.context is not None:
+                resource_closed("page")
+            self.context = None
+            self.page = None
+        try:
+            await asyncio.wait_for(self.start(self.browser), timeout_s)
+            await asyncio.wait_for(self.navigate(url), timeout_s)
+        except (asyncio.TimeoutError, PlaywrightError, ValueError) as e:
+            raise BrowserFailureError(f"New context failed, the shared browser is unusable: {e}") from e
+        return self._recovered("new_context")
+
+    async def _reload(self) -> None:
+        await self.page.reload()
+        self._last_frame_count = None
+        await self.page.wait_for_function("() => window.dosIsReady && window.dosIsReady()", timeout=30000)
+        if self.lite:
+            await self.pause_emulation()
+
+    async def pre_load(self, game: str) -> None:
+        try:
+            for command, parts in self._read_preload_actions(game):
+                if command == "sleep":
+                    await self.wait(float(parts[1]))
+                elif command == "move_mouse":
+                    await self.move_mouse(float(parts[1]), float(parts[2]))
+                elif command == "click":
+                    await self.click(float(parts[1]), float(parts[2]))
+                elif command == "press_key":
+                    await self.press_key(parts[1])
+                else:
+                    logger.info(f"Unknown command: {command}")
+        except FileNotFoundError:
+            logger.warning(f"Warning: No preload configuration found at configs/{game}/preload.txt")
+
+    async def pause_emulation(self) -> None:
+        await self.page.evaluate("() => window.dosPause()")
+
+    async def advance_frames(self, frames: int) -> int:
+        if frames <= 0:
+            return await self.page.evaluate("() => window.dosFrameCount()")
+
+        with self.profiler.phase("emulate"):
+            frame_count = await self.page.evaluate(
+                "([frames, timeoutMs]) => window.dosStep(frames, timeoutMs)",
+                [frames, self.step_timeout_ms],
+            )
+        if frame_count < 0:
+            raise ValueError("Emulator not ready")
+        return frame_count
+
+    async def advance_ms(self, milliseconds: float) -> int:
+        frames = max(1, round(milliseconds * self.emulated_fps / 1000))
+        return await self.advance_frames(frames)
+
+    async def wait(self, seconds: float) -> None:
+        if self.lite:
+            await self.advance_ms(seconds * 1000)
+        else:
+            await asyncio.sleep(seconds)
+
+    async def get_screenshot(self) -> bytes:
+        if not self.page:
+            raise ValueError("Browser not started")
+        with self.profiler.phase("screenshot"):
+            return await self.page.screenshot(type="jpeg", quality=100)
+
+    async def move_mouse(self, x: float, y: float) -> None:
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        start_x, start_y = self.current_mouse_position
+        with self.profiler.phase("mouse_path"):
+            for point_x, point_y in self._mouse_path(start_x, start_y, x, y):
+                await self.page.mouse.move(point_x, point_y)
+                if not self.lite:
+                    await asyncio.sleep(0.001)
+
+        self.current_mouse_position = (x, y)
+
+    async def click(self, x: float, y: float, options: dict = None) -> None:
+        await self.move_mouse(x, y)
+        await self.wait(0.1)
+        await self.page.mouse.down()
+        await self.wait(0.05)
+        await self.page.mouse.up()
+
+    async def press_key(self, key: str, delay_ms: float = 100) -> None:
+        if not self.page:
+            raise ValueError("Browser not started")
+        await self.page.keyboard.press(key, delay=delay_ms)
@@ -2,14 +2,32 @@
 
 import asyncio
 import base64
+import functools
 import logging
 import math
 import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List, Optional, Tuple, Union
 import platform
 
-from playwright.sync_api import sync_playwright, Browser, BrowserContext, Page
+import cv2
+import numpy as np
+from playwright.sync_api import sync_playwright, Browser, BrowserContext, Page, Error as PlaywrightError
+
+from lotr2_rl.profiler import StepProfiler
+from lotr2_rl.resources import (
+    get_browser_tag_arg,
+    kill_browser,
+    kill_orphaned_browsers,
+    new_browser_tag,
+    register_browser,
+    resource_closed,
+    resource_opened,
+    unregister_browser,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -18,17 +36,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class BrowserFailureError(RuntimeError):
+    """
+    The browser or the emulator page hung, crashed or froze. The page state is lost,
+    `BrowserController.recover` brings the controller back to a usable state.
+    """
+
+
+def _watched(method):
+    """
+    Run a BrowserController method under the watchdog deadline, and turn the failures of
+    the browser into BrowserFailureError. Nested calls share the deadline of the outer call,
+    which calls with their own timeout (see _extend_deadline) push back.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._deadline is not None:
+            return method(self, *args, **kwargs)
+
+        self._deadline = (time.monotonic() + self.call_timeout_s, method.__name__, self.call_timeout_s)
+        try:
+            result = method(self, *args, **kwargs)
+        except PlaywrightError as e:
+            reason = self._watchdog_reason or ("page crashed" if self._crashed else f"{method.__name__} failed: {e}")
+            raise BrowserFailureError(reason) from e
+        finally:
+            self._deadline = None
+
+        if self._watchdog_reason:
+            raise BrowserFailureError(self._watchdog_reason)
+        return result
+    return wrapper
+
+
 class BrowserController:
     """
     Controller for browser interactions using Playwright.
     Implements human-like mouse movements and interactions.
     """
-    def __init__(self, headless: bool = False):
+    def __init__(
+        self,
+        headless: bool = False,
+        lite: bool = False,
+        frames_per_action: int = 4,
+        emulated_fps: float = 70.0,
+        step_timeout_ms: int = 5000,
+        num_screenshots_per_action: int = 5,
+        screenshot_interval_frames: int = 4,
+        press_key_delay: int = 100,
+        log_dir: Optional[Path] = None,
+        save_screenshots: bool = False,
+        profiler: Optional[StepProfiler] = None,
+        input_mode: str = "human",
+        call_timeout_s: float = 30.0,
+        frozen_timeout_s: float = 10.0,
+    ):
         """
         Initialize the browser controller.
         
         Args:
             headless: Whether to run the browser in headless mode
+            lite: Whether to keep the emulator paused and advance it explicitly
+                (requires the lite HTML template)
+            frames_per_action: Number of emulated frames advanced after each action in lite mode
+            emulated_fps: Frame rate used to convert emulated milliseconds to frames
+            step_timeout_ms: Wall-clock timeout for a single frame-stepping request
+            num_screenshots_per_action: Number of frames captured after each action in lite mode
+            screenshot_interval_frames: Emulated frames between two captures of a burst
+            press_key_delay: The delay in milliseconds when pressing keys from an action
+            log_dir: Directory where screenshots are saved when `save_screenshots` is enabled
+            save_screenshots: Whether to persist lite mode screenshots to disk in the background
+            profiler: Profiler timing the browser interactions, disabled by default
+            input_mode: "human" to move the mouse along a human-like path,
+                "direct" to jump to the target with a single move event
+            call_timeout_s: Deadline of a single browser call, after which the watchdog kills the browser
+            frozen_timeout_s: Wall-clock time without any new emulated frame after which the emulator is frozen
         """
         self.headless = headless
         self.playwright = None
@@ -38,7 +121,34 @@ class BrowserController:
         self.current_mouse_position = (0, 0)
         self.paused = False
         self.pause_task = None  # Add this to track the pause task
-        self.lite = False  # Whether to run in lite mode
+        self.lite = lite  # Whether to run in lite mode
+        self.frames_per_action = frames_per_action
+        self.emulated_fps = emulated_fps
+        self.step_timeout_ms = step_timeout_ms
+        self.num_screenshots_per_action = num_screenshots_per_action
+        self.screenshot_interval_frames = screenshot_interval_frames
+        self.press_key_delay = press_key_delay
+        self.log_dir = log_dir
+        self.save_screenshots = save_screenshots
+        self.lite_counter = 0
+        self._screenshot_writer = None  # Background writer, created on first save
+        self.profiler = profiler or StepProfiler(enabled=False)
+        if input_mode not in ("human", "direct"):
+            raise ValueError(f"Unknown input mode: {input_mode}")
+        self.input_mode = input_mode
+
+        # Watchdog: a thread kills the browser processes when a call outlives its deadline,
+        # so the blocked call fails instead of stalling the env (see _watched and recover)
+        self.call_timeout_s = call_timeout_s
+        self.frozen_timeout_s = frozen_timeout_s
+        self._deadline: Optional[Tuple[float, str, float]] = None
+        self._watchdog_reason: Optional[str] = None
+        self._watchdog_thread = None
+        self._watchdog_stop = threading.Event()
+        self._browser_tag: Optional[str] = None
+        self._crashed = False
+        self._last_frame_count = None
+        self._last_frame_time = 0.0
     
     @property
     def is_running(self) -> bool:
@@ -57,22 +167,11 @@ class BrowserController:
         Args:
             game: Name of the game to preload
         """
-        config_path = f"configs/{game}/preload.txt"
         try:
-            with open(config_path, 'r') as f:
-                actions = f.readlines()
-            
-            for action in actions:
-                action = action.strip()
-                if not action or action.startswith('#'):
-                    continue
-                    
-                parts = action.split()
-                command = parts[0].lower()
-                
+            for command, parts in self._read_preload_actions(game):
                 if command == "sleep":
                     seconds = float(parts[1])
-                    time.sleep(seconds)
+                    self.wait(seconds)
                     logger.info(f"Waited for {seconds} seconds")
                     
                 elif command == "move_mouse":
@@ -94,39 +193,128 @@ class BrowserController:
                     logger.info(f"Unknown command: {command}")
                     
         except FileNotFoundError:
-            logger.warning(f"Warning: No preload configuration found at {config_path}")
+            logger.warning(f"Warning: No preload configuration found at configs/{game}/preload.txt")
         except Exception as e:
             logger.error(f"Error executing preload actions: {e}")
 
+    @staticmethod
+    def _read_preload_actions(game: str) -> List[Tuple[str, List[str]]]:
+        """
+        Parse the preload config file of a game.
+        
+        Args:
+            game: Name of the game to preload
+            
+        Returns:
+            The list of (command, parts) of each action line
+        """
+        config_path = f"configs/{game}/preload.txt"
+        with open(config_path, 'r') as f:
+            actions = f.readlines()
+
+        parsed_actions = []
+        for action in actions:
+            action = action.strip()
+            if not action or action.startswith('#'):
+                continue
+
+            parts = action.split()
+            parsed_actions.append((parts[0].lower(), parts))
+        return parsed_actions
+
     def start(self) -> None:
         """
         Start the browser.
         """
         self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=self.headless, args=["--disable-web-security"])
+        # The tag finds the Chromium processes of this browser, killed by the watchdog
+        self._browser_tag = new_browser_tag()
+        self.browser = self.playwright.chromium.launch(
+            headless=self.headless, args=["--disable-web-security", get_browser_tag_arg(self._browser_tag)]
+        )
+        register_browser(self, self._browser_tag)
+        resource_opened("browser")
 
         self.viewport_dimensions = {"width": 640, "height": 400} if platform.system() == "Darwin" else {"width": 700, "height": 475}
+        self._new_page()
+
+        if self._watchdog_thread is None:
+            self._watchdog_stop.clear()
+            self._watchdog_thread = threading.Thread(target=self._watchdog_loop, name="browser_watchdog", daemon=True)
+            self._watchdog_thread.start()
+        
+        logger.info("Browser started successfully")
+
+    def _new_page(self) -> None:
+        """
+        Open a new context and page in the browser.
+        """
         self.context = self.browser.new_context(
             viewport=self.viewport_dimensions,
             user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
         )
         self.page = self.context.new_page()
-        
+        resource_opened("page")
+        self.page.on("crash", self._on_crash)
+        self._crashed = False
+        self._last_frame_count = None
+
         # Set initial mouse position
         self.current_mouse_position = (0, 0)
-        
-        logger.info("Browser started successfully")
+
+    def _close_context(self) -> None:
+        if self.context is None:
+            return
+        try:
+            self.context.close()
+        except PlaywrightError as e:
+            logger.warning(f"Context not closed cleanly: {e}")
+        self.context = None
+        self.page = None
+        resource_closed("page")
+
+    def _on_crash(self, page) -> None:
+        logger.error("Page crashed")
+        self._crashed = True
+
+    def _watchdog_loop(self) -> None:
+        while not self._watchdog_stop.wait(0.1):
+            deadline = self._deadline
+            if deadline is None or self._watchdog_reason or time.monotonic() < deadline[0]:
+                continue
+            self._watchdog_reason = f"{deadline[1]} exceeded its {deadline[2]:.0f}s deadline"
+            logger.error(f"Watchdog: {self._watchdog_reason}, killing the browser")
+            kill_browser(self._browser_tag)
         
     def close(self) -> None:
         """
         Close the browser.
         """
+        self._watchdog_stop.set()
+        if self._watchdog_thread:
+            self._watchdog_thread.join()
+            self._watchdog_thread = None
         if self.browser:
-            self.browser.close()
+            self._close_context()
+            # Killed before the close, which would otherwise hang on a stuck browser
+            kill_browser(self._browser_tag)
+            try:
+                self.browser.close()
+            except PlaywrightError as e:
+                logger.warning(f"Browser not closed cleanly: {e}")
+            unregister_browser(self)
+            resource_closed("browser")
         if self.playwright:
             self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self._browser_tag = None
+        if self._screenshot_writer:
+            self._screenshot_writer.shutdown(wait=True)
+            self._screenshot_writer = None
         logger.info("Browser closed successfully")
         
+    @_watched
     def navigate(self, url: str) -> None:
         """
         Navigate to a URL.
@@ -139,7 +327,199 @@ class BrowserController:
         
         self.page.goto(url)
         logger.info(f"Navigated to {url}")
+        self._last_frame_count = None
+
+        if self.lite:
+            self.wait_until_ready()
+            self.pause_emulation()
+
+    @_watched
+    def wait_until_ready(self, timeout_ms: float = 30000) -> None:
+        """
+        Wait until the js-dos command interface is available in the page.
+        
+        Args:
+            timeout_ms: Maximum time to wait in milliseconds
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        # A slow but healthy boot must end with the timeout of Playwright, not with the watchdog
+        self._extend_deadline(timeout_ms / 1000)
+        self.page.wait_for_function("() => window.dosIsReady && window.dosIsReady()", timeout=timeout_ms)
+        logger.info("Emulator is ready")
+
+    def _extend_deadline(self, timeout_s: float) -> None:
+        """
+        Give the current watched call, or the outer call it is nested in, the time of a call with
+        its own timeout, plus the usual call deadline.
+
+        Args:
+            timeout_s: Timeout of the call
+        """
+        deadline = self._deadline
+        if deadline is None:
+            return
+        end = time.monotonic() + timeout_s + self.call_timeout_s
+        if end > deadline[0]:
+            self._deadline = (end, deadline[1], deadline[2] + end - deadline[0])
+
+    @_watched
+    def check_health(self) -> None:
+        """
+        Check that the emulator still produces frames. In lite mode frames only advance with
+        `advance_frames`, which does the check itself.
+        
+        Raises:
+            BrowserFailureError: If no frame was emulated for `frozen_timeout_s`
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        frame_count = self.page.evaluate("() => window.dosFrameCount ? window.dosFrameCount() : -1")
+        now = time.monotonic()
+        if frame_count < 0 or frame_count != self._last_frame_count or self.lite:
+            # Page without frame counter, or the emulator is running
+            self._last_frame_count = frame_count
+            self._last_frame_time = now
+        elif now - self._last_frame_time > self.frozen_timeout_s:
+            raise BrowserFailureError(f"Emulator frozen at frame {frame_count} for {now - self._last_frame_time:.1f}s")
+
+    def recover(self, url: str) -> str:
+        """
+        Bring the controller back to a usable state after a BrowserFailureError, trying in turn
+        to reload the page, to open a new context, then to relaunch the browser.
+        The game restarts from the given page, its previous state is lost.
         
+        Args:
+            url: URL of the emulator page
+            
+        Returns:
+            The recovery that worked: "reload", "new_context" or "relaunch"
+        """
+        self._watchdog_reason = None
+        browser_alive = self.browser is not None and self.browser.is_connected() and not self._crashed
+
+        if browser_alive:
+            try:
+                self._reload()
+                return self._recovered("reload")
+            except (BrowserFailureError, PlaywrightError, ValueError) as e:
+                logger.warning(f"Page reload failed: {e}")
+                self._watchdog_reason = None
+
+            try:
+                self._close_context()
+                self._new_page()
+                self.navigate(url)
+                return self._recovered("new_context")
+            except (BrowserFailureError, PlaywrightError, ValueError) as e:
+                logger.warning(f"New context failed: {e}")
+                self._watchdog_reason = None
+
+        self.close()
+        # A browser whose driver died may leave Chromium processes that close could not reach
+        kill_orphaned_browsers()
+        self.start()
+        self.navigate(url)
+        return self._recovered("relaunch")
+
+    @_watched
+    def _reload(self) -> None:
+        self.page.reload()
+        self._last_frame_count = None
+        self.wait_until_ready()
+        if self.lite:
+            self.pause_emulation()
+
+    def _recovered(self, recovery: str) -> str:
+        logger.warning(f"Browser recovered with: {recovery}")
+        self._crashed = False
+        return recovery
+
+    @_watched
+    def pause_emulation(self) -> None:
+        """
+        Pause the emulator until it is explicitly advanced or resumed.
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        self.page.evaluate("() => window.dosPause()")
+        logger.info("Emulator paused")
+
+    @_watched
+    def resume_emulation(self) -> None:
+        """
+        Resume the emulator in real time.
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        self.page.evaluate("() => window.dosResume()")
+        logger.info("Emulator resumed")
+
+    @_watched
+    def advance_frames(self, frames: int) -> int:
+        """
+        Run the paused emulator for exactly the given number of frames, then pause it again.
+        The call returns as soon as the frames are emulated, so a step takes as long as the
+        host needs to emulate them instead of a fixed wall-clock duration.
+        
+        Args:
+            frames: Number of emulated frames to advance
+            
+        Returns:
+            The emulator frame counter after the step
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        if frames <= 0:
+            return self.page.evaluate("() => window.dosFrameCount()")
+
+        with self.profiler.phase("emulate"):
+            frame_count = self.page.evaluate(
+                "([frames, timeoutMs]) => window.dosStep(frames, timeoutMs)",
+                [frames, self.step_timeout_ms],
+            )
+        if frame_count < 0:
+            raise ValueError("Emulator not ready")
+        if frame_count == self._last_frame_count:
+            # Not a single frame was emulated before the step timeout
+            raise BrowserFailureError(f"Emulator frozen at frame {frame_count}")
+        self._last_frame_count = frame_count
+
+        logger.info(f"Advanced {frames} frames (frame count: {frame_count})")
+        return frame_count
+
+    def advance_ms(self, milliseconds: float) -> int:
+        """
+        Run the paused emulator for the given amount of emulated time.
+        
+        Args:
+            milliseconds: Emulated time to advance, converted to frames with `emulated_fps`
+            
+        Returns:
+            The emulator frame counter after the step
+        """
+        frames = max(1, round(milliseconds * self.emulated_fps / 1000))
+        return self.advance_frames(frames)
+
+    def wait(self, seconds: float) -> None:
+        """
+        Let the game run for the given duration: emulated time in lite mode, wall-clock otherwise.
+        
+        Args:
+            seconds: Duration to wait in seconds
+        """
+        if self.lite:
+            self.advance_ms(seconds * 1000)
+        else:
+            with self.profiler.phase("sleep"):
+                time.sleep(seconds)
+        
+    @_watched
     def get_screenshot(self) -> bytes:
         """
         Get a screenshot of the current page.
@@ -151,10 +531,84 @@ class BrowserController:
             raise ValueError("Browser not started")
         
         # Capture screenshot in JPEG format
-        screenshot = self.page.screenshot(type="jpeg", quality=100)
+        with self.profiler.phase("screenshot"):
+            screenshot = self.page.screenshot(type="jpeg", quality=100)
         logger.info("Screenshot captured")
         return screenshot
+
+    def read_text(self, crowns_image: np.ndarray) -> Optional[str]:
+        """
+        Get the crowns text of a frame when the controller knows it, replacing the OCR.
+        The text of a real game frame is never known.
+
+        Args:
+            crowns_image: The crowns region of an observation
+
+        Returns:
+            None, the text is read by OCR
+        """
+        return None
+
+    def capture_burst(self, num_frames: int, interval_frames: int = 1) -> np.ndarray:
+        """
+        Capture several frames into a preallocated array.
+        In lite mode frames are exactly `interval_frames` emulated frames apart,
+        otherwise the interval is converted to wall-clock time with `emulated_fps`.
+        
+        Args:
+            num_frames: Number of frames to capture
+            interval_frames: Number of emulated frames between two captures
+            
+        Returns:
+            A (N, H, W, C) uint8 array of BGR frames
+        """
+        if not self.page:
+            raise ValueError("Browser not started")
+
+        height = self.viewport_dimensions["height"]
+        width = self.viewport_dimensions["width"]
+        frames = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+        encoded = []
+
+        for i in range(num_frames):
+            if i > 0:
+                if self.lite:
+                    self.advance_frames(interval_frames)
+                else:
+                    time.sleep(interval_frames / self.emulated_fps)
+
+            screenshot = self.get_screenshot()
+            with self.profiler.phase("decode"):
+                frames[i] = cv2.imdecode(np.frombuffer(screenshot, np.uint8), cv2.IMREAD_COLOR)
+            encoded.append(screenshot)
+
+        if self.save_screenshots and self.log_dir is not None:
+            self._save_screenshots_async(encoded)
+
+        return frames
+
+    def _save_screenshots_async(self, screenshots: List[bytes]) -> None:
+        """
+        Write JPEG screenshots to the log directory on a background thread.
+        
+        Args:
+            screenshots: The encoded screenshots to write
+        """
+        if self._screenshot_writer is None:
+            self._screenshot_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot_writer")
+
+        start_index = self.lite_counter + 1
+        self.lite_counter += len(screenshots)
+        self._screenshot_writer.submit(self._write_screenshots, self.log_dir / "lite_screenshots", start_index, screenshots)
+
+    @staticmethod
+    def _write_screenshots(screenshot_dir: Path, start_index: int, screenshots: List[bytes]) -> None:
+        screenshot_dir.mkdir(parents=True, exist_ok=True)
+        for i, screenshot in enumerate(screenshots):
+            with open(screenshot_dir / f"screenshot_{start_index + i}.jpg", "wb") as f:
+                f.write(screenshot)
         
+    @_watched
     def move_mouse(self, x: float, y: float) -> None:
         """
         Move the mouse to the specified coordinates with human-like movement.
@@ -173,13 +627,16 @@ class BrowserController:
         #     return  # No movement needed
 
         # Generate a human-like path for the mouse movement
-        path = self._generate_human_like_path(start_x, start_y, x, y)
+        path = self._mouse_path(start_x, start_y, x, y)
         
         # Move the mouse along the path
-        for point_x, point_y in path:
-            self.page.mouse.move(point_x, point_y)
-            # Add a small delay to simulate human movement speed
-            time.sleep(0.001)
+        with self.profiler.phase("mouse_path"):
+            for point_x, point_y in path:
+                self.page.mouse.move(point_x, point_y)
+                # Add a small delay to simulate human movement speed
+                # (no emulated time passes while paused in lite mode)
+                if not self.lite:
+                    time.sleep(0.001)
         
         # Update current mouse position
         self.current_mouse_position = (x, y)
@@ -205,6 +662,7 @@ class BrowserController:
         x, y = self.current_mouse_position
         self.move_mouse(x, y + 10)
         
+    @_watched
     def click(self, x: float, y: float, options: dict = None) -> None:
         """
         Click at the specified coordinates with human-like movement.
@@ -223,7 +681,7 @@ class BrowserController:
         self.move_mouse(x, y)
         
         # Add a small delay before clicking (like a human would)
-        time.sleep(0.1)
+        self.wait(0.1)
         
         # Apply click options
         # if options:
@@ -232,11 +690,12 @@ class BrowserController:
         #     await self.page.mouse.click(x, y)
 
         self.page.mouse.down()
-        time.sleep(0.05)
+        self.wait(0.05)
         self.page.mouse.up()
         
         logger.info(f"Clicked at ({x}, {y}) with options: {options}")
         
+    @_watched
     def drag(self, x: float, y: float) -> None:
         """
         Drag from current position to the specified coordinates.
@@ -255,13 +714,14 @@ class BrowserController:
         self.page.mouse.down()
         
         # Generate a human-like path for the drag movement
-        path = self._generate_human_like_path(start_x, start_y, x, y)
+        path = self._mouse_path(start_x, start_y, x, y)
         
         # Move the mouse along the path
         for point_x, point_y in path:
             self.page.mouse.move(point_x, point_y)
             # Add a small delay to simulate human movement speed
-            time.sleep(random.uniform(0.005, 0.01))
+            if not self.lite:
+                time.sleep(random.uniform(0.005, 0.01))
         
         # Release mouse button at target position
         self.page.mouse.up()
@@ -296,6 +756,7 @@ class BrowserController:
         self.page.mouse.wheel(0, -amount)
         logger.info(f"Scrolled up {amount} pixels")
         
+    @_watched
     def type_text(self, text: str) -> None:
         """
         Type text with human-like timing.
@@ -310,10 +771,11 @@ class BrowserController:
         for char in text:
             self.page.keyboard.press(char)
             # Add a random delay between keystrokes
-            time.sleep(random.uniform(0.05, 0.15))
+            self.wait(random.uniform(0.05, 0.15))
 
         logger.info(f"Typed: {text}")
     
+    @_watched
     def press_key(self, key: str, 
                         lite_mode: bool = False, 
                         delay_ms: float = 100) -> None:
@@ -350,6 +812,17 @@ class BrowserController:
         
         logger.info(f"Pressed key: {key}")
 
+    def _mouse_path(self, start_x: float, start_y: float, end_x: float, end_y: float) -> List[Tuple[float, float]]:
+        """
+        Get the mouse positions of a move for the input mode.
+        
+        Returns:
+            A list of (x, y) coordinates ending at the target
+        """
+        if self.input_mode == "direct":
+            return [(end_x, end_y)]
+        return self._generate_human_like_path(start_x, start_y, end_x, end_y)
+
     def _generate_human_like_path(
         self, 
         start_x: float, 
@@ -452,9 +925,7 @@ class BrowserController:
             result = None
             screenshots = []
             if self.lite:
-                logger.info("Lite mode is enabled, pausing game with Alt+Pause key...")
-                self.press_key("Alt+Pause", delay_ms=0)
-                time.sleep(0.01)
+                logger.info("Lite mode is enabled, the emulator stays paused during the action")
 
             if action == "nope":
                 logger.info("Agent decided to skip this step.")
@@ -519,10 +990,7 @@ class BrowserController:
                     keys = action_input.split(",")
                     for key in keys:
                         self.press_key(key.strip(), lite_mode=self.lite, delay_ms=self.press_key_delay)
-                        for _ in range(self.num_screenshots_per_action): 
-                            screenshot = self.get_screenshot()
-                            screenshots.append(screenshot)
-                            time.sleep(0.05) 
+                        screenshots.append(self.capture_burst(self.num_screenshots_per_action, self.screenshot_interval_frames))
                     result = f"Pressed keys: {action_input}"
                 else:
                     self.press_key(action_input, lite_mode=self.lite, delay_ms=self.press_key_delay)
@@ -550,38 +1018,27 @@ class BrowserController:
 
             if self.lite:
                 start_time = time.time()
-                # Take screenshots for approximately 0.3 seconds
-                for _ in range(5):  # 3 * 0.1s = 0.3s
-                    screenshot = self.get_screenshot()
-                    screenshots.append(screenshot)
-                    time.sleep(0.05) 
-
-                # Pause game
-                self.press_key("Alt+Pause", delay_ms=0)
-
+                # Let the action take effect, then capture frames at a fixed emulated interval
+                self.advance_frames(self.frames_per_action)
+                if self.num_screenshots_per_action > 0:
+                    screenshots.append(self.capture_burst(self.num_screenshots_per_action, self.screenshot_interval_frames))
                 duration = time.time() - start_time
 
-                for i, screenshot in enumerate(screenshots):
-                    self.lite_counter += 1
-                    screenshot_dir = self.log_dir / "lite_screenshots"
-                    monitor_dir = screenshot_dir / "monitor"
-                    screenshot_dir.mkdir(exist_ok=True)
-                    monitor_dir.mkdir(exist_ok=True)
-                    screenshot_path = screenshot_dir / f"screenshot_{self.lite_counter}.jpg"
-                    with open(screenshot_path, "wb") as f:
-                        f.write(screenshot)
-                duration = time.time() - start_time
+                logger.info(f"Stepped for {duration:.2f}s and took {sum(len(burst) for burst in screenshots)} screenshots")
 
-                logger.info(f"Paused for {duration:.2f}s and took {len(screenshots)} screenshots")
+            if len(screenshots) == 1:
+                screenshots = screenshots[0]
+            elif len(screenshots) > 1:
+                screenshots = np.concatenate(screenshots)
 
             return result if result else f"Unknown action: {action}", screenshots
 
+        except BrowserFailureError:
+            # The page is lost, the caller has to recover it
+            raise
         except Exception as e:
             error_msg = f"Error executing action: {str(e)}"
             logger.error(error_msg)
             logger.error(error_msg)
             
-            if self.lite:
-                self.press_key("Alt+Pause", delay_ms=0)
-            
             return error_msg, None
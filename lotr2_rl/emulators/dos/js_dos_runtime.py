@@ -0,0 +1,101 @@
+"""
+Local copy of the js-dos runtime.
+
+Run `python -m lotr2_rl.emulators.dos.js_dos_runtime` once on a machine with network access
+to download the runtime, then copy the folder to air-gapped nodes if needed.
+DOSGameServer serves it under `JS_DOS_LOCAL_PATH` so pages load without any CDN round trip.
+"""
+import argparse
+import gzip
+import logging
+import shutil
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from lotr2_rl.consts import JS_DOS_CDN_URL, JS_DOS_LOCAL_PATH, JS_DOS_RUNTIME_FILES, JS_DOS_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUNTIME_DIR = Path(__file__).parent / "vendor" / "js-dos" / JS_DOS_VERSION
+
+
+def is_runtime_available(runtime_dir: Path = DEFAULT_RUNTIME_DIR) -> bool:
+    """
+    Check if all the required runtime files are present locally.
+
+    Args:
+        runtime_dir: Folder holding the runtime files
+
+    Returns:
+        True if the runtime can be served locally, False otherwise
+    """
+    return all((runtime_dir / name).is_file() for name, required in JS_DOS_RUNTIME_FILES.items() if required)
+
+
+def get_runtime_url(runtime_dir: Path = DEFAULT_RUNTIME_DIR) -> str:
+    """
+    Get the base URL the HTML templates should load js-dos from.
+
+    Args:
+        runtime_dir: Folder holding the runtime files
+
+    Returns:
+        The local path when the runtime is available, the CDN URL otherwise
+    """
+    if is_runtime_available(runtime_dir):
+        return JS_DOS_LOCAL_PATH
+
+    logger.warning(f"js-dos runtime not found in {runtime_dir}, falling back to {JS_DOS_CDN_URL}")
+    return JS_DOS_CDN_URL
+
+
+def download_runtime(runtime_dir: Path = DEFAULT_RUNTIME_DIR, base_url: str = JS_DOS_CDN_URL, force: bool = False) -> Path:
+    """
+    Download the runtime files and store a gzip copy next to each one,
+    so the server can send precompressed responses.
+
+    Args:
+        runtime_dir: Folder where the runtime files are stored
+        base_url: URL of the runtime version folder
+        force: Whether to download files that are already present
+
+    Returns:
+        The runtime folder
+    """
+    for name, required in JS_DOS_RUNTIME_FILES.items():
+        path = runtime_dir / name
+        if path.is_file() and not force:
+            continue
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        url = f"{base_url}/{name}"
+        try:
+            with urllib.request.urlopen(url) as response, open(path.with_name(path.name + ".part"), "wb") as f:
+                shutil.copyfileobj(response, f)
+        except urllib.error.HTTPError as e:
+            if required:
+                raise
+            logger.warning(f"Optional runtime file {url} not downloaded: {e}")
+            continue
+
+        path.with_name(path.name + ".part").replace(path)
+        with open(path, "rb") as f_in, gzip.open(path.with_name(path.name + ".gz"), "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        logger.info(f"Downloaded {url}")
+
+    return runtime_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the js-dos runtime for offline use")
+    parser.add_argument("--runtime-dir", type=Path, default=DEFAULT_RUNTIME_DIR,
+                        help="Folder where the runtime files are stored")
+    parser.add_argument("--base-url", type=str, default=JS_DOS_CDN_URL,
+                        help="URL of the runtime version folder")
+    parser.add_argument("--force", action="store_true",
+                        help="Download files that are already present")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"js-dos runtime ready in {download_runtime(args.runtime_dir, args.base_url, args.force)}")
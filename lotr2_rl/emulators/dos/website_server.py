@@ -1,15 +1,30 @@
 ## Taken from https://github.com/alexzhang13/videogamebench
 
 import http.server
-import socketserver
 import logging
+import re
+import socket
 import threading
-import asyncio
+import time
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 import platform
 
 from playwright.async_api import async_playwright
 
+from lotr2_rl.consts import JS_DOS_LOCAL_PATH
+from lotr2_rl.emulators.dos.js_dos_runtime import DEFAULT_RUNTIME_DIR, get_runtime_url
+from lotr2_rl.folder_web_server import CachedFileRequestHandler, FileCache, ServerStats
+from lotr2_rl.resources import (
+    get_browser_tag_arg,
+    kill_browser,
+    new_browser_tag,
+    register_browser,
+    resource_closed,
+    resource_opened,
+    unregister_browser,
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -17,16 +32,124 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-env pages are served under /env/<env_id>/
+ENV_PATH_PATTERN = re.compile(r"^/env/([A-Za-z0-9_.-]+)(/.*)$")
+
+# Ports tried by allocate_port when a server needs its own port
+PORT_POOL = range(9000, 10000)
+
+
+def allocate_port(port_pool: range = PORT_POOL, host: str = "") -> int:
+    """
+    Find a free port by binding to each port of the pool in turn.
+    
+    Args:
+        port_pool: Candidate ports
+        host: Interface the port must be free on
+        
+    Returns:
+        The first port that could be bound
+    """
+    for port in port_pool:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            # Same option as the HTTP server, so ports in TIME_WAIT are not skipped
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((host, port))
+            except OSError:
+                continue
+            return port
+    raise RuntimeError(f"No free port in range [{port_pool.start}, {port_pool.stop})")
+
+
+_shared_server = None
+_shared_server_lock = threading.Lock()
+# Ids of the envs with a page on the shared server, which is stopped when the last one is closed
+_shared_server_envs = set()
+
+
+def get_shared_server() -> "DOSGameServer":
+    """
+    Get the game server shared by every env of this process, starting it on a free port if needed.
+    Envs register their page on it with `DOSGameServer.register_env`.
+    
+    Returns:
+        The running shared server
+    """
+    with _shared_server_lock:
+        return _get_shared_server()
+
+
+def _get_shared_server() -> "DOSGameServer":
+    global _shared_server
+    if _shared_server is None or not _shared_server.is_running:
+        # Another process may bind the port between the check and the start, retry on the next one
+        for _ in range(10):
+            server = DOSGameServer(allocate_port())
+            try:
+                server.start()
+            except OSError as e:
+                logger.warning(f"Port {server.port} taken while starting the shared server: {e}")
+                continue
+            _shared_server = server
+            break
+        else:
+            raise RuntimeError("Could not start the shared game server")
+    return _shared_server
+
+
+def register_shared_env(env_id: str, game_url: str, lite: bool = False) -> Tuple["DOSGameServer", str]:
+    """
+    Serve the page of an env on the shared server, starting the server if needed.
+    
+    Args:
+        env_id: Unique id of the env
+        game_url: URL to the js-dos game bundle
+        lite: Whether to serve the lite HTML template
+        
+    Returns:
+        The shared server and the URL of the env page
+    """
+    with _shared_server_lock:
+        server = _get_shared_server()
+        url = server.register_env(env_id, game_url, lite=lite)
+        _shared_server_envs.add(env_id)
+        return server, url
+
+
+def unregister_shared_env(env_id: str) -> None:
+    """
+    Stop serving the page of an env, and stop the shared server once no env uses it.
+    
+    Args:
+        env_id: Id given to `register_shared_env`
+    """
+    global _shared_server
+    with _shared_server_lock:
+        if env_id not in _shared_server_envs:
+            return
+        _shared_server_envs.discard(env_id)
+        if _shared_server is None:
+            return
+        _shared_server.unregister_env(env_id)
+        if not _shared_server_envs:
+            _shared_server.stop()
+            _shared_server = None
+
+
 class DOSGameServer:
     """
-    Simple HTTP server for hosting js-dos games.
+    Threaded HTTP server for hosting js-dos games.
+    Static files are served from an in-memory cache so concurrent emulators do not serialize.
     """
-    def __init__(self, port: int = 8000, lite: bool = False):
+    def __init__(self, port: int = 8000, lite: bool = False, runtime_dir: Path = DEFAULT_RUNTIME_DIR):
         """
         Initialize the DOS game server.
         
         Args:
             port: The port to run the server on
+            lite: Whether to serve the lite (frame-stepping) HTML template
+            runtime_dir: Folder of the local js-dos runtime, served under JS_DOS_LOCAL_PATH
         """
         self.port = port
         self.server = None
@@ -36,29 +159,44 @@ class DOSGameServer:
         self.browser = None
         self.context = None
         self.page = None
+        self._browser_tag = None
         self.lite_mode = lite
+        self.runtime_dir = Path(runtime_dir)
+        self.stats = ServerStats()
+        self.file_cache = FileCache()
+        self._pages: Dict[str, bytes] = {}  # HTML pages by path prefix, "" being the root page
+        self._pages_lock = threading.Lock()
 
-    def start(self, game_url: str, custom_html: str = None) -> str:
+    def start(self, game_url: Optional[str] = None, custom_html: str = None) -> str:
         """
         Start the server with the specified game.
         
         Args:
-            game_url: URL to the js-dos game bundle
+            game_url: URL to the js-dos game bundle served at the root page,
+                None to only serve pages added with `register_env`
+            custom_html: HTML page served instead of the templates
             
         Returns:
             The URL to access the game
         """
+        if game_url is not None or custom_html:
+            self._set_page("", self._render_html(game_url, custom_html, self.lite_mode))
+
         if self.is_running:
             logger.warning("Server is already running")
             return f"http://localhost:{self.port}"
             
-        # Create a custom request handler with the game URL
-        handler = self._create_request_handler(game_url, custom_html, self.lite_mode)
+        # Create a custom request handler serving the registered pages
+        handler = self._create_request_handler()
         
         # Create and start the server
         print(f"Starting server on port {self.port}...")
-        self.server = socketserver.TCPServer(("", self.port), handler)
+        self.server = http.server.ThreadingHTTPServer(("", self.port), handler)
+        self.server.daemon_threads = True
+        self.server.file_cache = self.file_cache
+        self.server.stats = self.stats
         self.is_running = True
+        resource_opened("server")
         
         # Run the server in a separate thread
         self.server_thread = threading.Thread(target=self.server.serve_forever)
@@ -67,24 +205,115 @@ class DOSGameServer:
         
         logger.info(f"Server started at http://localhost:{self.port}")
         return f"http://localhost:{self.port}"
+
+    def register_env(self, env_id: str, game_url: str, custom_html: str = None, lite: Optional[bool] = None) -> str:
+        """
+        Serve a page for one env under `/env/<env_id>/`.
+        
+        Args:
+            env_id: Unique id of the env, made of letters, digits, '_', '.' or '-'
+            game_url: URL to the js-dos game bundle
+            custom_html: HTML page served instead of the templates
+            lite: Whether to serve the lite HTML template, defaults to the server setting
+            
+        Returns:
+            The URL of the env page
+        """
+        if not ENV_PATH_PATTERN.match(f"/env/{env_id}/"):
+            raise ValueError(f"Invalid env id: {env_id}")
+
+        lite = self.lite_mode if lite is None else lite
+        self._set_page(f"/env/{env_id}", self._render_html(game_url, custom_html, lite))
+        logger.info(f"Registered env {env_id}")
+        return f"http://localhost:{self.port}/env/{env_id}/"
+
+    def register_test_page(self, env_id: str = "synthetic_canvas", fps: float = 70.0) -> str:
+        """
+        Serve the synthetic canvas page under `/env/<env_id>/`, to benchmark the browser layer
+        without emulator, game or network.
+        
+        Args:
+            env_id: Id of the page
+            fps: Frame rate of the canvas while it is not paused
+            
+        Returns:
+            The URL of the page
+        """
+        from lotr2_rl.consts import SYNTHETIC_CANVAS_HTML_TEMPLATE
+
+        return self.register_env(env_id, None, custom_html=SYNTHETIC_CANVAS_HTML_TEMPLATE.format(fps=fps))
+
+    def unregister_env(self, env_id: str) -> None:
+        """
+        Stop serving the page of an env.
+        
+        Args:
+            env_id: Id given to `register_env`
+        """
+        with self._pages_lock:
+            self._pages.pop(f"/env/{env_id}", None)
+        logger.info(f"Unregistered env {env_id}")
+
+    def _set_page(self, prefix: str, html_content: str) -> None:
+        with self._pages_lock:
+            self._pages[prefix] = html_content.encode()
+
+    def _get_page(self, prefix: str) -> Optional[bytes]:
+        with self._pages_lock:
+            return self._pages.get(prefix)
+
+    def _render_html(self, game_url: str, custom_html: str = None, lite_mode: bool = False) -> str:
+        """
+        Create the HTML content with the specified game URL.
+        
+        Args:
+            game_url: URL to the js-dos game bundle
+            custom_html: HTML page served instead of the templates
+            lite_mode: Whether to use the lite HTML template
+            
+        Returns:
+            The HTML page
+        """
+        from lotr2_rl.consts import DOS_GAME_HTML_TEMPLATE, DOS_GAME_LITE_HTML_TEMPLATE
+
+        if custom_html:
+            return custom_html
+
+        js_dos_url = get_runtime_url(self.runtime_dir)
+        if lite_mode:
+            return DOS_GAME_LITE_HTML_TEMPLATE.format(game_url=game_url, js_dos_url=js_dos_url)
+        return DOS_GAME_HTML_TEMPLATE.format(game_url=game_url, js_dos_url=js_dos_url)
         
     def stop(self) -> None:
         """
-        Stop the server.
+        Stop the server. A browser opened with `open_in_chromium` is killed, as it cannot be closed
+        cleanly outside its event loop: await `stop_async` instead to close it first.
         """
         if not self.is_running:
             logger.warning("Server is not running")
             return
             
-        # Close browser if open
+        # Kill the browser if still open
         if self.browser:
-            asyncio.create_task(self._close_browser())
+            kill_browser(self._browser_tag)
+            self._release_browser()
         
         # Stop server    
         self.server.shutdown()
         self.server.server_close()
+        self.server_thread.join()
+        self.server_thread = None
+        self.file_cache.clear()
         self.is_running = False
+        resource_closed("server")
         logger.info("Server stopped")
+
+    async def stop_async(self) -> None:
+        """
+        Close the browser opened with `open_in_chromium`, then stop the server.
+        """
+        await self._close_browser()
+        self.stop()
     
     async def open_in_chromium(self, headless: bool = False) -> None:
         """
@@ -101,7 +330,12 @@ class DOSGameServer:
         self.playwright = await async_playwright().start()
         
         # Launch browser without viewport parameter
-        self.browser = await self.playwright.chromium.launch(headless=headless, args=["--disable-web-security"])
+        self._browser_tag = new_browser_tag()
+        self.browser = await self.playwright.chromium.launch(
+            headless=headless, args=["--disable-web-security", get_browser_tag_arg(self._browser_tag)]
+        )
+        register_browser(self, self._browser_tag)
+        resource_opened("browser")
         
         # Create context with dimensions based on OS
         # Measured in viewport pixels
@@ -133,71 +367,90 @@ class DOSGameServer:
         Close the browser if it's open.
         """
         if self.browser:
+            kill_browser(self._browser_tag)
             await self.browser.close()
-            self.browser = None
+            self._release_browser()
         
         if self.playwright:
             await self.playwright.stop()
             self.playwright = None
         
         logger.info("Browser closed successfully")
+
+    def _release_browser(self) -> None:
+        unregister_browser(self)
+        resource_closed("browser")
+        self._browser_tag = None
+        self.browser = None
+        self.context = None
+        self.page = None
         
-    def _create_request_handler(self, 
-                                game_url: str, 
-                                custom_html: str = None, 
-                                lite_mode: bool = False):
+    def _create_request_handler(self):
         """
-        Create a custom request handler with the game URL.
-        
-        Args:
-            game_url: URL to the js-dos game bundle
+        Create a custom request handler serving the registered pages.
             
         Returns:
             A request handler class
         """
-        class DOSGameHandler(http.server.SimpleHTTPRequestHandler):
+        game_server = self
+        runtime_dir = self.runtime_dir
+
+        class DOSGameHandler(CachedFileRequestHandler):
             def do_GET(self):
+                # Split the per-env prefix from the rest of the path
+                path = self.path.split("?", 1)[0]
+                prefix = ""
+                match = ENV_PATH_PATTERN.match(path)
+                if match:
+                    prefix, path = f"/env/{match.group(1)}", match.group(2)
+
+                html_bytes = game_server._get_page(prefix)
+
                 # Serve the index.html page for the root path
-                if self.path == "/" or self.path == "/index.html":
+                if (path == "/" or path == "/index.html") and html_bytes is not None:
+                    start_time = time.perf_counter()
                     self.send_response(200)
                     self.send_header("Content-type", "text/html")
+                    self.send_header("Content-Length", str(len(html_bytes)))
                     self.end_headers()
                     
-                    # Create the HTML content with the specified game URL
-                    from lotr2_rl.consts import DOS_GAME_HTML_TEMPLATE, DOS_GAME_LITE_HTML_TEMPLATE
-
-                    if custom_html:
-                        html_content = custom_html
-                    elif lite_mode:
-                        html_content = DOS_GAME_LITE_HTML_TEMPLATE.format(game_url=game_url)
-                    else:
-                        html_content = DOS_GAME_HTML_TEMPLATE.format(game_url=game_url)
-                    
-                    self.wfile.write(html_content.encode())
+                    self.wfile.write(html_bytes)
+                    self.server.stats.record(200, len(html_bytes), (time.perf_counter() - start_time) * 1000)
                 # Add handler for dosbox.conf
-                elif self.path == "/dosbox.conf":
+                elif path == "/dosbox.conf":
                     # Get the path to the dosbox.conf file
                     dosbox_conf_path = Path("src/dos/dosbox.conf")
                     
                     if dosbox_conf_path.exists():
+                        # Read and serve the dosbox.conf file
+                        with open(dosbox_conf_path, 'rb') as f:
+                            content = f.read()
+
                         self.send_response(200)
                         self.send_header("Content-type", "text/plain")
+                        self.send_header("Content-Length", str(len(content)))
                         self.end_headers()
-                        
-                        # Read and serve the dosbox.conf file
-                        with open(dosbox_conf_path, 'rb') as f:
-                            self.wfile.write(f.read())
+                        self.wfile.write(content)
                     else:
                         # If the file doesn't exist, return 404
+                        content = b"dosbox.conf file not found"
                         self.send_response(404)
                         self.send_header("Content-type", "text/plain")
+                        self.send_header("Content-Length", str(len(content)))
                         self.end_headers()
-                        self.wfile.write(b"dosbox.conf file not found")
+                        self.wfile.write(content)
                         logger.error(f"dosbox.conf file not found at {dosbox_conf_path.absolute()}")
                 else:
-                    # For other paths, use the default behavior
+                    # For other paths, serve static files from the shared cache
                     super().do_GET()
                     
+            def translate_path(self, path):
+                # Serve the js-dos runtime from its local folder
+                if path.startswith(JS_DOS_LOCAL_PATH + "/"):
+                    relative_path = super().translate_path(path[len(JS_DOS_LOCAL_PATH):])
+                    return str(runtime_dir / Path(relative_path).relative_to(self.directory))
+                return super().translate_path(path)
+
             def log_message(self, format, *args):
                 # Customize logging to use our logger
                 logger.debug(format % args)
@@ -0,0 +1,338 @@
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from lotr2_rl.profiler import StepProfiler
+
+logger = logging.getLogger(__name__)
+
+# Page size of the screenshots taken on Linux, the gym crops its observation from it (see _decode_screenshot)
+PAGE_HEIGHT, PAGE_WIDTH = 475, 700
+OBS_X = 76
+OBS_HEIGHT, OBS_WIDTH = 400, 534
+
+# Region of the crowns text in the page (see _get_crown)
+CROWN_X, CROWN_WIDTH, CROWN_HEIGHT = OBS_X + 415, 105, 19
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+
+def observation_to_screenshot(observation: np.ndarray) -> bytes:
+    """
+    Rebuild a full page JPEG screenshot from an observation, so it goes through the gym decoding unchanged.
+
+    Args:
+        observation: An observation of the gym, in BGR
+
+    Returns:
+        The JPEG bytes of the page
+    """
+    page = np.zeros((PAGE_HEIGHT, PAGE_WIDTH, 3), dtype=np.uint8)
+    page[:observation.shape[0], OBS_X:OBS_X + observation.shape[1]] = observation
+    return cv2.imencode(".jpg", page, [cv2.IMWRITE_JPEG_QUALITY, 100])[1].tobytes()
+
+
+def _crown_key(screenshot: bytes) -> bytes:
+    """ Key of the crowns region of a screenshot, as decoded by the gym. """
+    page = cv2.imdecode(np.frombuffer(screenshot, np.uint8), cv2.IMREAD_COLOR)
+    return page[0:CROWN_HEIGHT, CROWN_X:CROWN_X + CROWN_WIDTH].tobytes()
+
+
+class TraceFrameSource:
+    """
+    Frames of a recorded trace, e.g. a gym log folder, returned in order by each capture and looped.
+    Full page screenshots are served as recorded and observations are padded back to a full page.
+    If the folder has a `labels.json` file mapping image names to their number of crowns,
+    the crowns of these frames are known without OCR.
+    """
+    def __init__(self, trace_dir: Path):
+        """
+        Args:
+            trace_dir: Folder holding the recorded frames
+        """
+        self.trace_dir = Path(trace_dir)
+        labels_path = self.trace_dir / "labels.json"
+        labels = {}
+        if labels_path.is_file():
+            with open(labels_path) as f:
+                labels = json.load(f)
+
+        self.screenshots: List[bytes] = []
+        self.crown_texts: Dict[bytes, str] = {}
+        for path in sorted(self.trace_dir.rglob("*"), key=self._natural_key):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+
+            if image.shape[:2] == (OBS_HEIGHT, OBS_WIDTH):
+                screenshot = observation_to_screenshot(image)
+            elif image.shape[:2] == (PAGE_HEIGHT, PAGE_WIDTH):
+                screenshot = path.read_bytes() if path.suffix.lower() != ".png" else \
+                    cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 100])[1].tobytes()
+            else:
+                continue
+
+            name = path.relative_to(self.trace_dir).as_posix()
+            if name in labels:
+                self.crown_texts[_crown_key(screenshot)] = f"{int(labels[name])} Crowns."
+            self.screenshots.append(screenshot)
+
+        if not self.screenshots:
+            raise FileNotFoundError(f"No recorded frames found in {self.trace_dir}")
+        logger.info(f"Loaded {len(self.screenshots)} frames from {self.trace_dir}")
+        self.index = 0
+
+    @staticmethod
+    def _natural_key(path: Path):
+        # screenshot_10.jpg comes after screenshot_9.jpg
+        return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path.as_posix())]
+
+    def reset(self) -> None:
+        self.index = 0
+
+    def advance(self, seconds: float) -> None:
+        pass
+
+    def click(self, x: float, y: float) -> None:
+        pass
+
+    def screenshot(self) -> bytes:
+        screenshot = self.screenshots[self.index]
+        self.index = (self.index + 1) % len(self.screenshots)
+        return screenshot
+
+    def read_text(self, crowns_image: np.ndarray) -> Optional[str]:
+        return self.crown_texts.get(crowns_image.tobytes())
+
+
+class ScriptedFrameSource:
+    """
+    Minimal scripted game: the crowns are drawn in the HUD, clicking the end turn button plays
+    an end of turn animation for `end_turn_seconds` of emulated time, then adds the income to the crowns.
+    The main menu and player icon templates are drawn so the gym end of turn detection sees the same
+    states as in the real game. Frames are rendered once per state and cached.
+    """
+    def __init__(
+        self,
+        start_gold: int = 5000,
+        income: int = 150,
+        end_turn_seconds: float = 2.0,
+        end_turn_button: Tuple[int, int, int, int] = (474, 382, 126, 13),
+    ):
+        """
+        Args:
+            start_gold: Number of crowns at the start of an episode
+            income: Crowns earned at the end of each turn
+            end_turn_seconds: Emulated duration of the end of turn animation
+            end_turn_button: (x, y, width, height) of the end turn button in page coordinates
+        """
+        from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+
+        self.start_gold = start_gold
+        self.income = income
+        self.end_turn_seconds = end_turn_seconds
+        self.end_turn_button = end_turn_button
+        self.main_menu_img = LordsOfTheRealm2Gym._load_template("main_menu_gray.png")
+        self.player_icon_img = LordsOfTheRealm2Gym._load_template("player_icon_gray.png")
+
+        self._frames: Dict[Tuple[int, bool], bytes] = {}
+        self.crown_texts: Dict[bytes, str] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self.gold = self.start_gold
+        self.turn = 0
+        self.end_turn_remaining = 0.0
+
+    def advance(self, seconds: float) -> None:
+        if self.end_turn_remaining > 0:
+            self.end_turn_remaining -= seconds
+            if self.end_turn_remaining <= 0:
+                self.end_turn_remaining = 0.0
+                self.gold += self.income
+                self.turn += 1
+
+    def click(self, x: float, y: float) -> None:
+        button_x, button_y, width, height = self.end_turn_button
+        if self.end_turn_remaining == 0 and button_x <= x < button_x + width and button_y <= y < button_y + height:
+            self.end_turn_remaining = self.end_turn_seconds
+
+    def screenshot(self) -> bytes:
+        state = (self.gold, self.end_turn_remaining > 0)
+        screenshot = self._frames.get(state)
+        if screenshot is None:
+            screenshot = self._frames[state] = self._render(*state)
+        return screenshot
+
+    def _render(self, gold: int, end_turn: bool) -> bytes:
+        page = np.full((PAGE_HEIGHT, PAGE_WIDTH, 3), (40, 90, 60), dtype=np.uint8)
+        page[0:CROWN_HEIGHT, CROWN_X:CROWN_X + CROWN_WIDTH] = (60, 140, 180)
+        text = f"{gold} Crowns."
+        cv2.putText(page, text, (CROWN_X + 2, CROWN_HEIGHT - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 1)
+
+        # The end of turn animation hides the player icon but not the main menu
+        height, width = self.main_menu_img.shape[:2]
+        page[0:height, OBS_X:OBS_X + width] = self.main_menu_img
+        if not end_turn:
+            height, width = self.player_icon_img.shape[:2]
+            page[30:30 + height, OBS_X + 300:OBS_X + 300 + width] = self.player_icon_img
+
+        x, y, width, height = self.end_turn_button
+        cv2.rectangle(page, (x, y), (x + width, y + height), (200, 200, 200), -1)
+
+        screenshot = cv2.imencode(".jpg", page, [cv2.IMWRITE_JPEG_QUALITY, 100])[1].tobytes()
+        self.crown_texts[_crown_key(screenshot)] = text
+        return screenshot
+
+    def read_text(self, crowns_image: np.ndarray) -> Optional[str]:
+        return self.crown_texts.get(crowns_image.tobytes())
+
+
+class MockBrowserController:
+    """
+    Drop-in replacement of BrowserController for the gym, without browser, emulator or game files.
+    Frames come from a recorded trace or a scripted game, so the training loop, wrappers and
+    vector envs can be run and measured in isolation at high step rates.
+    The emulated time advances with the actions and waits, no wall-clock time is spent.
+    """
+    def __init__(
+        self,
+        trace_dir: Optional[Path] = None,
+        lite: bool = False,
+        frames_per_action: int = 4,
+        emulated_fps: float = 70.0,
+        num_screenshots_per_action: int = 0,
+        screenshot_interval_frames: int = 4,
+        profiler: Optional[StepProfiler] = None,
+        **scripted_kwargs,
+    ):
+        """
+        Initialize the mock controller.
+
+        Args:
+            trace_dir: Folder of recorded frames to replay, a scripted game is played if None
+            lite: Whether lite mode frame bursts are returned by execute_action
+            frames_per_action: Number of emulated frames advanced after each action
+            emulated_fps: Frame rate used to convert frames to emulated time
+            num_screenshots_per_action: Number of frames captured after each action in lite mode
+            screenshot_interval_frames: Emulated frames between two captures of a burst
+            profiler: Profiler timing the interactions, disabled by default
+            scripted_kwargs: Arguments of the ScriptedFrameSource
+        """
+        self.source = TraceFrameSource(trace_dir) if trace_dir is not None else ScriptedFrameSource(**scripted_kwargs)
+        self.lite = lite
+        self.frames_per_action = frames_per_action
+        self.emulated_fps = emulated_fps
+        self.num_screenshots_per_action = num_screenshots_per_action
+        self.screenshot_interval_frames = screenshot_interval_frames
+        self.profiler = profiler or StepProfiler(enabled=False)
+
+        self.viewport_dimensions = {"width": PAGE_WIDTH, "height": PAGE_HEIGHT}
+        self.current_mouse_position = (0, 0)
+        self.frame_count = 0
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        self._running = True
+
+    def close(self) -> None:
+        self._running = False
+
+    def navigate(self, url: str) -> None:
+        self.source.reset()
+        self.frame_count = 0
+        self.current_mouse_position = (0, 0)
+
+    def pre_load(self, game: str) -> None:
+        pass
+
+    def check_health(self) -> None:
+        pass
+
+    def recover(self, url: str) -> str:
+        self.navigate(url)
+        return "reload"
+
+    def advance_frames(self, frames: int) -> int:
+        if frames > 0:
+            self.frame_count += frames
+            self.source.advance(frames / self.emulated_fps)
+        return self.frame_count
+
+    def advance_ms(self, milliseconds: float) -> int:
+        return self.advance_frames(max(1, round(milliseconds * self.emulated_fps / 1000)))
+
+    def wait(self, seconds: float) -> None:
+        self.advance_ms(seconds * 1000)
+
+    def get_screenshot(self) -> bytes:
+        with self.profiler.phase("screenshot"):
+            return self.source.screenshot()
+
+    def capture_burst(self, num_frames: int, interval_frames: int = 1) -> np.ndarray:
+        frames = np.empty((num_frames, PAGE_HEIGHT, PAGE_WIDTH, 3), dtype=np.uint8)
+        for i in range(num_frames):
+            if i > 0:
+                self.advance_frames(interval_frames)
+            frames[i] = cv2.imdecode(np.frombuffer(self.get_screenshot(), np.uint8), cv2.IMREAD_COLOR)
+        return frames
+
+    def read_text(self, crowns_image: np.ndarray) -> Optional[str]:
+        """
+        Get the crowns text of a frame served by this controller, replacing the OCR.
+
+        Args:
+            crowns_image: The crowns region of an observation
+
+        Returns:
+            The text, or None if the frame is not known
+        """
+        return self.source.read_text(crowns_image)
+
+    def move_mouse(self, x: float, y: float) -> None:
+        self.current_mouse_position = (x, y)
+
+    def click(self, x: float, y: float, options: dict = None) -> None:
+        # Same emulated delays as BrowserController.click
+        self.move_mouse(x, y)
+        self.wait(0.1)
+        self.source.click(x, y)
+        self.wait(0.05)
+
+    def press_key(self, key: str, lite_mode: bool = False, delay_ms: float = 100) -> None:
+        pass
+
+    def execute_action(self, action: str, action_input: str):
+        """ Execute an action like BrowserController.execute_action. """
+        result = f"Unknown action: {action}"
+        if action == "move":
+            x, y = map(float, action_input.split(","))
+            self.move_mouse(x, y)
+            result = f"Mouse moved to ({x}, {y})"
+        elif action == "click":
+            x, y = self.current_mouse_position
+            self.click(x, y)
+            result = f"Mouse clicked at ({x}, {y}) with options: None"
+        elif action == "press_key":
+            self.press_key(action_input)
+            result = f"Pressed key: {action_input}"
+        elif action == "nope":
+            result = "Agent decided to skip this step."
+
+        screenshots = []
+        if self.lite:
+            self.advance_frames(self.frames_per_action)
+            if self.num_screenshots_per_action > 0:
+                screenshots = self.capture_burst(self.num_screenshots_per_action, self.screenshot_interval_frames)
+        return result, screenshots
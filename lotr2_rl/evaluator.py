@@ -2,11 +2,62 @@
 
 """Evaluator for running LLM game interactions on VideoGameBench."""
 import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List, Callable
 from abc import ABC, abstractmethod
+
+import numpy as np
+
 from lotr2_rl.llm.realtime_agent import WebBrowsingAgent
 from lotr2_rl.emulators.dos.website_server import DOSGameServer
 
+logger = logging.getLogger(__name__)
+
+# An episode record is a dict with, when available:
+#   rewards: reward of each step
+#   gold: gold of each step (info["gold"])
+#   steps: number of steps
+#   wall_time_s: duration of the episode
+#   checkpoints_reached: indices of the checkpoints whose image was seen
+# A metric takes an episode record and returns named values, or nothing when its data is missing
+
+
+def episode_return(episode: Dict[str, Any]) -> Dict[str, float]:
+    if "rewards" not in episode:
+        return {}
+    return {"return": float(np.sum(episode["rewards"])), "length": float(len(episode["rewards"]))}
+
+
+def gold_curve(episode: Dict[str, Any]) -> Dict[str, float]:
+    gold = [value for value in episode.get("gold", []) if value is not None]
+    if not gold:
+        return {}
+    return {"final_gold": float(gold[-1]), "max_gold": float(max(gold)), "gold_gain": float(gold[-1] - gold[0])}
+
+
+def checkpoints_reached(episode: Dict[str, Any]) -> Dict[str, float]:
+    if "checkpoints_reached" not in episode:
+        return {}
+    return {"checkpoints_reached": float(len(episode["checkpoints_reached"]))}
+
+
+def steps_per_sec(episode: Dict[str, Any]) -> Dict[str, float]:
+    if not episode.get("wall_time_s") or "steps" not in episode:
+        return {}
+    return {"steps_per_sec": episode["steps"] / episode["wall_time_s"]}
+
+
+def episode_wall_time(episode: Dict[str, Any]) -> Dict[str, float]:
+    if "wall_time_s" not in episode:
+        return {}
+    return {"wall_time_s": float(episode["wall_time_s"])}
+
+
+DEFAULT_METRICS = [episode_return, gold_curve, checkpoints_reached, steps_per_sec, episode_wall_time]
+
+
 class BaseVGBenchEvaluator(ABC):
     """Abstract base class for evaluators that coordinate between game emulators and LLMs."""
     
@@ -19,7 +70,7 @@ class BaseVGBenchEvaluator(ABC):
     ):
         self.max_steps = max_steps
         self.step_delay = step_delay
-        self.metrics = metrics or []
+        self.metrics = metrics or list(DEFAULT_METRICS)
         self.checkpoints = checkpoints
 
     @abstractmethod
@@ -27,6 +78,48 @@ class BaseVGBenchEvaluator(ABC):
         """Run an episode of the game."""
         pass
 
+    def compute_metrics(self, episode: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Apply the registered metrics to an episode record.
+
+        Args:
+            episode: The episode record
+
+        Returns:
+            The values of all the metrics, a metric returning a number being named after its function
+        """
+        values = {}
+        for metric in self.metrics:
+            result = metric(episode)
+            if isinstance(result, dict):
+                values.update(result)
+            elif result is not None:
+                values[getattr(metric, "__name__", repr(metric))] = float(result)
+        return values
+
+    @staticmethod
+    def aggregate(episode_metrics: List[Dict[str, float]]) -> Dict[str, Any]:
+        """
+        Aggregate the metrics of several episodes into one report.
+
+        Args:
+            episode_metrics: The metrics of each episode
+
+        Returns:
+            The number of episodes, mean, std, min and max of each metric, and the metrics of each episode
+        """
+        names = sorted({name for metrics in episode_metrics for name in metrics})
+        summary = {}
+        for name in names:
+            values = np.array([metrics[name] for metrics in episode_metrics if name in metrics], dtype=np.float64)
+            summary[name] = {
+                "mean": float(values.mean()),
+                "std": float(values.std()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+            }
+        return {"episodes": len(episode_metrics), "metrics": summary, "per_episode": episode_metrics}
+
 
 class DOSEvaluator(BaseVGBenchEvaluator):
     """Evaluator class that coordinates between DOS emulators and LLMs."""
@@ -43,19 +136,197 @@ class DOSEvaluator(BaseVGBenchEvaluator):
         Run an episode of a game using JS-DOS with LLM interacting
         in realtime or paused based on if lite mode is on (controlled in agent).
 
+        Returns:
+            The metrics of the episode
         """
         try:
-            # Start the agent
-            await dos_agent.start(initial_url=url)
-
-            # await dos_agent.reset(initial_url=url)
+            # Start the agent, on the URL it was created with
+            await dos_agent.start()
             # Execute the task
-            await dos_agent.run_episode(checkpoints=self.checkpoints)
-            await asyncio.sleep(5)  # Allow time for the agent to initialize
+            start_time = time.perf_counter()
+            await dos_agent.run_episode(max_steps=self.max_steps, checkpoints=self.checkpoints)
+            episode = {"steps": dos_agent.step_count, "wall_time_s": time.perf_counter() - start_time}
+            metrics = self.compute_metrics(episode)
+            logger.info(f"Episode metrics: {metrics}")
+            return metrics
         finally:
             # Stop the agent
             await dos_agent.stop()
             
             # Stop the server if it was started
             if server:
-                server.stop()
\ No newline at end of file
+                await server.stop_async()
+
+
+class _EnvThread:
+    """
+    Env owned by one dedicated thread. The browser of the gym is a sync Playwright object, which can
+    only be used from the thread that launched it, so the env is created, stepped and closed there.
+    """
+    def __init__(self, env_fn: Callable, name: str):
+        self._env_fn = env_fn
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.env = None
+
+    async def run(self, func: Callable, *args):
+        """ Run a function in the thread of the env. """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def start(self) -> None:
+        self.env = await self.run(self._env_fn)
+
+    async def close(self) -> None:
+        try:
+            if self.env is not None:
+                await self.run(self.env.close)
+        finally:
+            self._executor.shutdown()
+
+
+class GymPolicyEvaluator(BaseVGBenchEvaluator):
+    """
+    Evaluator running K episodes of a policy concurrently over a pool of gym envs, each owned by its
+    own thread, the actions of all the envs being evaluated in batches by one InferenceServer.
+    """
+
+    def __init__(self,
+            n_envs: int = 4,
+            env_kwargs: Optional[Dict[str, Any]] = None,
+            frame_stack: int = 1,
+            deterministic: bool = True,
+            max_steps: int = 1000,
+            step_delay: float = 0.0,
+            metrics: Optional[List[Callable]] = None,
+            checkpoints: Optional[List[str]] = None):
+        """
+        Args:
+            n_envs: Number of envs playing episodes at the same time
+            env_kwargs: Keyword arguments of each env
+            frame_stack: Number of stacked frames the policy was trained on
+            deterministic: Whether to take the most likely actions instead of sampling them
+            max_steps: Maximum number of steps of an episode
+            step_delay: Delay between two steps in seconds
+            metrics: Metrics applied to each episode record, DEFAULT_METRICS by default
+            checkpoints: Image hashes of the checkpoints counted by the checkpoints_reached metric
+        """
+        super().__init__(max_steps, step_delay, metrics, checkpoints)
+        self.n_envs = n_envs
+        self.env_kwargs = env_kwargs or {}
+        self.frame_stack = frame_stack
+        self.deterministic = deterministic
+
+    def evaluate(self, policy, n_episodes: int, max_batch_size: int = 32, max_latency_ms: float = 5.0) -> Dict[str, Any]:
+        """
+        Evaluate a policy over several episodes.
+
+        Args:
+            policy: SB3 model, policy or agent with the `predict(observations, deterministic)` interface,
+                or the path of a saved model
+            n_episodes: Number of episodes
+            max_batch_size: Maximum number of observations of a forward pass
+            max_latency_ms: Maximum time an observation waits for others to join its forward pass
+
+        Returns:
+            The report of the episodes, see `aggregate`
+        """
+        from lotr2_rl.inference_server import InferenceServer, load_policy
+
+        if isinstance(policy, str):
+            policy = load_policy(policy)
+        start_time = time.perf_counter()
+        with InferenceServer(policy, max_batch_size, max_latency_ms, self.deterministic) as server:
+            episode_metrics = asyncio.run(self._evaluate(server, n_episodes))
+            report = self.aggregate(episode_metrics)
+            report["inference"] = server.get_stats()
+        report["wall_time_s"] = time.perf_counter() - start_time
+        return report
+
+    async def _evaluate(self, server, n_episodes: int) -> List[Dict[str, float]]:
+        import gymnasium as gym
+
+        def make_env():
+            return gym.make("lotr2-rl/LordsOfTheRealm2-v0", **self.env_kwargs)
+
+        env_threads = [_EnvThread(make_env, f"eval_env_{i}") for i in range(min(self.n_envs, n_episodes))]
+        free_env_threads = asyncio.Queue()
+
+        async def run_on_free_env(episode_index: int) -> Dict[str, float]:
+            env_thread = await free_env_threads.get()
+            try:
+                return await self.run_episode(server, env_thread, seed=episode_index)
+            finally:
+                free_env_threads.put_nowait(env_thread)
+
+        try:
+            await asyncio.gather(*(env_thread.start() for env_thread in env_threads))
+            for env_thread in env_threads:
+                free_env_threads.put_nowait(env_thread)
+            return list(await asyncio.gather(*(run_on_free_env(i) for i in range(n_episodes))))
+        finally:
+            # Each close runs after the episode its thread may still be playing
+            await asyncio.gather(*(env_thread.close() for env_thread in env_threads), return_exceptions=True)
+
+    async def run_episode(self, agent, env_thread: Optional[_EnvThread] = None, seed: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run an episode of the policy in an env, in the thread owning the env.
+
+        Args:
+            agent: InferenceServer or InferenceClient of the policy
+            env_thread: The env to play in, with its thread
+            seed: Seed of the env reset
+
+        Returns:
+            The metrics of the episode
+        """
+        episode = await env_thread.run(self._play_episode, agent, env_thread.env, seed)
+        metrics = self.compute_metrics(episode)
+        logger.info(f"Episode {seed} metrics: {metrics}")
+        return metrics
+
+    def _play_episode(self, predictor, env, seed: Optional[int]) -> Dict[str, Any]:
+        from lotr2_rl.inference_server import stacked_predictor
+
+        predict = stacked_predictor(predictor, self.frame_stack)
+        checkpoint_hashes = self._get_checkpoint_hashes()
+        episode = {"rewards": [], "gold": []}
+        if checkpoint_hashes:
+            episode["checkpoints_reached"] = set()
+
+        start_time = time.perf_counter()
+        observation, info = env.reset(seed=seed)
+        # The gold at the start, so the gain covers the whole episode
+        episode["gold"].append(info.get("gold"))
+        for _ in range(self.max_steps):
+            observation, reward, terminated, truncated, info = env.step(predict(observation))
+            episode["rewards"].append(reward)
+            episode["gold"].append(info.get("gold"))
+            if checkpoint_hashes:
+                episode["checkpoints_reached"].update(self._find_checkpoints(observation, checkpoint_hashes))
+            if terminated or truncated:
+                break
+            if self.step_delay:
+                time.sleep(self.step_delay)
+        else:
+            # Cut at max_steps: in pipelined mode the reward and gold of the last step are still pending
+            if episode["rewards"]:
+                episode["rewards"][-1] += env.unwrapped.pop_pending_reward()
+                episode["gold"][-1] = env.unwrapped.last_gold
+        episode["steps"] = len(episode["rewards"])
+        episode["wall_time_s"] = time.perf_counter() - start_time
+        return episode
+
+    def _get_checkpoint_hashes(self):
+        if not self.checkpoints:
+            return []
+        import imagehash
+
+        return [imagehash.hex_to_hash(checkpoint) for checkpoint in self.checkpoints]
+
+    @staticmethod
+    def _find_checkpoints(observation: np.ndarray, checkpoint_hashes) -> List[int]:
+        from PIL import Image
+        from lotr2_rl.utils import hash_image
+
+        # Observations are BGR like the screenshots decoded by OpenCV
+        observation_hash = hash_image(Image.fromarray(observation[..., ::-1]))
+        return [i for i, checkpoint_hash in enumerate(checkpoint_hashes) if observation_hash - checkpoint_hash < 1]
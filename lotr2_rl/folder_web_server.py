@@ -1,7 +1,301 @@
+import mmap
 import threading
+import time
+from collections import deque
 from functools import partial
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from lotr2_rl.resources import resource_closed, resource_opened
+
+# Files larger than this are memory-mapped instead of read into RAM
+MMAP_THRESHOLD = 1024 * 1024
+
+# Precompressed siblings looked up next to a requested file, by preference order
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class CachedFile:
+    """
+    A file kept in memory, either as bytes or as a read-only memory map.
+    Reference counted: the cache holds one reference and each request sending the file another,
+    the memory map is closed when the last one is released.
+    """
+    def __init__(self, path: Path, content_type: str, content_encoding: Optional[str] = None):
+        """
+        Load the file content.
+
+        Args:
+            path: Path of the file on disk
+            content_type: MIME type sent for the file
+            content_encoding: Content-Encoding of a precompressed file, None otherwise
+        """
+        stat = path.stat()
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.etag = f'"{self.size:x}-{self.mtime_ns:x}{"-" + content_encoding if content_encoding else ""}"'
+        self.last_modified = stat.st_mtime
+
+        if self.size >= MMAP_THRESHOLD:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap)
+        else:
+            self._mmap = None
+            self.data = memoryview(path.read_bytes())
+        self._refs = 1
+        self._refs_lock = threading.Lock()
+
+    def acquire(self) -> "CachedFile":
+        """ Take a reference on the file, to be released once the file is sent. """
+        with self._refs_lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        """ Drop a reference on the file, closing it with the last one. """
+        with self._refs_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def is_stale(self) -> bool:
+        """Check if the file changed on disk since it was loaded."""
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return True
+        return stat.st_size != self.size or stat.st_mtime_ns != self.mtime_ns
+
+
+class FileCache:
+    """
+    Thread-safe cache of files served by the web servers, including their precompressed variants.
+    """
+    def __init__(self):
+        self._files: Dict[Tuple[str, Optional[str]], Optional[CachedFile]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, content_type: str, content_encoding: Optional[str] = None) -> Optional[CachedFile]:
+        """
+        Get a cached file, loading or reloading it from disk when needed.
+
+        Args:
+            path: Path of the file on disk
+            content_type: MIME type sent for the file
+            content_encoding: Content-Encoding of a precompressed file, None otherwise
+
+        Returns:
+            The cached file, acquired for the caller who must release it, or None if it does not exist
+        """
+        key = (str(path), content_encoding)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is not None:
+                if not cached.is_stale():
+                    return cached.acquire()
+                # Closed once the requests still sending it are done
+                del self._files[key]
+                cached.release()
+
+            if not path.is_file():
+                return None
+
+            cached = CachedFile(path, content_type, content_encoding)
+            self._files[key] = cached
+            return cached.acquire()
+
+    def clear(self) -> None:
+        """ Drop all the files, each one closed once the requests still sending it are done. """
+        with self._lock:
+            files, self._files = self._files, {}
+        for cached in files.values():
+            cached.release()
+
+
+class ServerStats:
+    """
+    Thread-safe request counters and latency samples of a web server.
+    """
+    def __init__(self, max_samples: int = 10000):
+        self.requests = 0
+        self.bytes_served = 0
+        self.status_counts: Dict[int, int] = {}
+        self._latencies_ms = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, status: int, nb_bytes: int, latency_ms: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_served += nb_bytes
+            status = int(status)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self._latencies_ms.append(latency_ms)
+
+    def snapshot(self) -> dict:
+        """
+        Get a copy of the counters with latency percentiles over the recent requests.
+
+        Returns:
+            A dictionary of statistics
+        """
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            snapshot = {
+                "requests": self.requests,
+                "bytes_served": self.bytes_served,
+                "status_counts": dict(self.status_counts),
+            }
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        snapshot["latency_ms"] = {
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        }
+        return snapshot
+
+
+class CachedFileRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler serving files from a shared in-memory cache.
+    Supports ETag/If-None-Match, single byte ranges and precompressed (.br/.gz) files.
+    The server must provide `file_cache` and `stats` attributes.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve_cached(head_only=False)
+
+    def do_HEAD(self):
+        self._serve_cached(head_only=True)
+
+    def _serve_cached(self, head_only: bool) -> None:
+        start_time = time.perf_counter()
+        status, nb_bytes = self._send_cached_file(head_only)
+        self.server.stats.record(status, nb_bytes, (time.perf_counter() - start_time) * 1000)
+
+    def _send_cached_file(self, head_only: bool) -> Tuple[int, int]:
+        path = Path(self.translate_path(self.path))
+        if path.is_dir():
+            path = path / "index.html"
+
+        content_type = self.guess_type(str(path))
+        cached = self._get_precompressed(path, content_type) or self.server.file_cache.get(path, content_type)
+        if cached is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return HTTPStatus.NOT_FOUND, 0
+        try:
+            return self._send_file(cached, head_only)
+        finally:
+            cached.release()
+
+    def _send_file(self, cached: CachedFile, head_only: bool) -> Tuple[int, int]:
+        if self._etag_matches(cached.etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_entity_headers(cached)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return HTTPStatus.NOT_MODIFIED, 0
+
+        byte_range = self._parse_range(cached.size)
+        if byte_range is None:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{cached.size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, 0
+
+        start, end = byte_range
+        if (start, end) == (0, cached.size):
+            status = HTTPStatus.OK
+            self.send_response(status)
+        else:
+            status = HTTPStatus.PARTIAL_CONTENT
+            self.send_response(status)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{cached.size}")
+
+        self._send_entity_headers(cached)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        if head_only:
+            return status, 0
+        # Released right away, a memory map cannot be closed while a view on it is alive
+        with cached.data[start:end] as chunk:
+            self.wfile.write(chunk)
+        return status, end - start
+
+    def _get_precompressed(self, path: Path, content_type: str) -> Optional[CachedFile]:
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        accepted = {encoding.split(";")[0].strip() for encoding in accept_encoding.split(",")}
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding in accepted:
+                cached = self.server.file_cache.get(path.with_name(path.name + suffix), content_type, encoding)
+                if cached is not None:
+                    return cached
+        return None
+
+    def _send_entity_headers(self, cached: CachedFile) -> None:
+        self.send_header("Content-Type", cached.content_type)
+        self.send_header("ETag", cached.etag)
+        self.send_header("Last-Modified", self.date_time_string(cached.last_modified))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if cached.content_encoding:
+            self.send_header("Content-Encoding", cached.content_encoding)
+
+    def _etag_matches(self, etag: str) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    def _parse_range(self, size: int) -> Optional[Tuple[int, int]]:
+        """
+        Parse a single `bytes=` range header.
+
+        Returns:
+            The (start, end) half-open interval to send, the full file if there is no usable
+            range header, or None if the range cannot be satisfied
+        """
+        range_header = self.headers.get("Range")
+        if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+            # Missing, unknown unit or multiple ranges: send the whole file
+            return 0, size
+
+        first, _, last = range_header[len("bytes="):].strip().partition("-")
+        try:
+            if first == "":
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    return None
+                return max(0, size - length), size
+
+            start = int(first)
+            end = int(last) + 1 if last else size
+        except ValueError:
+            return 0, size
+
+        if start >= size or end <= start:
+            return None
+        return start, min(end, size)
 
 
 class FolderWebServer:
@@ -9,13 +303,22 @@ class FolderWebServer:
         self.folder = Path(folder)
         self.port = port
 
-        handler = partial(SimpleHTTPRequestHandler, directory=self.folder)
-        self.httpd = HTTPServer(('localhost', self.port), handler)
+        handler = partial(CachedFileRequestHandler, directory=self.folder)
+        self.httpd = ThreadingHTTPServer(('localhost', self.port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.file_cache = FileCache()
+        self.httpd.stats = ServerStats()
+        resource_opened("server")
 
         self._start = threading.Event()
         # call StartIt() here if you want to have started by default
         threading.Thread(name=repr(self), target=self._serve_forever, daemon=True).start()
 
+    @property
+    def stats(self) -> ServerStats:
+        """ Request counters of this server. """
+        return self.httpd.stats
+
     def start(self):
         """ Allow the server to serve. """
         self._start.set()
@@ -34,7 +337,10 @@ class FolderWebServer:
         """ Block re-starting and shut down the current server. """
         self._start.clear()
         self.httpd.shutdown()
+        self.httpd.file_cache.clear()
+        resource_closed("server")
+        print(f"Served {self.stats.snapshot()}")
 
     def __repr__(self):
         """ A formal string representation of this instance. """
-        return f'{self.__class__.__name__}(port={self.port})'
\ No newline at end of file
+        return f'{self.__class__.__name__}(port={self.port})'
@@ -1,13 +1,14 @@
 import os
+import itertools
 import math
 import sys
-import time
 import re
 import pytesseract
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 # from PIL import Image
 
@@ -15,9 +16,10 @@ import numpy as np
 import cv2
 import gymnasium as gym
 
-from lotr2_rl.emulators.dos.website_server import DOSGameServer
-from lotr2_rl.emulators.dos.browser_controller import BrowserController
-from lotr2_rl.llm.realtime_agent import WebBrowsingAgent
+from lotr2_rl.emulators.dos.website_server import register_shared_env, unregister_shared_env
+from lotr2_rl.emulators.dos.browser_controller import BrowserController, BrowserFailureError
+from lotr2_rl.profiler import StepProfiler
+from lotr2_rl.resources import resource_closed, resource_opened
 from lotr2_rl.utils import search_image, is_image_present
 
 # Configure logging
@@ -36,16 +38,20 @@ logger = logging.getLogger(__name__)
 # logger = logging.getLogger()
 # logger.addHandler(console)
 
-_next_port = 9000
-def _get_next_port():
-    global _next_port
-    port = _next_port
-    _next_port += 1
-    return port
+# Folder holding the template images matched against observations
+TEMPLATES_DIR = Path(__file__).parent
+
+# Ids of the envs created in this process, combined with the pid to be unique per host
+_env_counter = itertools.count()
+def _get_next_env_id() -> str:
+    return f"{os.getpid()}_{next(_env_counter)}"
 
 class LordsOfTheRealm2Gym(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 24}
 
+    # Maximum number of 1 second waits for the end of turn animation to finish
+    max_end_turn_wait = 5
+
     def __init__(
         self, 
         grid_size: int = 10, 
@@ -53,15 +59,23 @@ class LordsOfTheRealm2Gym(gym.Env):
         sleep_second: float = 0.1,
         nb_step_reset: int = 1000,
         render_mode: str = None,
+        lite: bool = False,
+        frames_per_action: int = 4,
+        env_id: Optional[str] = None,
+        action_repeat: int = 1,
+        macro_actions: Optional[Dict[str, Sequence[Union[int, Tuple[float, float]]]]] = None,
+        action_space_mode: str = "discrete",
+        coarse_size: int = 8,
+        pipeline_info: bool = False,
+        profile: bool = False,
+        backend: str = "browser",
+        mock_kwargs: Optional[dict] = None,
     ):
 
         # Observations are Box of RBG screen of 480 height and 640 width
         # height = 480
         # width = 640
 
-        self.log_dir = Path("logs") / "lotr2" / datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_dir.mkdir(parents=True, exist_ok=True)
-
         self.observation_space = gym.spaces.Box(0, 255, shape=(400, 534, 3), dtype=np.uint8)
 
         self.x_min = 80
@@ -74,14 +88,57 @@ class LordsOfTheRealm2Gym(gym.Env):
         self.mouse_action_space = self.grid_width * self.grid_height
         self.enable_drag = enable_drag
         self.nb_step_reset = nb_step_reset
+        self.sleep_second = sleep_second
 
         # Set action space to implemented actions only
         if self.enable_drag:
-            self.action_space = gym.spaces.Discrete(self.mouse_action_space + 3) # Action space with press & release
+            self.nb_primitive_actions = self.mouse_action_space + 3 # Action space with press & release
+        else:
+            self.nb_primitive_actions = self.mouse_action_space + 2 # Action space with click only
+
+        # Each primitive action is played `action_repeat` times, and macro actions are added
+        # after the primitive actions. Only one observation is captured at the end of the sequence.
+        # Macro actions are given by name, as lists of steps which are actions or (x, y) page
+        # coordinates clicked, e.g. through the `env_kwargs` of the config.
+        self.action_repeat = action_repeat
+        self.macro_names = list(macro_actions or {})
+        self.macro_actions = [
+            [self._to_action(macro_step) for macro_step in macro_steps]
+            for macro_steps in (macro_actions or {}).values()
+        ]
+        self.nb_flat_actions = self.nb_primitive_actions + len(self.macro_actions)
+
+        # Precomputed decoding of every action, see _build_action_table
+        self._build_action_table()
+
+        # The action space is either the flat Discrete space, or a MultiDiscrete space of
+        # (action type, position) mapped to the same flat actions, see _build_multi_action_table
+        self.action_space_mode = action_space_mode
+        self.coarse_size = coarse_size
+        if action_space_mode == "discrete":
+            self.action_space = gym.spaces.Discrete(self.nb_flat_actions)
+        elif action_space_mode in ("multi_discrete", "hierarchical"):
+            self._build_multi_action_table()
+            self.action_space = gym.spaces.MultiDiscrete(self.multi_action_table.shape)
         else:
-            self.action_space = gym.spaces.Discrete(self.mouse_action_space + 2) # Action space with click only
+            raise ValueError(f"Unknown action space mode: {action_space_mode}")
+        self.end_turn_pending = False
+
+        # With pipeline_info, the HUD parsing (OCR) and debug output of a step run on a worker thread
+        # while the next action is played. The reward and info returned by a step are then those of
+        # the previous step (one step lag, see _finish_step_pipelined).
+        self.pipeline_info = pipeline_info
+        self._info_executor = None
+        self._pending_info: Optional[Future] = None
+        self._reset_info = {}
+
+        # With profile, each step phase is timed: per step timings are added to info["timings_ms"]
+        # and the histograms of the episode and of the whole run are dumped to the log dir at the end
+        # of each episode
+        self.profiler = StepProfiler(enabled=profile)
 
         self.last_gold = 0
+        self._last_observation = None
         self.current_x = 0
         self.current_y = 0
         self.current_x_pixel = 0
@@ -89,30 +146,101 @@ class LordsOfTheRealm2Gym(gym.Env):
         self.nb_step = 0
 
         self.game = "lotr2"
-        self.server = DOSGameServer(_get_next_port(), lite=False)
-        self.url = self.server.start("http://localhost:8080/lotr2.jsdos")
-        
-        self.browser = BrowserController(
-            headless=(render_mode != "human")
-        )
+        self.render_mode = render_mode
+        # The "mock" backend replays recorded or scripted frames without browser (see MockBrowserController)
+        if backend not in ("browser", "mock"):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        self.mock_kwargs = mock_kwargs or {}
+        # In lite mode the emulator stays paused and each step advances a fixed number of frames
+        self.lite = lite
+        self.frames_per_action = frames_per_action
+        # Unique id of the env, used for its page on the shared server and its log dir
+        self.env_id = env_id or _get_next_env_id()
+
+        # Heavy resources are acquired on first reset by _setup(), so that building the env
+        # (e.g. in every worker of a subprocess vector env) stays cheap and side-effect free
+        self.log_dir = None
+        self.server = None
+        self.url = None
+        self.browser = None
+        self.player_icon_img = None
+        self.main_menu_img = None
+        self.confirm_button_img = None
 
-        icon_path = "C:\\Users\\egoul\\Documents\\Projects\\lotr2-rl\\lotr2_rl\\gyms\\player_icon_gray.png"
-        logger.info('icon found: ', os.path.exists(icon_path))
-        self.player_icon_img = cv2.imread(icon_path)
-        
-        main_menu_path = "C:\\Users\\egoul\\Documents\\Projects\\lotr2-rl\\lotr2_rl\\gyms\\main_menu_gray.png"
-        logger.info('icon found: ', os.path.exists(main_menu_path))
-        self.main_menu_img = cv2.imread(main_menu_path)
-        
-        confirm_button_path = "C:\\Users\\egoul\\Documents\\Projects\\lotr2-rl\\lotr2_rl\\gyms\\confirm_button_gray.png"
-        logger.info('icon found: ', os.path.exists(confirm_button_path))
-        self.confirm_button_img = cv2.imread(confirm_button_path)
-        
         self.invalid_crown_texts = []
         self.end_of_turn_count = 0
 
+    def _setup(self) -> None:
+        """
+        Acquire the env resources and create its browser controller.
+        """
+        self._setup_resources()
+        if self.backend == "mock":
+            from lotr2_rl.emulators.mock.mock_browser_controller import MockBrowserController
+
+            self.browser = MockBrowserController(
+                lite=self.lite,
+                frames_per_action=self.frames_per_action,
+                profiler=self.profiler,
+                **self.mock_kwargs,
+            )
+            return
+
+        self.browser = BrowserController(
+            headless=(self.render_mode != "human"),
+            lite=self.lite,
+            frames_per_action=self.frames_per_action,
+            num_screenshots_per_action=0,  # The observation is captured once by _get_obs
+            profiler=self.profiler,
+        )
+
+    def _setup_resources(self) -> None:
+        """
+        Create the log dir, register the env page on the shared server and load the template images.
+        Shared with the vector env, which drives the page with its own browser.
+        """
+        self.log_dir = Path("logs") / "lotr2" / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.env_id}"
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+
+        # All the envs of the process share one server, each env has its own page
+        if self.backend == "mock":
+            self.url = f"mock://{self.env_id}"
+        else:
+            self.server, self.url = register_shared_env(self.env_id, "http://localhost:8080/lotr2.jsdos", lite=self.lite)
+        resource_opened("env")
+
+        self.player_icon_img = self._load_template("player_icon_gray.png")
+        self.main_menu_img = self._load_template("main_menu_gray.png")
+        self.confirm_button_img = self._load_template("confirm_button_gray.png")
+
+        if self.pipeline_info:
+            self._info_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"lotr2_info_{self.env_id}")
+
+    @staticmethod
+    def _load_template(name: str) -> np.ndarray:
+        path = TEMPLATES_DIR / name
+        image = cv2.imread(str(path))
+        if image is None:
+            raise FileNotFoundError(f"Template image not found: {path}")
+        return image
+
+    def __getstate__(self):
+        # Only the configuration is pickled, resources are acquired again on first reset
+        state = self.__dict__.copy()
+        for key in ("log_dir", "server", "url", "browser", "player_icon_img", "main_menu_img", "confirm_button_img",
+                    "_info_executor", "_pending_info", "_last_observation"):
+            state[key] = None
+        return state
+
     def _get_obs(self):
-        image_bytes = self.browser.get_screenshot()
+        return self._process_screenshot(self.browser.get_screenshot())
+
+    def _process_screenshot(self, image_bytes: bytes) -> np.ndarray:
+        with self.profiler.phase("decode"):
+            return self._decode_screenshot(image_bytes)
+
+    def _decode_screenshot(self, image_bytes: bytes) -> np.ndarray:
         # img = Image.frombytes('RGB', (640, 400), image_bytes)
         # img = Image.frombytes('RGB', (self.browser.viewport_dimensions['width'], self.browser.viewport_dimensions['height']), image_bytes)
         # img = img.crop((self.x_min, self.y_min, self.x_min + self.game_width, self.y_min + self.game_height))
@@ -123,14 +251,19 @@ class LordsOfTheRealm2Gym(gym.Env):
         # Decode image from array
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        # Crop the image to the game area
-        cropped_img = img[:-75, 76:-90] 
+        cropped_img = self._crop_screenshot(img)
         # Convert from BGR to Grayscale
         # cropped_gray_img = cv2.cvtColor(cropped_img, cv2.COLOR_BGR2GRAY)
         # cropped_gray_img = cv2.cvtColor(cropped_img, cv2.COLOR_)
-
-        cv2.imwrite(self.log_dir / f"obs_{self.server.port}.png", cropped_img)  # Save for debugging
         return cropped_img
+
+    @staticmethod
+    def _crop_screenshot(img: np.ndarray) -> np.ndarray:
+        # Crop the image to the game area
+        return img[:-75, 76:-90]
+
+    def _save_debug_observation(self, observation: np.ndarray) -> None:
+        cv2.imwrite(self.log_dir / f"obs_{self.env_id}.png", observation)  # Save for debugging
     
     def _get_info(self, observation: np.ndarray):
         crowns = self._get_crown(observation)
@@ -155,7 +288,12 @@ class LordsOfTheRealm2Gym(gym.Env):
         crowns_image = image[0:19, x:x+width] 
 
         # Extract text
-        text = pytesseract.image_to_string(crowns_image, lang="deu_latf")
+        with self.profiler.phase("ocr"):
+            # A controller knowing the text of the frames it serves (e.g. the mock one) spares the OCR.
+            # Envs of the async vector env have no controller of their own.
+            text = self.browser.read_text(crowns_image) if self.browser is not None else None
+            if text is None:
+                text = pytesseract.image_to_string(crowns_image, lang="deu_latf")
         logger.info("Text found:", text)
 
         crowns = None
@@ -198,53 +336,218 @@ class LordsOfTheRealm2Gym(gym.Env):
     ):
         # We need the following line to seed self.np_random
         super().reset(seed=seed)
+
+        if self.browser is None:
+            self._setup()
         
         if not self.browser.is_running:
             self.browser.start()
 
-        # Navigate to the initial URL
+        # Navigate to the initial URL, recovering the browser once if it fails
+        try:
+            observation = self._load_game()
+        except BrowserFailureError as e:
+            logger.error(f"Browser failure during reset: {e}")
+            self.browser.recover(self.url)
+            observation = self._load_game()
+        info = self._start_episode(observation)
+
+        return observation, info
+
+    def _load_game(self) -> np.ndarray:
         self.browser.navigate(self.url)
         self.browser.pre_load(self.game)
+        return self._get_obs()
 
-        observation = self._get_obs()
+    def _start_episode(self, observation: np.ndarray) -> dict:
+        # Wait for the info of the previous episode, so it does not overwrite the new episode state
+        if self._pending_info is not None:
+            self._pending_info.result()
+            self._pending_info = None
+
+        self._save_debug_observation(observation)
         info = self._get_info(observation)
         self.last_gold = info["gold"]
         self.nb_step = 0
-
-        return observation, info
+        self.end_turn_pending = False
+        self.profiler.end_step()  # Reset timings are not part of the first step
+        info["action_mask"] = self.action_masks()
+        self._reset_info = info
+        self._last_observation = observation
+        return info
     
     def step(self, action):
+        try:
+            return self._step(action)
+        except BrowserFailureError as e:
+            return self._truncate_on_failure(e)
+
+    def _step(self, action):
         # todo: apply the action into Dosbox emulator
-        self._play(action)
+        action = self._to_flat_action(action)
+        with self.profiler.phase("action"):
+            for i, primitive_action in enumerate(self._expand_action(action)):
+                if i > 0:
+                    self.browser.wait(self.sleep_second)
+                self._play(primitive_action)
         self.nb_step += 1
 
+        self.browser.check_health()
         observation = self._get_obs()
         is_end_turn = self._is_end_turn_animation(observation)
         # s_full_screen_menu = self._is_full_screen_menu(observation)
         wait_count = 0
-        while is_end_turn and wait_count < 5:
-            time.sleep(1)
-            wait_count += 1
-            observation = self._get_obs()
-            is_end_turn = self._is_end_turn_animation(observation)
-            # s_full_screen_menu = self._is_full_screen_menu(observation)
-        if wait_count >= 5:
+        with self.profiler.phase("end_turn_wait"):
+            while is_end_turn and wait_count < self.max_end_turn_wait:
+                self.browser.wait(1)
+                wait_count += 1
+                observation = self._get_obs()
+                is_end_turn = self._is_end_turn_animation(observation)
+                # s_full_screen_menu = self._is_full_screen_menu(observation)
+        return self._finish_step(observation, end_turn_timeout=wait_count >= self.max_end_turn_wait)
+
+    def _finish_step(self, observation: np.ndarray, end_turn_timeout: bool = False):
+        """
+        Compute the reward and info of a step from its final observation.
+        
+        Args:
+            observation: The observation after the action and the end of turn animation
+            end_turn_timeout: Whether the end of turn animation was still running when the wait stopped
+            
+        Returns:
+            The step tuple (observation, reward, terminated, truncated, info)
+        """
+        if end_turn_timeout:
             logger.warning("End of turn time out")
             cv2.imwrite(self.log_dir / f"endofturn_{self.end_of_turn_count}.png", observation)  # Save for debugging
             self.end_of_turn_count += 1
-        info = self._get_info(observation)
+        self.end_turn_pending = end_turn_timeout
 
         terminated = False # todo: get if game is winned or losted
         truncated = True if self.nb_step >= self.nb_step_reset else False # todo: do we want to setup a time limit for episode training?
+
+        if self.pipeline_info:
+            reward, info = self._finish_step_pipelined(observation, terminated or truncated)
+        else:
+            reward, info = self._compute_reward_info(observation)
+
+        if self.profiler.enabled:
+            info["timings_ms"] = self.profiler.end_step()
+            if terminated or truncated:
+                self.profiler.dump(self.log_dir / "profile.json")
+        self._last_observation = observation
+        return observation, reward, terminated, truncated, info
+
+    def _truncate_on_failure(self, error: BrowserFailureError):
+        """
+        End the episode after the browser hung, crashed or froze during a step.
+        The browser is recovered in place so the next reset starts right away.
+        
+        Args:
+            error: The browser failure
+            
+        Returns:
+            The step tuple, truncated, with the last observation and the failure reason in info
+        """
+        logger.error(f"Browser failure at step {self.nb_step}: {error}")
+        recovery = self.browser.recover(self.url)
+
+        info = {
+            "gold": self.last_gold,
+            "truncation_reason": str(error),
+            "recovery": recovery,
+            "action_mask": self.action_masks(),
+        }
+        # In pipelined mode, the failed step pays the reward of the last completed step
+        reward = info["lagged_reward"] = self.pop_pending_reward()
+        if self.profiler.enabled:
+            info["timings_ms"] = self.profiler.end_step()
+        return self._last_observation, reward, False, True, info
+
+    def pop_pending_reward(self) -> float:
+        """
+        Get the reward of the last step not returned yet in pipelined mode, for callers ending an
+        episode without a terminal step (e.g. on a step limit of their own).
+
+        Returns:
+            The reward, 0 when there is none
+        """
+        if self._pending_info is None:
+            return 0
+        pending, self._pending_info = self._pending_info, None
+        reward, _ = pending.result()
+        return reward
+
+    def _finish_step_pipelined(self, observation: np.ndarray, done: bool) -> Tuple[float, dict]:
+        """
+        Submit the reward and info computation of this step to the worker thread and return
+        those of the previous step, which ran while this step's action was played.
+        The first step of an episode returns a reward of 0 and the reset info. The last step waits
+        for its own computation and returns its info, with its reward plus the reward of the previous
+        step, which would be lost otherwise (info["lagged_reward"] holds the part of the previous step).
+        The phases of the worker are timed apart, as info["info_timings_ms"] of the step they belong to.
+        
+        Args:
+            observation: The observation after the action and the end of turn animation
+            done: Whether the episode ends with this step
+            
+        Returns:
+            The reward and info, lagging by one step
+        """
+        previous = self._pending_info
+        current = self._info_executor.submit(self._compute_reward_info_captured, observation)
+        self._pending_info = current
+
+        if previous is None:
+            reward, info = 0, dict(self._reset_info)
+        else:
+            reward, info = previous.result()
+
+        if done:
+            lagged_reward = reward
+            reward, info = current.result()
+            info["lagged_reward"] = lagged_reward
+            reward += lagged_reward
+            self._pending_info = None
+
+        info["reward_lag"] = 0 if done else 1
+        return reward, info
+
+    def _compute_reward_info_captured(self, observation: np.ndarray) -> Tuple[float, dict]:
+        """ _compute_reward_info run on the worker thread, with its phases timed apart from the current step. """
+        with self.profiler.capture() as timings_ms:
+            reward, info = self._compute_reward_info(observation)
+        if self.profiler.enabled:
+            info["info_timings_ms"] = timings_ms
+        return reward, info
+
+    def _compute_reward_info(self, observation: np.ndarray) -> Tuple[float, dict]:
+        """
+        Parse the HUD of the observation and compute the reward of the step.
+        
+        Args:
+            observation: The observation after the action and the end of turn animation
+            
+        Returns:
+            The reward and info of the step
+        """
+        self._save_debug_observation(observation)
+        info = self._get_info(observation)
+        info["action_mask"] = self.action_masks()
+
         reward = max(info["gold"] - self.last_gold, 0) # todo: build a reward function
 
         if reward > 0:
             logger.info(f"Gained Reward: {reward} (gold: {info['gold']} - last_gold: {self.last_gold})")
 
         self.last_gold = info["gold"]
-        return observation, reward, terminated, truncated, info
+        return reward, info
 
     def _is_end_turn_animation(self, observation) -> bool:
+        with self.profiler.phase("template_match"):
+            return self._match_end_turn_animation(observation)
+
+    def _match_end_turn_animation(self, observation) -> bool:
         if not is_image_present(observation, self.main_menu_img):
             return False
         if is_image_present(observation, self.player_icon_img):
@@ -269,53 +572,252 @@ class LordsOfTheRealm2Gym(gym.Env):
 
     def _play(self, action: int):
         # logger.info(f'Play action {action}')
+        target = self._decode_action(action)
+        if target is None:
+            return
+
+        x_pixel, y_pixel = target
+        self.browser.execute_action("move", f"{x_pixel},{y_pixel}")
+        # time.sleep(self.sleep_second)
+
+        # When they is no drag, directly perform a click after moving the mouse
+        # This remove the learning of action chain of mouve + press + release to click on a game button
+        if not self.enable_drag:
+            self.browser.execute_action("click", "")
+
+    def _to_flat_action(self, action) -> int:
+        """
+        Convert an action of the action space into an action of the flat Discrete space.
+        
+        Args:
+            action: The action from the action space
+            
+        Returns:
+            The flat action
+        """
+        if self.action_space_mode == "discrete":
+            return int(action)
+        return int(self.multi_action_table[tuple(np.asarray(action, dtype=np.int64))])
+
+    def _build_multi_action_table(self) -> None:
+        """
+        Precompute the flat action of every MultiDiscrete action [action_type, position...].
+        Action types are wait, click, press and release when drag is enabled, then the macro actions;
+        positions are ignored by all types but click.
+        
+        With the "multi_discrete" mode the position is the (x, y) grid cell. With the "hierarchical"
+        mode it is a coarse region of coarse_size x coarse_size cells and a fine offset inside it,
+        so the policy output grows linearly with the grid resolution.
+        """
+        delta = 3 if self.enable_drag else 1
+        cells_x, cells_y = np.meshgrid(np.arange(self.grid_width), np.arange(self.grid_height), indexing="ij")
+        grid_actions = cells_x + self.grid_width * cells_y + delta
+
+        if self.action_space_mode == "hierarchical":
+            coarse_width = math.ceil(self.grid_width / self.coarse_size)
+            coarse_height = math.ceil(self.grid_height / self.coarse_size)
+            regions, offsets = np.meshgrid(
+                np.arange(coarse_width * coarse_height), np.arange(self.coarse_size ** 2), indexing="ij"
+            )
+            # Offsets past the right or bottom edge of the grid are clipped to the edge
+            x = np.minimum((regions % coarse_width) * self.coarse_size + offsets % self.coarse_size, self.grid_width - 1)
+            y = np.minimum((regions // coarse_width) * self.coarse_size + offsets // self.coarse_size, self.grid_height - 1)
+            position_actions = grid_actions[x, y]
+        else:
+            position_actions = grid_actions
+
+        type_actions = [None, None] + ([1, 2] if self.enable_drag else [])
+        type_actions += [self.nb_primitive_actions + i for i in range(len(self.macro_actions))]
+        self.multi_action_table = np.empty((len(type_actions),) + position_actions.shape, dtype=np.int64)
+        for action_type, flat_action in enumerate(type_actions):
+            self.multi_action_table[action_type] = flat_action if flat_action is not None else 0
+        self.multi_action_table[1] = position_actions
+
+        # Validity of each position of the click type, and its projection on each position dimension:
+        # a value is masked when all the positions it is part of are invalid
+        self.position_valid = self.action_valid[position_actions]
+        self.position_dim_masks = [
+            self.position_valid.any(axis=tuple(a for a in range(self.position_valid.ndim) if a != axis))
+            for axis in range(self.position_valid.ndim)
+        ]
+        # Same valid actions as the Discrete table: the press and release types (not implemented,
+        # see _decode_action) are masked, click is valid while any position is
+        self.type_valid = np.array(
+            [True, bool(self.position_valid.any())] + [bool(self.action_valid[a]) for a in type_actions[2:]],
+            dtype=bool,
+        )
+
+    def _expand_action(self, action: int) -> List[int]:
+        """
+        Get the primitive actions played for an action of the action space.
+        
+        Args:
+            action: The action from the action space
+            
+        Returns:
+            The steps of a macro action, or the primitive action repeated `action_repeat` times
+        """
+        if action >= self.nb_primitive_actions:
+            return self.macro_actions[action - self.nb_primitive_actions]
+        return [action] * self.action_repeat
+
+    def _to_action(self, macro_step: Union[int, Tuple[float, float]]) -> int:
+        """
+        Convert a macro action step into a primitive action.
+        
+        Args:
+            macro_step: A primitive action, or (x, y) page coordinates to click
+            
+        Returns:
+            The primitive action
+        """
+        if isinstance(macro_step, (int, np.integer)):
+            return int(macro_step)
+        x, y = macro_step
+        grid_x = int((x - self.x_min) // self.grid_size) + 1
+        grid_y = int((y - self.y_min) // self.grid_size) + 1
+        return self.coordinate_to_action(grid_x, grid_y)
+
+    def _decode_action(self, action: int) -> Optional[Tuple[float, float]]:
+        """
+        Convert an action into the page coordinates to click, with a lookup in the action table.
         
+        Args:
+            action: The action from the action space
+            
+        Returns:
+            The (x, y) page coordinates, or None when the action does nothing
+        """
         if action == 0:
             logger.info('Wait action')
             # Wait action
-            return
+            return None
 
-        # if self._is_mouse_button_action(action):
-        #     self._play_mouse_button_action(action)
+        if action < 0 or action >= self.nb_primitive_actions:
+            raise ValueError(f'Action should be in range of primitive actions [0, {self.nb_primitive_actions - 1}]')
 
-        else:
-            delta = 3 if self.enable_drag else 1
-            mouse_action = action - delta
-            if mouse_action < 0 or mouse_action > self.mouse_action_space * 2:
-                raise ValueError(f'Action should be in range of action space [0, {self.mouse_action_space * 2}]')
+        # Mouse button actions (drag) are not implemented yet
+        if self.action_grid_x[action] == 0:
+            logger.info(f"Not supported action {action} when enable_drag is {self.enable_drag}")
+            return None
 
-            # logger.debug(f'Play mouse action {mouse_action}')
-            x = (mouse_action % self.mouse_action_space) % self.grid_width + 1
-            y = (mouse_action % self.mouse_action_space) // self.grid_width + 1
-            # print(f'grid ({x}, {y})')
+        self.current_x = int(self.action_grid_x[action])
+        self.current_y = int(self.action_grid_y[action])
 
-            self.current_x = x
-            self.current_y = y
+        if not self.action_valid[action]:
+            logger.info(f"Prevent moving inside excluded area: {self.action_x_pixels[action]}, {self.action_y_pixels[action]}")
+            return None
 
-            x_pixel = self.grid_to_pixel(x)
-            y_pixel = self.grid_to_pixel(y)
-            # print(f'pixel ({x_pixel}, {y_pixel})')
+        self.current_x_pixel = float(self.action_x_pixels[action])
+        self.current_y_pixel = float(self.action_y_pixels[action])
 
-            if self._is_in_excluded_area(x_pixel, y_pixel):
-                logger.info(f"Prevent moving inside excluded area: {x_pixel}, {y_pixel}")
-                return
+        x_pixel = self.current_x_pixel + self.x_min
+        y_pixel = self.current_y_pixel + self.y_min
 
-            self.current_x_pixel = x_pixel
-            self.current_y_pixel = y_pixel
+        logger.info(f'mouse_move {action} : move at grid=({self.current_x}, {self.current_y}), pixel=({x_pixel}, {y_pixel})')
+        return x_pixel, y_pixel
 
-            x_pixel += self.x_min
-            y_pixel += self.y_min
+    def _build_action_table(self) -> None:
+        """
+        Precompute the grid cell, game pixel and validity of every action of the action space,
+        so decoding an action is a single lookup and invalid actions can be masked.
+        Actions that land in an excluded area (minimap, bottom menu) are invalid.
+        """
+        nb_actions = self.nb_primitive_actions
+        delta = 3 if self.enable_drag else 1
+        mouse_actions = np.arange(nb_actions) - delta
+        cells = mouse_actions % self.mouse_action_space
+
+        # Grid coordinates start at 1, 0 is used for actions that are not mouse moves
+        is_mouse_action = mouse_actions >= 0
+        self.action_grid_x = np.where(is_mouse_action, cells % self.grid_width + 1, 0)
+        self.action_grid_y = np.where(is_mouse_action, cells // self.grid_width + 1, 0)
+        self.action_x_pixels = self.grid_to_pixel(self.action_grid_x).astype(np.float32)
+        self.action_y_pixels = self.grid_to_pixel(self.action_grid_y).astype(np.float32)
+
+        excluded = np.array([
+            is_mouse and self._is_in_excluded_area(x, y)
+            for is_mouse, x, y in zip(is_mouse_action, self.action_x_pixels, self.action_y_pixels)
+        ], dtype=bool)
+        self.action_valid = is_mouse_action & ~excluded
+        self.action_valid[0] = True  # Wait action
+
+        # Macro actions are always valid
+        self.action_valid = np.concatenate([self.action_valid, np.ones(len(self.macro_actions), dtype=bool)])
+
+    def action_masks(self) -> np.ndarray:
+        """
+        Get the mask of the currently valid actions, as used by maskable PPO.
+        Combines the static mask of the action table with the game state:
+        only the wait action is valid while the end of turn animation is still running.
+        
+        Returns:
+            A boolean array of the size of the action space, or the concatenated masks
+            of each dimension for the MultiDiscrete action spaces
 
-            logger.info(f'mouse_move {mouse_action} : move at grid=({x}, {y}), pixel=({x_pixel}, {y_pixel})')
-            self.browser.execute_action("move", f"{x_pixel},{y_pixel}")
-            # time.sleep(self.sleep_second)
+        The masks of the MultiDiscrete action spaces are factored per dimension, so they only remove
+        the position values whose positions are all invalid: a position made of valid values can
+        still be in an excluded area (e.g. the minimap corner). Use `position_masks` for the exact
+        validity of each position.
+        """
+        if self.action_space_mode != "discrete":
+            type_mask = self.type_valid.copy()
+            if self.end_turn_pending:
+                type_mask[1:] = False
+            return np.concatenate([type_mask] + self.position_dim_masks)
+
+        if self.end_turn_pending:
+            mask = np.zeros_like(self.action_valid)
+            mask[0] = True
+            return mask
+        return self.action_valid.copy()
+
+    def position_masks(self) -> np.ndarray:
+        """
+        Get the validity of every position of the click type of the MultiDiscrete action spaces,
+        which the factored masks of `action_masks` cannot express.
 
-            # When they is no drag, directly perform a click after moving the mouse
-            # This remove the learning of action chain of mouve + press + release to click on a game button
-            if not self.enable_drag:
-                self.browser.execute_action("click", "")
+        Returns:
+            A boolean array of shape (grid_width, grid_height) in "multi_discrete" mode,
+            (regions, offsets) in "hierarchical" mode
+        """
+        if self.action_space_mode == "discrete":
+            raise ValueError("Position masks are only defined for the MultiDiscrete action spaces")
+        return self.position_valid.copy()
+
+    def get_profile(self, path: Optional[Path] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Get the step phase statistics, only available with the profile option.
+
+        Args:
+            path: File the statistics are written to as JSON
+
+        Returns:
+            count, mean, p50, p95, p99 and max (in milliseconds) by phase, since the previous call or
+            end of episode ("window") and since the env creation ("total")
+        """
+        return self.profiler.dump(path)
+
+    def close(self) -> None:
+        """
+        Release the env resources: browser, page on the shared server (stopped with the last env)
+        and info worker. The env acquires them again on next reset.
+        """
+        if self.browser is not None:
+            self.browser.close()
+            self.browser = None
+        if self._info_executor is not None:
+            self._info_executor.shutdown(wait=True)
+            self._info_executor = None
+        self._pending_info = None
+        if self.url is not None:
+            if self.backend == "browser":
+                unregister_shared_env(self.env_id)
+            self.server = None
+            self.url = None
+            resource_closed("env")
+        super().close()
 
-            
     # def _play_mouse_button(self, button: MouseButtonAction):
     #     if button == MouseButtonAction.Press:
     #         # print(f'mouse_press')
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from typing import Any, List, Optional, Sequence
+
+import gymnasium as gym
+import numpy as np
+from playwright.async_api import async_playwright
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices, VecEnvObs, VecEnvStepReturn
+
+from playwright.async_api import Error as PlaywrightError
+
+from lotr2_rl.emulators.dos.async_browser_controller import AsyncBrowserController
+from lotr2_rl.emulators.dos.browser_controller import BrowserFailureError
+from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+from lotr2_rl.resources import (
+    get_browser_tag_arg,
+    kill_browser,
+    new_browser_tag,
+    register_browser,
+    resource_closed,
+    resource_opened,
+    unregister_browser,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LordsOfTheRealm2VecEnv(VecEnv):
+    """
+    Vector env driving N emulator pages of one browser from a single process with asyncio.
+    All the actions are dispatched at once and the captures are awaited concurrently, so the
+    time spent waiting on the browser overlaps between envs instead of adding up.
+
+    Each env keeps a LordsOfTheRealm2Gym instance for its state and its action, observation and
+    reward logic; only the page interactions are done here. OCR and template matching run on a
+    thread pool so they do not block the event loop.
+
+    Like LordsOfTheRealm2Gym, a step whose page hangs, crashes or freezes ends the episode of its env
+    (truncated, with the reason in info) and the page is recovered, without stalling the other envs.
+    """
+    def __init__(self, n_envs: int, env_kwargs: Optional[dict] = None, headless: bool = True,
+                 step_timeout_s: float = 60.0, reset_timeout_s: float = 120.0):
+        """
+        Initialize the vector env. The browser is launched on first reset.
+
+        Args:
+            n_envs: Number of emulator pages
+            env_kwargs: Keyword arguments of each LordsOfTheRealm2Gym
+            headless: Whether to run the browser in headless mode
+            step_timeout_s: Maximum duration of the step of one env, end of turn wait included
+            reset_timeout_s: Maximum duration of the reset of one env (page load and preload actions)
+        """
+        self.envs = [LordsOfTheRealm2Gym(**(env_kwargs or {})) for _ in range(n_envs)]
+        super().__init__(n_envs, self.envs[0].observation_space, self.envs[0].action_space)
+
+        self.headless = headless
+        self.step_timeout_s = step_timeout_s
+        self.reset_timeout_s = reset_timeout_s
+        self.controllers: List[AsyncBrowserController] = []
+        self.actions = None
+
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=n_envs, thread_name_prefix="lotr2_vec_env")
+        self._playwright = None
+        self._browser = None
+        self._browser_tag = None
+
+        self._obs = np.zeros((n_envs,) + self.observation_space.shape, dtype=self.observation_space.dtype)
+        self._rewards = np.zeros((n_envs,), dtype=np.float32)
+        self._dones = np.zeros((n_envs,), dtype=bool)
+        self._infos: List[dict] = [{} for _ in range(n_envs)]
+
+    def reset(self) -> VecEnvObs:
+        self._run(self._reset_all())
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs.copy()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.actions = actions
+
+    def step_wait(self) -> VecEnvStepReturn:
+        self._run(self._step_all())
+        return self._obs.copy(), self._rewards.copy(), self._dones.copy(), deepcopy(self._infos)
+
+    def close(self) -> None:
+        if self._browser is not None:
+            self._run(self._close_browser())
+        for env in self.envs:
+            env.close()
+        self._executor.shutdown(wait=True)
+        self._loop.close()
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return [getattr(self.envs[i], attr_name) for i in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        for i in self._get_indices(indices):
+            setattr(self.envs[i], attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs) for i in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type[gym.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+    def get_images(self) -> Sequence[Optional[np.ndarray]]:
+        return list(self._obs)
+
+    def _run(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+    async def _cpu(self, function, *args):
+        """ Run CPU bound work (decode, OCR, template matching) on the thread pool. """
+        return await self._loop.run_in_executor(self._executor, function, *args)
+
+    async def _start_browser(self) -> None:
+        if any(env.backend != "browser" for env in self.envs):
+            raise ValueError("The async vector env only drives browser envs, use make_vec_env for the mock backend")
+
+        self._playwright = await async_playwright().start()
+        self._browser_tag = new_browser_tag()
+        self._browser = await self._playwright.chromium.launch(
+            headless=self.headless, args=["--disable-web-security", get_browser_tag_arg(self._browser_tag)]
+        )
+        register_browser(self, self._browser_tag)
+        resource_opened("browser")
+
+        for env in self.envs:
+            env._setup_resources()
+            controller = AsyncBrowserController(
+                headless=self.headless,
+                lite=env.lite,
+                frames_per_action=env.frames_per_action,
+                profiler=env.profiler,
+            )
+            await controller.start(self._browser)
+            self.controllers.append(controller)
+
+    async def _close_browser(self) -> None:
+        for controller in self.controllers:
+            await controller.close()
+        self.controllers = []
+        kill_browser(self._browser_tag)
+        await self._browser.close()
+        await self._playwright.stop()
+        unregister_browser(self)
+        resource_closed("browser")
+        self._browser_tag = None
+        self._browser = None
+        self._playwright = None
+
+    async def _reset_all(self) -> None:
+        if self._browser is None:
+            await self._start_browser()
+        await asyncio.gather(*(self._reset_env_watched(i) for i in range(self.num_envs)))
+
+    async def _step_all(self) -> None:
+        # Gathered inside the loop of the env, not in the default loop of the thread
+        await asyncio.gather(*(self._step_env(i, action) for i, action in enumerate(self.actions)))
+
+    async def _reset_env_watched(self, i: int) -> None:
+        """ Reset an env, recovering its page once if it fails. """
+        try:
+            await asyncio.wait_for(self._reset_env(i), self.reset_timeout_s)
+        except (asyncio.TimeoutError, BrowserFailureError, PlaywrightError, ValueError) as e:
+            logger.error(f"Browser failure during the reset of env {i}: {e!r}")
+            await self.controllers[i].recover(self.envs[i].url, self.reset_timeout_s)
+            await asyncio.wait_for(self._reset_env(i), self.reset_timeout_s)
+
+    async def _reset_env(self, i: int) -> None:
+        env = self.envs[i]
+        controller = self.controllers[i]
+
+        # Seed the env random generator like gym.Env.reset would
+        gym.Env.reset(env, seed=self._seeds[i])
+
+        await controller.navigate(env.url)
+        await controller.pre_load(env.game)
+
+        observation = await self._cpu(env._process_screenshot, await controller.get_screenshot())
+        self.reset_infos[i] = await self._cpu(env._start_episode, observation)
+        self._obs[i] = observation
+
+    async def _step_env(self, i: int, action) -> None:
+        try:
+            step = await asyncio.wait_for(self._play_step(i, action), self.step_timeout_s)
+        except asyncio.TimeoutError:
+            step = await self._truncate_on_failure(i, f"step exceeded its {self.step_timeout_s}s deadline")
+        except (BrowserFailureError, PlaywrightError) as e:
+            reason = "page crashed" if self.controllers[i]._crashed else str(e)
+            step = await self._truncate_on_failure(i, reason)
+        observation, reward, terminated, truncated, info = step
+
+        # Convert to the SB3 VecEnv api and reset finished episodes
+        done = terminated or truncated
+        info["TimeLimit.truncated"] = truncated and not terminated
+        if done:
+            info["terminal_observation"] = observation
+            await self._reset_env_watched(i)
+        else:
+            self._obs[i] = observation
+
+        self._rewards[i] = reward
+        self._dones[i] = done
+        self._infos[i] = info
+
+    async def _truncate_on_failure(self, i: int, reason: str):
+        """
+        End the episode of an env whose page hung, crashed or froze, like LordsOfTheRealm2Gym._truncate_on_failure.
+
+        Returns:
+            The step tuple, truncated, with the last observation and the failure reason in info
+        """
+        env = self.envs[i]
+        logger.error(f"Browser failure of env {i} at step {env.nb_step}: {reason}")
+        recovery = await self.controllers[i].recover(env.url, self.reset_timeout_s)
+
+        info = {
+            "gold": env.last_gold,
+            "truncation_reason": reason,
+            "recovery": recovery,
+            "action_mask": env.action_masks(),
+        }
+        # In pipelined mode, the failed step pays the reward of the last completed step
+        reward = info["lagged_reward"] = await self._loop.run_in_executor(None, env.pop_pending_reward)
+        if env.profiler.enabled:
+            info["timings_ms"] = env.profiler.end_step()
+        return env._last_observation, reward, False, True, info
+
+    async def _play_step(self, i: int, action):
+        env = self.envs[i]
+        controller = self.controllers[i]
+        action = env._to_flat_action(action)
+
+        for step, primitive_action in enumerate(env._expand_action(action)):
+            if step > 0:
+                await controller.wait(env.sleep_second)
+            target = env._decode_action(primitive_action)
+            if target is not None:
+                x_pixel, y_pixel = target
+                await controller.move_mouse(x_pixel, y_pixel)
+                if not env.enable_drag:
+                    await controller.click(x_pixel, y_pixel)
+        env.nb_step += 1
+
+        await controller.check_health()
+        observation = await self._cpu(env._process_screenshot, await controller.get_screenshot())
+        wait_count = 0
+        while wait_count < env.max_end_turn_wait and await self._cpu(env._is_end_turn_animation, observation):
+            await controller.wait(1)
+            wait_count += 1
+            observation = await self._cpu(env._process_screenshot, await controller.get_screenshot())
+
+        return await self._cpu(env._finish_step, observation, wait_count >= env.max_end_turn_wait)
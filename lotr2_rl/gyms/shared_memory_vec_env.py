@@ -0,0 +1,173 @@
+import logging
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Optional
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnvObs, VecEnvStepReturn
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+logger = logging.getLogger(__name__)
+
+
+def _shared_memory_worker(
+    remote: mp.connection.Connection,
+    parent_remote: mp.connection.Connection,
+    env_fn_wrapper: CloudpickleWrapper,
+) -> None:
+    """
+    Same protocol as the SubprocVecEnv worker, except that the observations of step and reset are
+    written to the shared observation block, row `index`, instead of being sent through the pipe.
+    """
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+    shared_memory = None
+    observations = None
+    index = 0
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "attach":
+                name, shape, dtype, index = data
+                # The workers share the resource tracker of the parent, which unlinks the block on close
+                shared_memory = SharedMemory(name=name)
+                observations = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+                remote.send(None)
+            elif cmd == "step":
+                observation, reward, terminated, truncated, info = env.step(data)
+                # Convert to the SB3 VecEnv api
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info = {}
+                if done:
+                    # The terminal observation is only sent at the end of episodes, through the pipe
+                    info["terminal_observation"] = observation
+                    observation, reset_info = env.reset()
+                observations[index] = observation
+                remote.send((reward, done, info, reset_info))
+            elif cmd == "reset":
+                maybe_options = {"options": data[1]} if data[1] else {}
+                observation, reset_info = env.reset(seed=data[0], **maybe_options)
+                observations[index] = observation
+                remote.send(reset_info)
+            elif cmd == "render":
+                remote.send(env.render())
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "has_attr":
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
+
+    observations = None
+    if shared_memory is not None:
+        shared_memory.close()
+
+
+class SharedMemoryVecEnv(SubprocVecEnv):
+    """
+    Subprocess vector env whose workers write their observations directly into one shared memory
+    block laid out as (n_envs, *observation_shape). Only the actions, rewards, dones and infos go
+    through the pipes, instead of pickling a ~640 KB screen per env and step.
+
+    Only Box observation spaces are supported. The observations returned by step and reset are a copy
+    of the block, so they stay valid while the workers write the next ones.
+    """
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None):
+        """
+        Start one worker process per env and allocate the shared observation block.
+
+        Args:
+            env_fns: Functions creating the envs, called in the workers
+            start_method: multiprocessing start method, defaults to forkserver when available, else spawn
+        """
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(self.work_remotes, self.remotes, env_fns):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn))
+            # daemon=True: if the main process crashes, the workers do not hang
+            process = ctx.Process(target=_shared_memory_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        if not isinstance(observation_space, gym.spaces.Box):
+            self._close_workers()
+            raise ValueError(f"SharedMemoryVecEnv only supports Box observation spaces, got {observation_space}")
+
+        shape = (n_envs,) + observation_space.shape
+        dtype = np.dtype(observation_space.dtype)
+        self._shared_memory = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self._observations = np.ndarray(shape, dtype=dtype, buffer=self._shared_memory.buf)
+        for index, remote in enumerate(self.remotes):
+            remote.send(("attach", (self._shared_memory.name, shape, dtype.str, index)))
+        for remote in self.remotes:
+            remote.recv()
+
+        # Skip SubprocVecEnv.__init__, the workers are already started
+        super(SubprocVecEnv, self).__init__(n_envs, observation_space, action_space)
+
+    def step_wait(self) -> VecEnvStepReturn:
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos, self.reset_infos = zip(*results)
+        return self._observations.copy(), np.stack(rewards), np.stack(dones), infos
+
+    def reset(self) -> VecEnvObs:
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self._observations.copy()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._close_workers()
+        self._observations = None
+        self._shared_memory.close()
+        self._shared_memory.unlink()
+
+    def _close_workers(self) -> None:
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
@@ -0,0 +1,326 @@
+"""
+Batched policy inference for many envs.
+
+Envs running in threads of this process call `InferenceServer.predict`, envs or agents running
+in other processes connect to the server over a local socket with `InferenceClient`. Pending
+observations are gathered and evaluated in one forward pass, as soon as `max_batch_size`
+observations are pending or the oldest one has waited `max_latency_ms`.
+
+    python -m lotr2_rl.inference_server --model lotr2_ppo_model --address /tmp/lotr2_policy.sock
+"""
+import argparse
+import logging
+import queue
+import threading
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import gymnasium as gym
+import numpy as np
+
+from lotr2_rl.profiler import LogHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTHKEY = b"lotr2-rl"
+
+
+class RandomPolicy:
+    """
+    Policy sampling uniform actions, with the `predict` interface of SB3 models.
+    """
+    def __init__(self, action_space: gym.spaces.Space):
+        self.action_space = action_space
+
+    def predict(self, observations: np.ndarray, deterministic: bool = False):
+        return np.stack([self.action_space.sample() for _ in range(len(observations))]), None
+
+
+def load_policy(path: str):
+    """
+    Load a model saved by the PPO training (zip archive) or a policy saved by the actor-learner.
+
+    Args:
+        path: File of the model, with or without the .zip extension
+
+    Returns:
+        An object with the `predict(observations, deterministic)` interface of SB3 models
+    """
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.policies import ActorCriticPolicy
+
+    path = Path(path)
+    zip_path = path if path.suffix == ".zip" else path.with_name(path.name + ".zip")
+    if zip_path.exists() and zipfile.is_zipfile(zip_path):
+        return PPO.load(zip_path, device="cpu")
+    return ActorCriticPolicy.load(str(path), device="cpu")
+
+
+def stacked_predictor(predictor, frame_stack: int = 1) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Wrap the predict method of a server or client for one env of a policy trained on stacked frames.
+    Frames are stacked along the channels, newest last, like VecFrameStack during the training.
+
+    Args:
+        predictor: InferenceServer or InferenceClient
+        frame_stack: Number of stacked frames
+
+    Returns:
+        A function giving the action of the next observation of one episode
+    """
+    stack = None
+
+    def predict(observation: np.ndarray) -> np.ndarray:
+        nonlocal stack
+        if frame_stack == 1:
+            return predictor.predict(observation)
+        if stack is None:
+            stack = np.zeros(observation.shape[:-1] + (observation.shape[-1] * frame_stack,), dtype=observation.dtype)
+        channels = observation.shape[-1]
+        stack[..., :-channels] = stack[..., channels:]
+        stack[..., -channels:] = observation
+        return predictor.predict(stack.copy())
+
+    return predict
+
+
+class InferenceServer:
+    """
+    Thread evaluating the observations of many callers in batches.
+    """
+    def __init__(self, model, max_batch_size: int = 32, max_latency_ms: float = 5.0, deterministic: bool = True):
+        """
+        Args:
+            model: Object with the `predict(observations, deterministic)` interface of SB3 models
+            max_batch_size: Maximum number of observations of a forward pass
+            max_latency_ms: Maximum time the oldest pending observation waits for others to join its batch
+            deterministic: Whether to take the most likely actions instead of sampling them
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency_s = max_latency_ms / 1000
+        self.deterministic = deterministic
+
+        self._requests: "queue.Queue[tuple]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listener: Optional[Listener] = None
+        self._listener_thread: Optional[threading.Thread] = None
+
+        self._stats_lock = threading.Lock()
+        self._latency = LogHistogram()
+        self._forward = LogHistogram()
+        self._batch_sizes = Counter()
+
+    def start(self) -> "InferenceServer":
+        """ Start the batching thread. """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._batch_loop, name="inference_server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """ Stop the batching thread and the socket listener, pending requests fail. """
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                _, _, future = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError("Inference server stopped"))
+
+    def __enter__(self) -> "InferenceServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def predict(self, observation: np.ndarray, timeout_s: Optional[float] = None) -> np.ndarray:
+        """
+        Get the action of one observation, evaluated in a batch with those of the other callers.
+
+        Args:
+            observation: Observation of one env
+            timeout_s: Maximum time to wait for the action
+
+        Returns:
+            The action
+        """
+        future = Future()
+        self._requests.put((observation, time.perf_counter_ns(), future))
+        return future.result(timeout=timeout_s)
+
+    def serve(self, address: str, authkey: bytes = DEFAULT_AUTHKEY) -> None:
+        """
+        Accept `InferenceClient` connections on a local socket, each served by a thread.
+
+        Args:
+            address: Path of the Unix socket (or "host:port" for a TCP socket)
+            authkey: Key the clients must present
+        """
+        self.start()
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            address = (host, int(port))
+        self._listener = Listener(address, authkey=authkey)
+        self._listener_thread = threading.Thread(target=self._accept_loop, name="inference_listener", daemon=True)
+        self._listener_thread.start()
+        logger.info(f"Inference server listening on {self._listener.address}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Get the batching metrics collected so far.
+
+        Returns:
+            Number of requests and batches, mean and percentiles of the batch sizes, latency of the
+            requests (from the call to the action) and duration of the forward passes, in milliseconds
+        """
+        with self._stats_lock:
+            sizes = sorted(self._batch_sizes.elements())
+            stats = {
+                "requests": self._latency.count,
+                "batches": len(sizes),
+                "batch_size_mean": float(np.mean(sizes)) if sizes else 0.0,
+                "batch_size_p50": float(np.percentile(sizes, 50)) if sizes else 0.0,
+                "batch_size_max": float(sizes[-1]) if sizes else 0.0,
+            }
+            for name, histogram in (("latency", self._latency), ("forward", self._forward)):
+                stats[f"{name}_mean_ms"] = histogram.total_ns / histogram.count / 1e6 if histogram.count else 0.0
+                for q in (50, 95, 99):
+                    stats[f"{name}_p{q}_ms"] = histogram.percentile(q) / 1e6
+        return stats
+
+    def _batch_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Wait for other requests until the batch is full or the oldest request is due
+            batch = [first]
+            deadline = first[1] / 1e9 + self.max_latency_s
+            while len(batch) < self.max_batch_size:
+                remaining_s = deadline - time.perf_counter()
+                try:
+                    batch.append(self._requests.get(timeout=remaining_s) if remaining_s > 0
+                                 else self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[tuple]) -> None:
+        start_ns = time.perf_counter_ns()
+        try:
+            actions, _ = self.model.predict(np.stack([observation for observation, _, _ in batch]),
+                                            deterministic=self.deterministic)
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        end_ns = time.perf_counter_ns()
+
+        for (_, _, future), action in zip(batch, actions):
+            future.set_result(action)
+        with self._stats_lock:
+            self._forward.record(end_ns - start_ns)
+            self._batch_sizes[len(batch)] += 1
+            for _, enqueued_ns, _ in batch:
+                self._latency.record(end_ns - enqueued_ns)
+
+    def _accept_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError, AttributeError):
+                # The listener was closed by stop, or a client failed the authentication
+                if self._stop.is_set():
+                    break
+                continue
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection) -> None:
+        with connection:
+            while not self._stop.is_set():
+                try:
+                    observation = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    connection.send(self.predict(observation))
+                except Exception as e:
+                    connection.send(e)
+
+
+class InferenceClient:
+    """
+    Connection to an InferenceServer of another process, with the same `predict` method.
+    """
+    def __init__(self, address: str, authkey: bytes = DEFAULT_AUTHKEY):
+        """
+        Args:
+            address: Address given to `InferenceServer.serve`
+            authkey: Key of the server
+        """
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            address = (host, int(port))
+        self._connection = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def predict(self, observation: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._connection.send(observation)
+            result = self._connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve a policy to the envs of other processes")
+    parser.add_argument("--model", type=str, required=True,
+                        help="Model saved by the training or the actor-learner")
+    parser.add_argument("--address", type=str, default="/tmp/lotr2_policy.sock",
+                        help="Path of the Unix socket, or host:port")
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="Maximum number of observations of a forward pass")
+    parser.add_argument("--max-latency-ms", type=float, default=5.0,
+                        help="Maximum time an observation waits for others to join its batch")
+    parser.add_argument("--stats-interval", type=float, default=60.0,
+                        help="Seconds between two logs of the batching metrics")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = InferenceServer(load_policy(args.model), args.max_batch_size, args.max_latency_ms)
+    server.serve(args.address)
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            logger.info(f"Inference stats: {server.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if ":" not in args.address:
+            Path(args.address).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+from lotr2_rl.inference_server import stacked_predictor
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyClient:
+    """
+    Drop-in replacement of the LLM client of the realtime agent, choosing the actions with a trained
+    policy served by an InferenceServer (in-process) or an InferenceClient (other process).
+
+    A gym instance converts the screenshots into observations and the policy actions into page
+    coordinates, it acquires no resource. Like in the gym, each primitive action is a mouse move
+    followed by a click, returned as consecutive responses.
+    """
+    def __init__(self, predictor, env_kwargs: Optional[dict] = None, frame_stack: int = 1):
+        """
+        Args:
+            predictor: InferenceServer or InferenceClient of the policy
+            env_kwargs: Keyword arguments of the gym the policy was trained on
+            frame_stack: Number of stacked frames the policy was trained on
+        """
+        self.predictor = predictor
+        self.env = LordsOfTheRealm2Gym(**(env_kwargs or {}))
+        self._predict = stacked_predictor(predictor, frame_stack)
+        self._pending = deque()
+
+    async def generate_react_response(
+        self, screenshot: Optional[Union[bytes, List[bytes], np.ndarray]] = None
+    ) -> Dict[str, Any]:
+        """
+        Choose the next action from the last screenshot.
+
+        Args:
+            screenshot: JPEG screenshot, list of JPEG screenshots, or (N, H, W, 3) BGR frames captured
+                after the last action in lite mode
+
+        Returns:
+            A dictionary with the action and action_input of the browser controller
+        """
+        if self._pending:
+            return self._pending.popleft()
+
+        if isinstance(screenshot, list):
+            screenshot = screenshot[-1] if screenshot else None
+        if screenshot is None or len(screenshot) == 0:
+            return {"action": "nope", "action_input": ""}
+
+        loop = asyncio.get_running_loop()
+        if isinstance(screenshot, np.ndarray):
+            # Frames of a burst are already decoded
+            observation = self.env._crop_screenshot(screenshot[-1])
+        else:
+            observation = self.env._decode_screenshot(screenshot)
+        # The prediction blocks until the batch of the server is evaluated
+        action = await loop.run_in_executor(None, self._predict, observation)
+
+        for primitive_action in self.env._expand_action(self.env._to_flat_action(action)):
+            target = self.env._decode_action(primitive_action)
+            if target is None:
+                continue
+            self._pending.append({"action": "move", "action_input": f"{target[0]},{target[1]}"})
+            if not self.env.enable_drag:
+                self._pending.append({"action": "click", "action_input": ""})
+        if not self._pending:
+            return {"action": "nope", "action_input": ""}
+        return self._pending.popleft()
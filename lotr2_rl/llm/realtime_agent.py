@@ -1,15 +1,24 @@
 ## Taken from https://github.com/alexzhang13/videogamebench
 
 import asyncio
+import functools
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Any
+from typing import Any, Callable, List, Optional, Tuple
+
+import cv2
+import imagehash
+import numpy as np
+from PIL import Image
+
 from lotr2_rl.utils import is_same_image
 
 from lotr2_rl.emulators.dos.browser_controller import BrowserController
 from lotr2_rl.llm.fake_llm_client import FakeLLMClient
+from lotr2_rl.llm.policy_client import PolicyClient
 
 # Configure logging
 logging.basicConfig(
@@ -100,6 +109,9 @@ class WebBrowsingAgent(VideoGameBenchAgent):
         lite: bool = False,
         press_key_delay: int = 100,
         log_dir: Optional[Path] = None,
+        policy=None,
+        policy_env_kwargs: Optional[dict] = None,
+        policy_frame_stack: int = 1,
     ):
         """
         Initialize the web browsing agent.
@@ -117,15 +129,29 @@ class WebBrowsingAgent(VideoGameBenchAgent):
             log_dir: Optional custom log directory path
             enable_ui: Whether to enable the UI monitor
             record: Whether to record the gameplay session
+            policy: InferenceServer or InferenceClient of a trained policy choosing the actions
+                instead of the LLM client
+            policy_env_kwargs: Keyword arguments of the gym the policy was trained on
+            policy_frame_stack: Number of stacked frames the policy was trained on
         """
         super().__init__(
             game=game,
             headless=headless,
             log_dir=log_dir,
         )
+        if policy is not None:
+            self.llm_client = PolicyClient(policy, policy_env_kwargs, policy_frame_stack)
         
-        # Initialize browser controller
-        self.browser = BrowserController(headless=headless)
+        # Initialize browser controller. It is a sync Playwright object, which cannot run in the thread
+        # of the event loop and can only be used from the thread that launched it: its calls all go
+        # through one dedicated thread (see _browser_call)
+        self.browser = BrowserController(
+            headless=headless,
+            lite=lite,
+            press_key_delay=press_key_delay,
+            log_dir=self.log_dir,
+        )
+        self._browser_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent_browser")
         self.initial_url = initial_url
 
         # Game-specific settings
@@ -134,14 +160,19 @@ class WebBrowsingAgent(VideoGameBenchAgent):
         self.lite = lite
         self.lite_counter = 0
 
+    async def _browser_call(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run a method of the browser controller in the thread owning the browser. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._browser_executor, functools.partial(func, *args, **kwargs))
+
     async def start(self) -> None:
         """
         Start the agent by initializing the browser.
         """
         self.file_logger.info("Starting browser")
-        await self.browser.start()
+        await self._browser_call(self.browser.start)
         
-        await self.reset(self.initial_url)
+        await self.reset()
 
 
     async def reset(self) -> None:
@@ -149,21 +180,45 @@ class WebBrowsingAgent(VideoGameBenchAgent):
         
         # Navigate to the initial URL
         start_time = time.time()
-        await self.browser.navigate(self.initial_url)
+        await self._browser_call(self.browser.navigate, self.initial_url)
         load_time = time.time() - start_time
         self.file_logger.info(f"Page loaded in {load_time:.2f}s")
 
         # Pre-loaded actions based on game
-        await self.browser.pre_load(self.game)
+        await self._browser_call(self.browser.pre_load, self.game)
 
     async def stop(self) -> None:
         """
         Stop the agent by closing the browser.
         """
         self.file_logger.info("Stopping browser")
-        await self.browser.close()
-        
-    
+        try:
+            await self._browser_call(self.browser.close)
+        finally:
+            self._browser_executor.shutdown()
+
+    async def _execute_action(self, action: str, action_input: str) -> Tuple[str, Any]:
+        """
+        Execute an action in the browser.
+
+        Args:
+            action: Action of the browser controller, e.g. "move" or "click"
+            action_input: Input of the action
+
+        Returns:
+            The observation text, and the (N, H, W, 3) BGR frames captured after the action in lite
+            mode, an empty list or None otherwise
+        """
+        return await self._browser_call(self.browser.execute_action, action, action_input)
+
+
+    @staticmethod
+    def _last_frame(screenshots) -> Image.Image:
+        """ Last frame of the JPEG screenshots or BGR frames of a step, as an RGB image. """
+        frame = screenshots[-1]
+        if isinstance(frame, bytes):
+            frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
     async def run_episode(self, max_steps: int = 400, checkpoints: Optional[List[str]] = None) -> None:
         """
@@ -175,7 +230,7 @@ class WebBrowsingAgent(VideoGameBenchAgent):
             max_steps: The maximum number of steps to take
         """
         # Get initial screenshot
-        screenshot = await self.browser.get_screenshot()
+        screenshot = await self._browser_call(self.browser.get_screenshot)
         screenshots = [screenshot]
         
         # Save screenshot
@@ -189,7 +244,7 @@ class WebBrowsingAgent(VideoGameBenchAgent):
         self.file_logger.info(f"Saved initial screenshot to {screenshot_path}")
 
         if self.lite:
-            await self.browser.press_key("Alt+Pause", delay_ms=0)
+            await self._browser_call(self.browser.press_key, "Alt+Pause", delay_ms=0)
 
         for step in range(max_steps):
             self.step_count = step + 1
@@ -222,8 +277,8 @@ class WebBrowsingAgent(VideoGameBenchAgent):
             
             ### NEW ACTION
             # Under real benchmark (not lite), take screenshot here
-            if not screenshots or len(screenshots) == 0:
-                screenshot = await self.browser.get_screenshot()
+            if screenshots is None or len(screenshots) == 0:
+                screenshot = await self._browser_call(self.browser.get_screenshot)
                 screenshots = [screenshot]
                 # Save screenshot
                 screenshot_path = screenshot_dir / f"game_screen_step_{self.step_count}.jpg"
@@ -232,7 +287,7 @@ class WebBrowsingAgent(VideoGameBenchAgent):
                 self.file_logger.info(f"Saved step {self.step_count} screenshot to {screenshot_path}")
             
             # Check if the task is complete
-            if checkpoints and is_same_image(observation, checkpoints[-1]):
+            if checkpoints and is_same_image(self._last_frame(screenshots), imagehash.hex_to_hash(checkpoints[-1])):
                 self.file_logger.info("Task completed successfully!")
                 logger.info("Task completed successfully!")
                 break
@@ -0,0 +1,210 @@
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LogHistogram:
+    """
+    HDR-style histogram of durations in nanoseconds.
+    Buckets grow geometrically so every recorded value is known within `precision` relative error,
+    with constant memory and O(1) recording.
+    """
+    def __init__(self, min_ns: int = 1_000, max_ns: int = 600_000_000_000, precision: float = 0.01):
+        """
+        Args:
+            min_ns: Smallest tracked duration, smaller values go to the first bucket
+            max_ns: Largest tracked duration, larger values go to the last bucket
+            precision: Relative width of a bucket
+        """
+        self.min_ns = min_ns
+        self._log_base = math.log1p(precision)
+        self.counts = [0] * (self._bucket(max_ns) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def _bucket(self, value_ns: int) -> int:
+        if value_ns <= self.min_ns:
+            return 0
+        return int(math.log(value_ns / self.min_ns) / self._log_base) + 1
+
+    def record(self, value_ns: int) -> None:
+        self.counts[min(self._bucket(value_ns), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total_ns += value_ns
+        self.max_ns = max(self.max_ns, value_ns)
+
+    def percentile(self, q: float) -> float:
+        """
+        Get a percentile of the recorded durations.
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            The duration in nanoseconds, upper bound of the bucket holding the percentile
+        """
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.min_ns * math.exp(bucket * self._log_base), self.max_ns)
+        return float(self.max_ns)
+
+
+class StepProfiler:
+    """
+    Low-overhead profiler timing the phases of env steps with perf_counter_ns.
+    Keeps the timings of the current step and two histograms per phase: one since the last reset and
+    one since the last dump, so periodic reports show drift instead of being averaged into the past.
+    When disabled, phases are not timed at all.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms: Dict[str, LogHistogram] = {}
+        self.window_histograms: Dict[str, LogHistogram] = {}
+        self._step_timings: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Timings of a block run for another step than the current one, see capture
+        self._local = threading.local()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time the enclosed block as the given phase.
+
+        Args:
+            name: Name of the phase, e.g. "screenshot" or "ocr"
+        """
+        if not self.enabled:
+            yield
+            return
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter_ns() - start_ns)
+
+    @contextmanager
+    def capture(self):
+        """
+        Keep the phases of the enclosed block, run by this thread for another step than the current
+        one (e.g. the info of the previous step on a worker thread), out of the current step timings.
+        The phases are still added to the histograms.
+
+        Yields:
+            A dict filled with the total time of each phase of the block in milliseconds on exit
+        """
+        timings_ms = {}
+        if not self.enabled:
+            yield timings_ms
+            return
+        self._local.timings = {}
+        try:
+            yield timings_ms
+        finally:
+            timings_ms.update({name: duration_ns / 1e6 for name, duration_ns in self._local.timings.items()})
+            self._local.timings = None
+
+    def record(self, name: str, duration_ns: int) -> None:
+        if not self.enabled:
+            return
+        captured = getattr(self._local, "timings", None)
+        with self._lock:
+            step_timings = self._step_timings if captured is None else captured
+            step_timings[name] = step_timings.get(name, 0) + duration_ns
+            for histograms in (self.histograms, self.window_histograms):
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = LogHistogram()
+                histogram.record(duration_ns)
+
+    def end_step(self) -> Dict[str, float]:
+        """
+        Close the current step.
+
+        Returns:
+            The total time of each phase during the step in milliseconds
+        """
+        with self._lock:
+            timings = {name: duration_ns / 1e6 for name, duration_ns in self._step_timings.items()}
+            self._step_timings = {}
+        return timings
+
+    def summary(self, window: bool = False) -> Dict[str, Dict[str, float]]:
+        """
+        Get the statistics of each phase since the last reset.
+
+        Args:
+            window: Whether to get the statistics since the last dump instead
+
+        Returns:
+            count, mean, p50, p95, p99 and max (in milliseconds) by phase
+        """
+        with self._lock:
+            return self._summarize(self.window_histograms if window else self.histograms)
+
+    @staticmethod
+    def _summarize(histograms: Dict[str, LogHistogram]) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "count": histogram.count,
+                "mean_ms": histogram.total_ns / histogram.count / 1e6 if histogram.count else 0.0,
+                "p50_ms": histogram.percentile(50) / 1e6,
+                "p95_ms": histogram.percentile(95) / 1e6,
+                "p99_ms": histogram.percentile(99) / 1e6,
+                "max_ms": histogram.max_ns / 1e6,
+            }
+            for name, histogram in histograms.items()
+        }
+
+    def dump(self, path: Optional[Path] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Log the statistics since the last dump, optionally write them as JSON along with the
+        statistics since the last reset, and start a new window.
+
+        Args:
+            path: File the summaries are written to
+
+        Returns:
+            The summaries since the last dump ("window") and since the last reset ("total")
+        """
+        with self._lock:
+            window = self._summarize(self.window_histograms)
+            total = self._summarize(self.histograms)
+            self.window_histograms = {}
+        summaries = {"window": window, "total": total}
+        for name, stats in sorted(window.items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+            logger.info(f"{name:>16}: n={stats['count']} mean={stats['mean_ms']:.2f}ms p50={stats['p50_ms']:.2f}ms "
+                        f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms max={stats['max_ms']:.2f}ms")
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(summaries, f, indent=2)
+        return summaries
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.window_histograms = {}
+            self._step_timings = {}
@@ -0,0 +1,176 @@
+"""
+Counters of the live resources of the process (browsers, pages, servers, envs), and cleanup of
+the Chromium processes left behind by crashed browsers.
+Long runs can check that the counters stay flat as envs are created and closed.
+"""
+import itertools
+import logging
+import os
+import signal
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_live = Counter()
+_live_lock = threading.Lock()
+
+# Tags of the browsers currently open, by owner
+_owned_browser_tags: Dict[int, str] = {}
+_browser_tags = itertools.count()
+
+BROWSER_TAG_SWITCH = "--lotr2-rl-browser"
+
+
+def resource_opened(kind: str) -> None:
+    with _live_lock:
+        _live[kind] += 1
+
+
+def resource_closed(kind: str) -> None:
+    with _live_lock:
+        if _live[kind] <= 0:
+            logger.warning(f"More {kind} closed than opened")
+            return
+        _live[kind] -= 1
+
+
+def get_live_resources() -> Dict[str, int]:
+    """
+    Get the number of live resources of each kind.
+
+    Returns:
+        The counts by kind, e.g. {"browser": 1, "page": 1, "server": 1, "env": 1}
+    """
+    with _live_lock:
+        return {kind: count for kind, count in _live.items() if count > 0}
+
+
+def _get_process_table() -> Dict[int, Tuple[int, List[str]]]:
+    """
+    Get the parent pid and command line arguments of all the processes, from /proc (empty on
+    systems without /proc).
+    """
+    processes = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return processes
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, the parent pid is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                args = f.read().decode(errors="replace").split("\0")
+        except (OSError, IndexError, ValueError):
+            continue
+        processes[int(entry)] = (ppid, args)
+    return processes
+
+
+def _get_process_trees(processes: Dict[int, Tuple[int, List[str]]], root_pids: Iterable[int]) -> Set[int]:
+    """ Get the root pids and the pids of all their descendants. """
+    children = {}
+    for pid, (ppid, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    pids = set()
+    pending = list(root_pids)
+    while pending:
+        pid = pending.pop()
+        if pid not in pids:
+            pids.add(pid)
+            pending.extend(children.get(pid, []))
+    return pids
+
+
+def kill_pids(pids: Iterable[int]) -> None:
+    """
+    Kill processes, ignoring those that already exited.
+
+    Args:
+        pids: Pids of the processes
+    """
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def new_browser_tag() -> str:
+    """
+    Get a tag identifying a browser launched by this process, added to its command line with
+    `get_browser_tag_arg`, so its Chromium processes can be found without guessing from the
+    processes started around its launch by other threads.
+    """
+    return f"{os.getpid()}-{next(_browser_tags)}"
+
+
+def get_browser_tag_arg(tag: str) -> str:
+    """ Command line switch of a tagged browser, ignored by Chromium. """
+    return f"{BROWSER_TAG_SWITCH}={tag}"
+
+
+def get_browser_pids(tag: str) -> Set[int]:
+    """
+    Get the live Chromium processes of a tagged browser: its browser process and all its descendants.
+    The pids are looked up when called, so processes already exited are never returned.
+
+    Args:
+        tag: Tag of the browser
+
+    Returns:
+        The pids
+    """
+    processes = _get_process_table()
+    arg = get_browser_tag_arg(tag)
+    return _get_process_trees(processes, [pid for pid, (_, args) in processes.items() if arg in args])
+
+
+def kill_browser(tag: str) -> None:
+    """
+    Kill the Chromium processes of a tagged browser. Their parent, the Playwright driver (or init
+    when the driver died), reaps them.
+
+    Args:
+        tag: Tag of the browser
+    """
+    kill_pids(get_browser_pids(tag))
+
+
+def register_browser(owner: object, tag: str) -> None:
+    with _live_lock:
+        _owned_browser_tags[id(owner)] = tag
+
+
+def unregister_browser(owner: object) -> None:
+    with _live_lock:
+        _owned_browser_tags.pop(id(owner), None)
+
+
+def kill_orphaned_browsers() -> int:
+    """
+    Kill the Chromium processes of the browsers launched by this process that belong to no open
+    browser, e.g. left behind by a crashed Playwright driver.
+
+    Returns:
+        The number of killed processes
+    """
+    with _live_lock:
+        owned_args = {get_browser_tag_arg(tag) for tag in _owned_browser_tags.values()}
+
+    # Tags of this process, whether its browsers are still children of their driver or were adopted by init
+    prefix = get_browser_tag_arg(f"{os.getpid()}-")
+    processes = _get_process_table()
+    roots = [pid for pid, (_, args) in processes.items()
+             if any(arg.startswith(prefix) and arg not in owned_args for arg in args)]
+    orphans = _get_process_trees(processes, roots)
+    if orphans:
+        logger.warning(f"Killing {len(orphans)} orphaned Chromium processes")
+        kill_pids(orphans)
+    return len(orphans)
@@ -57,20 +57,34 @@ async def run_dos_emulator(args):
                 print("\nShutting down server...")
             finally:
                 if server:
-                    server.stop()
+                    await server.stop_async()
             return
         else:
             print("Error: No URL specified for website-only mode.")
             if server:
-                server.stop()
+                await server.stop_async()
             return
     
+    # A policy served by an inference server replaces the LLM
+    policy = None
+    policy_hyperparams = {}
+    if getattr(args, "policy_address", None):
+        from lotr2_rl.inference_server import InferenceClient
+        from lotr2_rl.train import load_hyperparams
+        policy = InferenceClient(args.policy_address)
+        # The observations are built like in the training of the policy
+        policy_hyperparams = load_hyperparams(args.hyperparams)
+
     # Create the agent for interactive mode
     agent = WebBrowsingAgent(
         game=dos_name,
+        initial_url=url,
         headless=headless,
         lite=args.lite,
         press_key_delay=args.press_key_delay,
+        policy=policy,
+        policy_env_kwargs=policy_hyperparams.get("env_kwargs"),
+        policy_frame_stack=policy_hyperparams.get("frame_stack", 1),
     )
 
     evaluator = DOSEvaluator(
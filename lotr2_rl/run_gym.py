@@ -1,63 +1,126 @@
-import gymnasium as gym
+import json
+import threading
+from pathlib import Path
 
-from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
+import gymnasium as gym
 
+from lotr2_rl.actor_learner import train_actor_learner
+from lotr2_rl.datasets.trajectory_recorder import TrajectoryRecorder, write_json_atomic
+from lotr2_rl.evaluator import GymPolicyEvaluator
 from lotr2_rl.folder_web_server import FolderWebServer
 from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+from lotr2_rl.inference_server import InferenceServer, RandomPolicy, load_policy, stacked_predictor
+from lotr2_rl.resources import get_live_resources
+from lotr2_rl.train import load_hyperparams, train
+
+def _get_env_kwargs(args) -> dict:
+    # The env arguments of the hyperparameters file, so that policies play the env they were trained on
+    env_kwargs = dict(load_hyperparams(args.hyperparams).get("env_kwargs", {}))
+    env_kwargs.update({"render_mode": args.render_mode, "profile": args.profile, "backend": args.backend})
+    if args.backend == "mock" and args.mock_trace:
+        env_kwargs["mock_kwargs"] = {"trace_dir": args.mock_trace}
+    return env_kwargs
 
 def _train_lotr2_gym(args):
-    env = make_vec_env("lotr2-rl/LordsOfTheRealm2-v0", n_envs=1, env_kwargs={"render_mode": args.render_mode})
-    
-    model = PPO("MlpPolicy", env, verbose=1)
-    model.learn(total_timesteps=5000)
-    
-    obs = env.reset()
-    done = False
-    
-    while not done:
-        action, _states = model.predict(obs)
-        obs, rewards, done, info = env.step(action)
-        print(f"Action: {action}, Reward: {rewards}, Info: {info}")
-    
-    model.save("lotr2_ppo_model")
-
-    env.close()
+    # The hyperparameters come from the config file, the command line only overrides the number of envs
+    if args.trainer == "impala":
+        # Each actor process runs one env, n_envs is the number of actors
+        train_actor_learner(args.hyperparams, env_kwargs=_get_env_kwargs(args), n_actors=args.n_envs,
+                            checkpoint_dir=args.checkpoint_dir, checkpoint_freq=args.checkpoint_freq,
+                            keep_checkpoints=args.keep_checkpoints, resume=args.resume)
+        return
+
+    wrapper_kwargs = {"root_dir": args.record_trajectories, "compression": args.record_compression}
+    train(
+        args.hyperparams,
+        env_kwargs=_get_env_kwargs(args),
+        n_envs=args.n_envs,
+        vec_env=args.vec_env,
+        wrapper_class=TrajectoryRecorder if args.record_trajectories else None,
+        wrapper_kwargs=wrapper_kwargs if args.record_trajectories else None,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_freq=args.checkpoint_freq,
+        keep_checkpoints=args.keep_checkpoints,
+        resume=args.resume,
+    )
+
+def _make_test_env(args):
+    env = gym.make("lotr2-rl/LordsOfTheRealm2-v0", **_get_env_kwargs(args))
+    if args.record_trajectories:
+        env = TrajectoryRecorder(env, args.record_trajectories, compression=args.record_compression)
+    return env
+
+def _run_episode(env, action_func):
+    try:
+        observation, _ = env.reset()
+        done = False
+        while not done:
+            action = action_func(observation)
+            observation, reward, terminated, truncated, info = env.step(action)
+            print(f"Action: {action}, Reward: {reward}, Info: {info}")
+
+            done = terminated or truncated
+    finally:
+        env.close()
 
 def _test_lotr2_gym(args):
-    # Parallel environments
-    env = gym.make("lotr2-rl/LordsOfTheRealm2-v0", render_mode=args.render_mode,)
-    
-    env.reset()
-    done = False
-
-    action_func = None
-    if args.action_mode == "random":
-        def random_action_func():
-            return env.action_space.sample()
-        action_func = random_action_func
-    elif args.action_mode == "manual":
-        def manual_actions():
+    if args.action_mode == "manual":
+        env = _make_test_env(args)
+        def manual_actions(observation):
             action = input(f"Enter action (0-{env.action_space.n}): ")
             return int(action) if action.isdigit() else 0
-        action_func = manual_actions
+        _run_episode(env, manual_actions)
+        return
 
-    while not done:
-        action = action_func()
-        observation, reward, terminated, truncated, info = env.step(action)
-        print(f"Action: {action}, Reward: {reward}, Info: {info}")
+    # Parallel environments, each in its own thread, their actions evaluated in batches by one server
+    envs = [_make_test_env(args) for _ in range(args.n_envs or 1)]
+    if args.action_mode == "enjoy":
+        model = load_policy(args.model_path)
+        frame_stack = load_hyperparams(args.hyperparams).get("frame_stack", 1)
+    else:
+        model = RandomPolicy(envs[0].action_space)
+        frame_stack = 1
 
-        done = terminated or truncated
+    with InferenceServer(model, args.max_batch_size, args.max_latency_ms,
+                         deterministic=(args.action_mode == "enjoy")) as server:
+        threads = [threading.Thread(target=_run_episode, args=(env, stacked_predictor(server, frame_stack)))
+                   for env in envs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Inference stats: {server.get_stats()}")
 
-    env.close()
+def _evaluate_lotr2_gym(args):
+    evaluator = GymPolicyEvaluator(
+        n_envs=args.n_envs or 1,
+        env_kwargs=_get_env_kwargs(args),
+        frame_stack=load_hyperparams(args.hyperparams).get("frame_stack", 1),
+        max_steps=args.max_steps,
+    )
+    report = evaluator.evaluate(args.model_path, args.eval_episodes, args.max_batch_size, args.max_latency_ms)
+    print(json.dumps({key: value for key, value in report.items() if key != "per_episode"}, indent=2))
+    if args.eval_output:
+        write_json_atomic(Path(args.eval_output), report)
 
 def run_gym_emulator(args):
-    folderServer = FolderWebServer('./roms', port=8080)
-    folderServer.start()
+    # The game files are not needed by the mock backend
+    folderServer = FolderWebServer('./roms', port=8080) if args.backend == "browser" else None
+    if folderServer:
+        folderServer.start()
 
-    if args.action_mode == "train":
-        _train_lotr2_gym(args)
-    else:
-        _test_lotr2_gym(args)
+    try:
+        if args.action_mode == "train":
+            _train_lotr2_gym(args)
+        elif args.action_mode == "evaluate":
+            _evaluate_lotr2_gym(args)
+        else:
+            _test_lotr2_gym(args)
+    finally:
+        if folderServer:
+            folderServer.stop()
 
-    folderServer.stop()
\ No newline at end of file
+    # Everything opened by the run should be closed by now
+    leaked = get_live_resources()
+    if leaked:
+        print(f"Resources still open after the run: {leaked}")
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Training launcher reading the hyperparameters of `configs/lotr2.yaml` (rl-zoo format).
+
+The envs run in `n_envs` worker processes (SharedMemoryVecEnv) and their observations are stacked
+over `frame_stack` frames, so scaling across cores is a change of `n_envs`:
+
+    python -m lotr2_rl.train --config configs/lotr2.yaml --n-envs 8
+
+Checkpoints are saved every `--checkpoint-freq` steps, `--resume` continues from the latest one.
+"""
+import argparse
+import logging
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import gymnasium as gym
+import numpy as np
+import yaml
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import (
+    DummyVecEnv, SubprocVecEnv, VecEnv, VecFrameStack, VecMonitor, VecNormalize,
+)
+
+from lotr2_rl.checkpoints import CheckpointManager, save_atomic
+from lotr2_rl.folder_web_server import FolderWebServer
+from lotr2_rl.gyms.shared_memory_vec_env import SharedMemoryVecEnv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = Path("configs") / "lotr2.yaml"
+DEFAULT_ENV_ID = "lotr2-rl/LordsOfTheRealm2-v0"
+
+# Hyperparameters given as `lin_<initial value>` for a linear schedule
+SCHEDULE_KEYS = ("learning_rate", "clip_range", "clip_range_vf")
+
+
+def linear_schedule(initial_value: float) -> Callable[[float], float]:
+    """
+    Schedule decreasing linearly from the initial value to 0 over the training.
+
+    Args:
+        initial_value: Value at the start of the training
+
+    Returns:
+        The schedule, called by SB3 with the remaining progress (1 at the start, 0 at the end)
+    """
+    def schedule(progress_remaining: float) -> float:
+        return progress_remaining * initial_value
+
+    return schedule
+
+
+def load_hyperparams(path: Path = DEFAULT_CONFIG, env_id: str = DEFAULT_ENV_ID) -> Dict[str, Any]:
+    """
+    Load the hyperparameters of an env, with their `lin_<value>` schedules parsed.
+
+    Args:
+        path: YAML file of hyperparameters by env id
+        env_id: Id of the env
+
+    Returns:
+        The hyperparameters
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    if env_id not in config:
+        raise KeyError(f"No hyperparameters for {env_id} in {path}")
+
+    hyperparams = dict(config[env_id])
+    for key in SCHEDULE_KEYS:
+        value = hyperparams.get(key)
+        if isinstance(value, str) and value.startswith("lin_"):
+            hyperparams[key] = linear_schedule(float(value[len("lin_"):]))
+    if "n_timesteps" in hyperparams:
+        hyperparams["n_timesteps"] = int(hyperparams["n_timesteps"])
+    return hyperparams
+
+
+class StepTimer(gym.Wrapper):
+    """
+    Wrapper adding the duration of each step to info, so the time spent inside each worker can be
+    told apart from the time spent waiting on the other workers and the learner.
+    """
+    def step(self, action):
+        start_time = time.perf_counter()
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        info["step_time_s"] = time.perf_counter() - start_time
+        return observation, reward, terminated, truncated, info
+
+
+def make_env(env_id: str = DEFAULT_ENV_ID, **env_kwargs) -> gym.Env:
+    """
+    Create one env of a worker. Module-level so that the worker processes import this package,
+    which registers the env ids.
+    """
+    return StepTimer(gym.make(env_id, **env_kwargs))
+
+
+class StepsPerSecondCallback(BaseCallback):
+    """
+    Log the throughput of the training at the end of each rollout:
+    - time/steps_per_sec: env steps of all the workers per second of wall time
+    - time/worker_<i>_steps_per_sec: steps of worker i per second spent inside its env steps
+    """
+    def __init__(self, verbose: int = 0):
+        super().__init__(verbose)
+        self._rollout_start = 0.0
+        self._rollout_steps = 0
+        self._worker_steps = None
+        self._worker_time_s = None
+
+    def _on_rollout_start(self) -> None:
+        self._rollout_start = time.perf_counter()
+        self._rollout_steps = 0
+        self._worker_steps = np.zeros(self.training_env.num_envs, dtype=np.int64)
+        self._worker_time_s = np.zeros(self.training_env.num_envs)
+
+    def _on_step(self) -> bool:
+        infos = self.locals.get("infos", [])
+        self._rollout_steps += len(infos)
+        for i, info in enumerate(infos):
+            if "step_time_s" in info:
+                self._worker_steps[i] += 1
+                self._worker_time_s[i] += info["step_time_s"]
+        return True
+
+    def _on_rollout_end(self) -> None:
+        elapsed_s = time.perf_counter() - self._rollout_start
+        if elapsed_s <= 0 or self._rollout_steps == 0:
+            return
+        steps_per_sec = self._rollout_steps / elapsed_s
+        self.logger.record("time/steps_per_sec", steps_per_sec)
+        worker_steps_per_sec = []
+        for i, (steps, time_s) in enumerate(zip(self._worker_steps, self._worker_time_s)):
+            if time_s > 0:
+                worker_steps_per_sec.append(steps / time_s)
+                self.logger.record(f"time/worker_{i}_steps_per_sec", worker_steps_per_sec[-1])
+        if self.verbose and worker_steps_per_sec:
+            logger.info(f"{steps_per_sec:.1f} steps/s, per worker: "
+                        + ", ".join(f"{rate:.1f}" for rate in worker_steps_per_sec))
+
+
+class CheckpointCallback(BaseCallback):
+    """
+    Save a checkpoint of the model every `save_freq` steps and at the end of the training.
+
+    The model archive holds the weights, the optimizer state and the number of timesteps, from which
+    the schedules resume. The normalization statistics of a VecNormalize env are saved along with it,
+    as `<checkpoint name>.vecnormalize.pkl`.
+    """
+    def __init__(self, checkpoints: CheckpointManager, save_freq: int, verbose: int = 0):
+        super().__init__(verbose)
+        self.checkpoints = checkpoints
+        self.save_freq = save_freq
+        self._last_save_timesteps = 0
+
+    def _on_training_start(self) -> None:
+        self._last_save_timesteps = self.num_timesteps
+
+    def _on_step(self) -> bool:
+        if self.save_freq > 0 and self.num_timesteps - self._last_save_timesteps >= self.save_freq:
+            self.save()
+        return True
+
+    def _on_training_end(self) -> None:
+        if self.num_timesteps > self._last_save_timesteps:
+            self.save()
+
+    def save(self) -> None:
+        vec_normalize = self.model.get_vec_normalize_env()
+        if vec_normalize is not None:
+            path = self.checkpoints.get_path(self.num_timesteps, "vecnormalize.pkl")
+            self.checkpoints.directory.mkdir(parents=True, exist_ok=True)
+            save_atomic(path, lambda f: pickle.dump(vec_normalize, f))
+        self.checkpoints.save(self.num_timesteps, self.model.save)
+        self._last_save_timesteps = self.num_timesteps
+
+
+def load_checkpoint(path: Path, env: VecEnv) -> PPO:
+    """
+    Load a checkpoint saved by CheckpointCallback, with its normalization statistics if any.
+
+    Args:
+        path: File of the checkpoint
+        env: Vector env of the training, with the same number of envs as the checkpoint
+
+    Returns:
+        The model, whose num_timesteps is the number of timesteps of the checkpoint
+    """
+    vec_normalize_path = path.with_name(path.stem + ".vecnormalize.pkl")
+    if vec_normalize_path.exists():
+        env = VecNormalize.load(str(vec_normalize_path), env)
+    return PPO.load(path, env=env)
+
+
+def make_train_env(n_envs: int, frame_stack: int = 1, env_id: str = DEFAULT_ENV_ID,
+                   env_kwargs: Optional[dict] = None, vec_env: str = "shm",
+                   wrapper_class=None, wrapper_kwargs: Optional[dict] = None) -> VecEnv:
+    """
+    Build the vector env of the training.
+
+    Args:
+        n_envs: Number of envs, one per worker process with the "shm" and "subproc" vector envs
+        frame_stack: Number of consecutive observations stacked along the channels
+        env_id: Id of the env
+        env_kwargs: Keyword arguments of each env
+        vec_env: "shm" for one process per env writing its observations to shared memory,
+            "subproc" for one process per env sending its observations through a pipe,
+            "dummy" to step the envs in turn in this process,
+            "async" for pages of one browser stepped concurrently from this process
+        wrapper_class: Wrapper applied to each env, e.g. TrajectoryRecorder, not supported by "async"
+        wrapper_kwargs: Keyword arguments of the wrapper
+
+    Returns:
+        The vector env
+    """
+    if vec_env == "async":
+        from lotr2_rl.gyms.lotr2_vec_env import LordsOfTheRealm2VecEnv
+
+        # The envs of the async vector env are not gym envs, so they cannot be wrapped one by one
+        if wrapper_class is not None:
+            raise ValueError(f"The async vector env does not support env wrappers, got {wrapper_class.__name__}")
+        env_kwargs = env_kwargs or {}
+        env = LordsOfTheRealm2VecEnv(n_envs, env_kwargs, headless=(env_kwargs.get("render_mode") != "human"))
+        # Episode returns and lengths for the logger, as the Monitor wrapper of make_vec_env does
+        env = VecMonitor(env)
+        return VecFrameStack(env, n_stack=frame_stack) if frame_stack > 1 else env
+
+    vec_env_cls = {"shm": SharedMemoryVecEnv, "subproc": SubprocVecEnv, "dummy": DummyVecEnv}[vec_env]
+    env = make_vec_env(
+        make_env,
+        n_envs=n_envs,
+        env_kwargs={"env_id": env_id, **(env_kwargs or {})},
+        vec_env_cls=vec_env_cls,
+        wrapper_class=wrapper_class,
+        wrapper_kwargs=wrapper_kwargs,
+    )
+    if frame_stack > 1:
+        env = VecFrameStack(env, n_stack=frame_stack)
+    return env
+
+
+def train(config_path: Path = DEFAULT_CONFIG, env_id: str = DEFAULT_ENV_ID, env_kwargs: Optional[dict] = None,
+          n_envs: Optional[int] = None, n_timesteps: Optional[int] = None, vec_env: str = "shm",
+          wrapper_class=None, wrapper_kwargs: Optional[dict] = None, save_path: str = "lotr2_ppo_model",
+          verbose: int = 1, checkpoint_dir: Optional[str] = "checkpoints", checkpoint_freq: int = 100_000,
+          keep_checkpoints: int = 3, resume: bool = False) -> PPO:
+    """
+    Train a PPO agent with the hyperparameters of the config file.
+    When resuming, the model, optimizer and timestep count come from the latest checkpoint and the
+    training continues up to the same total number of timesteps.
+
+    Args:
+        config_path: YAML file of hyperparameters by env id
+        env_id: Id of the env
+        env_kwargs: Keyword arguments of each env
+        n_envs: Number of envs, overrides the config
+        n_timesteps: Number of training steps, overrides the config
+        vec_env: "shm", "subproc", "dummy" or "async", see make_train_env
+        wrapper_class: Wrapper applied to each env
+        wrapper_kwargs: Keyword arguments of the wrapper
+        save_path: File the model is saved to
+        verbose: Verbosity of PPO and of the throughput logs
+        checkpoint_dir: Folder of the checkpoints, None to disable them
+        checkpoint_freq: Number of steps between two checkpoints
+        keep_checkpoints: Number of most recent checkpoints kept
+        resume: Whether to resume from the latest checkpoint of checkpoint_dir
+
+    Returns:
+        The trained model
+    """
+    # The env and training loop keys are removed, the remaining ones are PPO arguments
+    hyperparams = load_hyperparams(config_path, env_id)
+    n_envs = n_envs or hyperparams.pop("n_envs", 1)
+    n_timesteps = n_timesteps or hyperparams.pop("n_timesteps")
+    for key in ("n_envs", "n_timesteps"):
+        hyperparams.pop(key, None)
+    frame_stack = hyperparams.pop("frame_stack", 1)
+    # Env arguments of the config, those of the command line taking precedence
+    env_kwargs = {**hyperparams.pop("env_kwargs", {}), **(env_kwargs or {})}
+    policy = hyperparams.pop("policy")
+
+    logger.info(f"Training on {n_envs} {vec_env} envs with {frame_stack} stacked frames for {n_timesteps} steps")
+    env = make_train_env(n_envs, frame_stack, env_id, env_kwargs, vec_env, wrapper_class, wrapper_kwargs)
+    checkpoints = CheckpointManager(checkpoint_dir, "ppo", keep=keep_checkpoints) if checkpoint_dir else None
+    checkpoint = checkpoints.latest() if checkpoints and resume else None
+    if resume and checkpoint is None:
+        logger.warning(f"No checkpoint to resume from in {checkpoint_dir}, starting a new training")
+    try:
+        if checkpoint:
+            model = load_checkpoint(checkpoint, env)
+            logger.info(f"Resuming from {checkpoint} at {model.num_timesteps} steps")
+        else:
+            model = PPO(policy, env, verbose=verbose, **hyperparams)
+        callbacks = [StepsPerSecondCallback(verbose=verbose)]
+        if checkpoints:
+            callbacks.append(CheckpointCallback(checkpoints, checkpoint_freq, verbose=verbose))
+        # SB3 adds the timesteps of the loaded model to total_timesteps when they are not reset
+        model.learn(total_timesteps=max(0, n_timesteps - model.num_timesteps), callback=callbacks,
+                    reset_num_timesteps=checkpoint is None)
+        model.save(save_path)
+    finally:
+        env.close()
+    return model
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train a PPO agent with the hyperparameters of a config file")
+    parser.add_argument("--config", type=Path, default=DEFAULT_CONFIG,
+                        help="YAML file of hyperparameters by env id")
+    parser.add_argument("--env-id", type=str, default=DEFAULT_ENV_ID,
+                        help="Id of the env")
+    parser.add_argument("--n-envs", type=int, default=None,
+                        help="Number of worker envs (default: from the config)")
+    parser.add_argument("--n-timesteps", type=int, default=None,
+                        help="Number of training steps (default: from the config)")
+    parser.add_argument("--vec-env", choices=["shm", "subproc", "dummy", "async"], default="shm",
+                        help="Vector env ('shm' runs each env in its own process, with observations in shared memory)")
+    parser.add_argument("--backend", choices=["browser", "mock"], default="browser",
+                        help="Gym backend ('mock' replays recorded or scripted frames without browser)")
+    parser.add_argument("--save-path", type=str, default="lotr2_ppo_model",
+                        help="File the model is saved to")
+    parser.add_argument("--checkpoint-dir", type=str, default="checkpoints",
+                        help="Folder of the periodic checkpoints")
+    parser.add_argument("--checkpoint-freq", type=int, default=100_000,
+                        help="Number of steps between two checkpoints")
+    parser.add_argument("--keep-checkpoints", type=int, default=3,
+                        help="Number of most recent checkpoints kept (0 keeps them all)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume from the latest checkpoint of --checkpoint-dir")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # The game files are not needed by the mock backend
+    folder_server = FolderWebServer("./roms", port=8080) if args.backend == "browser" else None
+    if folder_server:
+        folder_server.start()
+    try:
+        train(args.config, args.env_id, {"backend": args.backend}, args.n_envs, args.n_timesteps, args.vec_env,
+              save_path=args.save_path, checkpoint_dir=args.checkpoint_dir, checkpoint_freq=args.checkpoint_freq,
+              keep_checkpoints=args.keep_checkpoints, resume=args.resume)
+    finally:
+        if folder_server:
+            folder_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,8 @@ def parse_args():
                        help="Just open the website without agent interaction ")
     parser.add_argument("--action-delay", default=100, type=int, 
                        help="Delay between actions in milliseconds")
+    parser.add_argument("--policy-address", type=str, default=None,
+                       help="Address of an inference server whose policy plays instead of the LLM agent")
     
     # Evaluation arguments
     parser.add_argument("--max-steps", type=int, default=500, 
@@ -64,10 +66,47 @@ def parse_args():
                        help="Delay between steps in seconds (GBA only)")
 
     # Gym-specific arguments
-    parser.add_argument("--action-mode", choices=["random", "manual", "train", "enjoy"],
+    parser.add_argument("--action-mode", choices=["random", "manual", "train", "enjoy", "evaluate"],
                        help="Run the emulator without visual display")
     parser.add_argument("--render-mode", choices=["rgb_array", "human"], default="rgb_array",
                        help="Run the emulator without visual display")
+    parser.add_argument("--n-envs", type=int, default=None,
+                       help="Number of environments used for training (default: from the hyperparameters file)")
+    parser.add_argument("--vec-env", choices=["shm", "subproc", "dummy", "async"], default="shm",
+                       help="Vector env used for training ('shm' runs each env in its own process with observations "
+                            "in shared memory, 'async' steps all envs from one asyncio loop)")
+    parser.add_argument("--hyperparams", type=str, default="configs/lotr2.yaml",
+                       help="YAML file of the training hyperparameters (rl-zoo format)")
+    parser.add_argument("--model-path", type=str, default="lotr2_ppo_model",
+                       help="Model played by the enjoy and evaluate action modes")
+    parser.add_argument("--eval-episodes", type=int, default=10,
+                       help="Number of episodes of the evaluate action mode, played concurrently by --n-envs envs")
+    parser.add_argument("--eval-output", type=str, default=None,
+                       help="JSON file the evaluation report is written to")
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                       help="Maximum number of observations of a batched forward pass of the policy")
+    parser.add_argument("--max-latency-ms", type=float, default=5.0,
+                       help="Maximum time an observation waits for others to join its forward pass")
+    parser.add_argument("--checkpoint-dir", type=str, default="checkpoints",
+                       help="Folder of the periodic training checkpoints")
+    parser.add_argument("--checkpoint-freq", type=int, default=100_000,
+                       help="Number of training steps between two checkpoints")
+    parser.add_argument("--keep-checkpoints", type=int, default=3,
+                       help="Number of most recent checkpoints kept (0 keeps them all)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Resume the training from the latest checkpoint of --checkpoint-dir")
+    parser.add_argument("--trainer", choices=["ppo", "impala"], default="ppo",
+                       help="Training algorithm ('impala' overlaps collection by actor processes and learning)")
+    parser.add_argument("--profile", action="store_true",
+                       help="Time the phases of each step, timings are added to info and dumped at episode end")
+    parser.add_argument("--backend", choices=["browser", "mock"], default="browser",
+                       help="Gym backend ('mock' replays recorded or scripted frames without browser)")
+    parser.add_argument("--mock-trace", type=str, default=None,
+                       help="Folder of recorded frames replayed by the mock backend (default: scripted game)")
+    parser.add_argument("--record-trajectories", type=str, default=None,
+                       help="Folder where the observations, actions, rewards and info of the gym are recorded")
+    parser.add_argument("--record-compression", choices=["none", "delta"], default="none",
+                       help="Observation storage of the trajectory recording ('none' is memory-mappable)")
 
     return parser.parse_args()
 
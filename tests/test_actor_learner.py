@@ -0,0 +1,107 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack
+
+from lotr2_rl.actor_learner import stack_frames, vtrace
+
+
+class CounterEnv(gym.Env):
+    """ Env whose observations are filled with a step counter shared by its episodes. """
+    observation_space = gym.spaces.Box(0, 255, shape=(4, 5, 2), dtype=np.uint8)
+    action_space = gym.spaces.Discrete(1)
+
+    def __init__(self, episode_length: int):
+        self.episode_length = episode_length
+        self.counter = 0
+        self.nb_step = 0
+
+    def _observation(self) -> np.ndarray:
+        self.counter += 1
+        observation = np.full(self.observation_space.shape, self.counter, dtype=np.uint8)
+        observation[..., 1] += 100  # Tell the channels apart
+        return observation
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.nb_step = 0
+        return self._observation(), {}
+
+    def step(self, action):
+        self.nb_step += 1
+        return self._observation(), 0.0, False, self.nb_step >= self.episode_length, {}
+
+
+@pytest.mark.parametrize("n_stack", [1, 2, 4])
+def test_stack_frames_matches_vec_frame_stack(n_stack):
+    env = VecFrameStack(DummyVecEnv([lambda: CounterEnv(episode_length=3)]), n_stack=n_stack, channels_order="last")
+    stacks = [env.reset()[0]]
+    starts = [True]
+    for _ in range(10):
+        observation, _, dones, _ = env.step(np.zeros(1, dtype=np.int64))
+        stacks.append(observation[0])
+        starts.append(bool(dones[0]))
+
+    # Frames as seen by an actor: the last frame of each stack
+    channels = CounterEnv.observation_space.shape[-1]
+    frames = torch.from_numpy(np.stack([stack[..., -channels:] for stack in stacks]))
+    stacked = stack_frames(frames, torch.tensor(starts), n_stack)
+
+    expected = np.stack(stacks[n_stack - 1:]).transpose(0, 3, 1, 2)
+    np.testing.assert_array_equal(stacked.numpy(), expected)
+
+
+def n_step_targets(rewards, bootstrap_value, terminated, truncated, final_values, gamma):
+    """ Discounted returns of each step up to the end of its episode or of the unroll. """
+    targets = np.zeros(len(rewards))
+    next_target = bootstrap_value
+    for t in range(len(rewards) - 1, -1, -1):
+        if terminated[t]:
+            next_target = 0.0
+        elif truncated[t]:
+            next_target = final_values[t]
+        targets[t] = next_target = rewards[t] + gamma * next_target
+    return targets
+
+
+def run_vtrace(rewards, values, bootstrap_value, terminated, truncated, final_values, gamma):
+    length = len(rewards)
+    log_probs = torch.log(torch.full((length, 1), 0.5))
+    return vtrace(
+        log_probs,
+        log_probs,
+        torch.tensor(rewards, dtype=torch.float32)[:, None],
+        torch.tensor(values, dtype=torch.float32)[:, None],
+        torch.tensor([bootstrap_value], dtype=torch.float32),
+        torch.tensor(terminated)[:, None],
+        torch.tensor(truncated)[:, None],
+        torch.tensor(final_values, dtype=torch.float32)[:, None],
+        gamma,
+    )
+
+
+@pytest.mark.parametrize("terminated, truncated", [
+    ([False, False, False, False], [False, False, False, False]),
+    ([False, True, False, False], [False, False, False, False]),
+    ([False, False, False, False], [False, True, False, False]),
+    ([True, False, False, False], [False, False, True, False]),
+])
+def test_vtrace_on_policy_is_n_step_return(terminated, truncated):
+    rewards = [1.0, 2.0, -1.0, 3.0]
+    values = [0.5, 4.0, 2.0, -1.0]
+    final_values = [7.0, 9.0, 5.0, 6.0]
+    bootstrap_value = 10.0
+    gamma = 0.9
+
+    targets, advantages = run_vtrace(rewards, values, bootstrap_value, terminated, truncated, final_values, gamma)
+
+    expected = n_step_targets(rewards, bootstrap_value, terminated, truncated, final_values, gamma)
+    np.testing.assert_allclose(targets[:, 0].numpy(), expected, rtol=1e-5)
+    np.testing.assert_allclose(advantages[:, 0].numpy(), expected - np.array(values), rtol=1e-5, atol=1e-5)
+
+
+def test_vtrace_terminated_ignores_final_value():
+    args = ([1.0, 2.0], [0.0, 0.0], 10.0, [False, True], [False, True])
+    targets, _ = run_vtrace(*args, final_values=[0.0, 100.0], gamma=0.5)
+    np.testing.assert_allclose(targets[:, 0].numpy(), [2.0, 2.0])
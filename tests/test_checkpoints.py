@@ -0,0 +1,60 @@
+import pytest
+
+from lotr2_rl.checkpoints import CheckpointManager, save_atomic
+
+
+def write(content: bytes):
+    return lambda f: f.write(content)
+
+
+def test_latest_orders_by_timesteps(tmp_path):
+    checkpoints = CheckpointManager(str(tmp_path), "ppo", keep=0)
+    for num_timesteps in (100, 9, 20):
+        checkpoints.save(num_timesteps, write(b"model"))
+    # Files of other trainings or extensions are not checkpoints
+    (tmp_path / "a2c_1000_steps.zip").write_bytes(b"")
+    (tmp_path / "ppo_1000_steps.vecnormalize.pkl").write_bytes(b"")
+
+    assert [path.name for path in checkpoints.list()] == [
+        "ppo_9_steps.zip", "ppo_20_steps.zip", "ppo_100_steps.zip"
+    ]
+    assert checkpoints.latest() == tmp_path / "ppo_100_steps.zip"
+
+
+def test_latest_without_checkpoints(tmp_path):
+    assert CheckpointManager(str(tmp_path / "missing"), "ppo").latest() is None
+
+
+def test_prune_removes_related_files(tmp_path):
+    checkpoints = CheckpointManager(str(tmp_path), "ppo", keep=2)
+    for num_timesteps in (9, 10, 100):
+        save_atomic(checkpoints.get_path(num_timesteps, "vecnormalize.pkl"), write(b"stats"))
+        checkpoints.save(num_timesteps, write(b"model"))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "ppo_100_steps.vecnormalize.pkl", "ppo_100_steps.zip",
+        "ppo_10_steps.vecnormalize.pkl", "ppo_10_steps.zip",
+    ]
+
+
+def test_save_atomic_replaces_file(tmp_path):
+    path = tmp_path / "checkpoint.zip"
+    path.write_bytes(b"old")
+    save_atomic(path, write(b"new"))
+
+    assert path.read_bytes() == b"new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_save_atomic_keeps_file_on_failure(tmp_path):
+    path = tmp_path / "checkpoint.zip"
+    path.write_bytes(b"old")
+
+    def fail(f):
+        f.write(b"partial")
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        save_atomic(path, fail)
+    assert path.read_bytes() == b"old"
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from lotr2_rl.evaluator import GymPolicyEvaluator
+from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+
+
+class EndTurnPolicy:
+    """ Policy clicking the end turn button of the scripted mock game at every step. """
+    def __init__(self):
+        env = LordsOfTheRealm2Gym(backend="mock")
+        self.action = env._to_action((537, 388))
+
+    def predict(self, observations, deterministic=True):
+        return np.full(len(observations), self.action), None
+
+
+@pytest.mark.parametrize("pipeline_info", [False, True])
+@pytest.mark.parametrize("max_steps, length", [(3, 3), (10, 5)])
+def test_return_matches_gold_gain(tmp_path, monkeypatch, pipeline_info, max_steps, length):
+    monkeypatch.chdir(tmp_path)
+    evaluator = GymPolicyEvaluator(
+        n_envs=1,
+        env_kwargs={"backend": "mock", "pipeline_info": pipeline_info, "nb_step_reset": 5},
+        max_steps=max_steps,
+    )
+    episode = evaluator.evaluate(EndTurnPolicy(), n_episodes=1)["per_episode"][0]
+
+    assert episode["length"] == length
+    assert episode["return"] == episode["gold_gain"] == 150 * length
@@ -0,0 +1,55 @@
+import pytest
+
+from lotr2_rl.gyms.lotr2_gym import LordsOfTheRealm2Gym
+
+# Page coordinates of the end turn button of the scripted mock game
+END_TURN_BUTTON = (537, 388)
+
+
+@pytest.fixture
+def make_env(tmp_path, monkeypatch):
+    # The env writes its logs in the working directory
+    monkeypatch.chdir(tmp_path)
+    envs = []
+
+    def make(**kwargs):
+        env = LordsOfTheRealm2Gym(backend="mock", **kwargs)
+        envs.append(env)
+        return env
+
+    yield make
+    for env in envs:
+        env.close()
+
+
+@pytest.mark.parametrize("pipeline_info", [False, True])
+def test_rewards_sum_to_gold_delta(make_env, pipeline_info):
+    env = make_env(pipeline_info=pipeline_info, nb_step_reset=5)
+    end_turn = env._to_action(END_TURN_BUTTON)
+    _, info = env.reset(seed=0)
+    start_gold = info["gold"]
+
+    total_reward = 0
+    for _ in range(5):
+        _, reward, terminated, truncated, info = env.step(end_turn)
+        total_reward += reward
+    assert truncated and not terminated
+
+    assert info["gold"] > start_gold
+    assert total_reward == info["gold"] - start_gold
+
+
+def test_pending_reward_of_cut_episode(make_env):
+    env = make_env(pipeline_info=True, nb_step_reset=5)
+    end_turn = env._to_action(END_TURN_BUTTON)
+    _, info = env.reset(seed=0)
+    start_gold = info["gold"]
+
+    total_reward = 0
+    for _ in range(3):
+        _, reward, _, _, _ = env.step(end_turn)
+        total_reward += reward
+    total_reward += env.pop_pending_reward()
+
+    assert env.pop_pending_reward() == 0
+    assert total_reward == env.last_gold - start_gold > 0
@@ -0,0 +1,55 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+from lotr2_rl.llm.policy_client import PolicyClient
+
+
+class StubPredictor:
+    """ Predictor recording the observations it gets and always choosing the same action. """
+    def __init__(self, action: int):
+        self.action = action
+        self.observations = []
+
+    def predict(self, observation):
+        self.observations.append(observation)
+        return np.array(self.action)
+
+
+def make_page(value: int) -> np.ndarray:
+    # Page size of the screenshots taken on Linux, the gym crops its observation from it
+    return np.full((475, 700, 3), value, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("screenshot", [
+    cv2.imencode(".png", make_page(7))[1].tobytes(),
+    [cv2.imencode(".png", make_page(7))[1].tobytes()],
+    np.stack([make_page(1), make_page(7)]),
+], ids=["bytes", "list", "burst"])
+def test_screenshot_to_move_and_click(screenshot):
+    # Action 0 does nothing, action 1 clicks the first cell of the grid
+    predictor = StubPredictor(action=1)
+    client = PolicyClient(predictor)
+
+    move = asyncio.run(client.generate_react_response(screenshot))
+    click = asyncio.run(client.generate_react_response(None))
+
+    x, y = client.env._decode_action(1)
+    assert move == {"action": "move", "action_input": f"{x},{y}"}
+    assert click == {"action": "click", "action_input": ""}
+    observation, = predictor.observations
+    assert observation.shape == client.env.observation_space.shape
+    # The last frame of a burst is the one observed
+    assert (observation == 7).all()
+
+
+@pytest.mark.parametrize("screenshot", [None, [], np.empty((0, 475, 700, 3), dtype=np.uint8)],
+                         ids=["none", "empty_list", "empty_burst"])
+def test_no_screenshot(screenshot):
+    predictor = StubPredictor(action=0)
+    response = asyncio.run(PolicyClient(predictor).generate_react_response(screenshot))
+
+    assert response == {"action": "nope", "action_input": ""}
+    assert predictor.observations == []